@@ -0,0 +1,360 @@
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from promo_config import Config, PROMO_METAFIELD_KEYS, require_env, normalize, shop_path, shop_targets
+from shopify_client import ShopifyClient
+from catalog_snapshot import fetch_snapshot_products, save_snapshot
+from product_ids import ProductIdSet
+
+
+"""
+catalog_mirror.py
+
+Local SQLite mirror of the Shopify catalog.
+
+Tables:
+- products(id, gid, vendor, vendor_norm, updated_at)
+- product_collections(collection_id, product_id)
+- product_metafields(product_id, key, value)     -- custom.promo_* only
+- collections(id, gid, title, title_norm, handle, updated_at)
+- sync_state(name, value)                        -- refresh watermarks
+
+Refresh:
+- first run (or --full): page every product, then drop products that no longer exist
+- later runs: only products(query: "updated_at:>='<last watermark>'"); updatedAt has
+  one-second resolution, so the products at the watermark itself are re-read (the
+  upsert is idempotent) rather than missing one updated later in that same second
+- collections are always re-listed (a few pages of 250)
+
+Deleted products, and collection membership changes that do not bump the
+product's updatedAt (e.g. manual collection edits), are only noticed by a full refresh
+or by webhook_receiver.py, which applies product/collection webhooks as they arrive.
+
+Usage:
+python catalog_mirror.py          # incremental refresh
+python catalog_mirror.py --full   # full reload
+
+Readers (sync scope resolution, vendor/collection reports) use CatalogMirror when
+CATALOG_MIRROR is set, instead of paging the API.
+"""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    gid TEXT NOT NULL,
+    vendor TEXT NOT NULL DEFAULT '',
+    vendor_norm TEXT NOT NULL DEFAULT '',
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_products_vendor_norm ON products(vendor_norm);
+
+CREATE TABLE IF NOT EXISTS product_collections (
+    collection_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    PRIMARY KEY (collection_id, product_id)
+);
+CREATE INDEX IF NOT EXISTS ix_product_collections_product ON product_collections(product_id);
+
+CREATE TABLE IF NOT EXISTS product_metafields (
+    product_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (product_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS collections (
+    id INTEGER PRIMARY KEY,
+    gid TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    title_norm TEXT NOT NULL DEFAULT '',
+    handle TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_collections_title_norm ON collections(title_norm);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def gid_to_int(gid: str) -> int:
+    return int(str(gid).rsplit("/", 1)[-1])
+
+
+def collection_gid(collection_id: int) -> str:
+    return f"gid://shopify/Collection/{collection_id}"
+
+
+class CatalogMirror:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # -------------------------
+    # State
+    # -------------------------
+    def _get_state(self, name: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name: str, value: str) -> None:
+        self.conn.execute(
+            "INSERT INTO sync_state(name, value) VALUES(?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, value),
+        )
+
+    @property
+    def refreshed_at(self) -> Optional[datetime]:
+        v = self._get_state("refreshed_at")
+        return datetime.fromisoformat(v) if v else None
+
+    # same interface as CatalogSnapshot for the offline dry run
+    @property
+    def saved_at(self) -> datetime:
+        return self.refreshed_at or datetime.fromtimestamp(0, timezone.utc)
+
+    def age_hours(self, now: Optional[datetime] = None) -> float:
+        now = now or datetime.now(timezone.utc)
+        return (now - self.saved_at).total_seconds() / 3600.0
+
+    def product_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    # -------------------------
+    # Writes
+    # -------------------------
+    def upsert_products(self, products: Iterable[dict]) -> int:
+        """products: dicts shaped like catalog_snapshot products."""
+        n = 0
+        with self.conn:
+            for p in products:
+                pid = gid_to_int(p["id"])
+                vendor = (p.get("vendor") or "").strip()
+                self.conn.execute(
+                    "INSERT INTO products(id, gid, vendor, vendor_norm, updated_at) VALUES(?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET vendor = excluded.vendor, vendor_norm = excluded.vendor_norm, "
+                    "updated_at = excluded.updated_at",
+                    (pid, p["id"], vendor, normalize(vendor), p.get("updated_at")),
+                )
+                if "collections" in p:
+                    self.conn.execute("DELETE FROM product_collections WHERE product_id = ?", (pid,))
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO product_collections(collection_id, product_id) VALUES(?, ?)",
+                        [(gid_to_int(cid), pid) for cid in p["collections"]],
+                    )
+                if "metafields" in p:
+                    self.conn.execute("DELETE FROM product_metafields WHERE product_id = ?", (pid,))
+                    self.conn.executemany(
+                        "INSERT INTO product_metafields(product_id, key, value) VALUES(?, ?, ?)",
+                        [(pid, k, v) for k, v in p["metafields"].items()],
+                    )
+                n += 1
+        return n
+
+    def delete_products(self, product_ids: Iterable[int]) -> None:
+        with self.conn:
+            for pid in product_ids:
+                self.conn.execute("DELETE FROM products WHERE id = ?", (pid,))
+                self.conn.execute("DELETE FROM product_collections WHERE product_id = ?", (pid,))
+                self.conn.execute("DELETE FROM product_metafields WHERE product_id = ?", (pid,))
+
+    def product_updated_at(self, product_id: str) -> Optional[str]:
+        row = self.conn.execute("SELECT updated_at FROM products WHERE id = ?", (gid_to_int(product_id),)).fetchone()
+        return row[0] if row else None
+
+    def replace_collection_members(self, collection_id: str, product_ids: Iterable[str]) -> None:
+        cid = gid_to_int(ShopifyClient.to_collection_gid(collection_id))
+        with self.conn:
+            self.conn.execute("DELETE FROM product_collections WHERE collection_id = ?", (cid,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO product_collections(collection_id, product_id) VALUES(?, ?)",
+                [(cid, gid_to_int(pid)) for pid in product_ids],
+            )
+
+    def delete_collection(self, collection_id: str) -> None:
+        cid = gid_to_int(ShopifyClient.to_collection_gid(collection_id))
+        with self.conn:
+            self.conn.execute("DELETE FROM collections WHERE id = ?", (cid,))
+            self.conn.execute("DELETE FROM product_collections WHERE collection_id = ?", (cid,))
+
+    def mark_webhook_applied(self, topic: str, at: str) -> None:
+        with self.conn:
+            self._set_state("webhook_at", at)
+            self._set_state("webhook_last_topic", topic)
+
+    def replace_collections(self, rows: List[dict]) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM collections")
+            self.upsert_collections(rows)
+            # membership of collections that no longer exist
+            self.conn.execute("DELETE FROM product_collections WHERE collection_id NOT IN (SELECT id FROM collections)")
+
+    def upsert_collections(self, rows: List[dict]) -> None:
+        self.conn.executemany(
+            "INSERT INTO collections(id, gid, title, title_norm, handle, updated_at) VALUES(?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET title = excluded.title, title_norm = excluded.title_norm, "
+            "handle = excluded.handle, updated_at = excluded.updated_at",
+            [
+                (gid_to_int(r["id"]), r["id"], r.get("title", ""), normalize(r.get("title", "")),
+                 r.get("handle", ""), r.get("updatedAt", ""))
+                for r in rows
+            ],
+        )
+
+    # -------------------------
+    # Refresh from Shopify
+    # -------------------------
+    def refresh(self, client: ShopifyClient, full: bool = False) -> Dict[str, int]:
+        watermark = None if full else self._get_state("products_updated_at")
+        search = f"updated_at:>='{watermark}'" if watermark else None
+
+        print(f"Catalog mirror refresh ({'delta since ' + watermark if watermark else 'full'}) -> {self.path}")
+        products = fetch_snapshot_products(client, Config.MF_NAMESPACE, set(PROMO_METAFIELD_KEYS), search=search)
+        self.upsert_products(products)
+
+        removed = 0
+        if not watermark:
+            seen = {gid_to_int(p["id"]) for p in products}
+            stale = [r[0] for r in self.conn.execute("SELECT id FROM products") if r[0] not in seen]
+            self.delete_products(stale)
+            removed = len(stale)
+
+        new_watermark = max([p.get("updated_at") or "" for p in products] + [watermark or ""])
+        collections = list_all_collections(client)
+        with self.conn:
+            self.replace_collections(collections)
+            if new_watermark:
+                self._set_state("products_updated_at", new_watermark)
+            self._set_state("refreshed_at", datetime.now(timezone.utc).isoformat(timespec="seconds"))
+
+        stats = {"products_fetched": len(products), "products_removed": removed, "collections": len(collections)}
+        print(f"  products fetched={stats['products_fetched']} removed={removed} collections={stats['collections']}")
+        return stats
+
+    # -------------------------
+    # Reads (indexed)
+    # -------------------------
+    def product_ids_by_vendor(self, vendor: str) -> ProductIdSet:
+        rows = self.conn.execute("SELECT id FROM products WHERE vendor_norm = ? ORDER BY id", (normalize(vendor),))
+        return ProductIdSet.from_sorted(r[0] for r in rows)
+
+    def product_ids_in_collection(self, collection_id: str) -> ProductIdSet:
+        cid = gid_to_int(ShopifyClient.to_collection_gid(collection_id))
+        rows = self.conn.execute(
+            "SELECT product_id FROM product_collections WHERE collection_id = ? ORDER BY product_id", (cid,)
+        )
+        return ProductIdSet.from_sorted(r[0] for r in rows)
+
+    def count_by_vendor(self, vendor: str) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM products WHERE vendor_norm = ?", (normalize(vendor),)
+        ).fetchone()[0]
+
+    def count_in_collection(self, collection_id: str) -> int:
+        cid = gid_to_int(ShopifyClient.to_collection_gid(collection_id))
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM product_collections WHERE collection_id = ?", (cid,)
+        ).fetchone()[0]
+
+    def vendor_counts(self) -> Dict[str, int]:
+        """display vendor name -> product count (grouped case/space-insensitively)"""
+        rows = self.conn.execute(
+            "SELECT MIN(vendor), COUNT(*) FROM products WHERE vendor_norm <> '' GROUP BY vendor_norm"
+        )
+        return {r[0]: r[1] for r in rows}
+
+    def vendors_in_collection(self, collection_id: str) -> List[str]:
+        cid = gid_to_int(ShopifyClient.to_collection_gid(collection_id))
+        rows = self.conn.execute(
+            "SELECT DISTINCT p.vendor FROM product_collections pc JOIN products p ON p.id = pc.product_id "
+            "WHERE pc.collection_id = ? AND p.vendor <> ''",
+            (cid,),
+        )
+        return sorted(r[0] for r in rows)
+
+    def find_collection_by_title_exact(self, title: str) -> Optional[Tuple[str, str]]:
+        row = self.conn.execute(
+            "SELECT gid, title FROM collections WHERE title_norm = ? ORDER BY id LIMIT 1", (normalize(title),)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def list_collections(self) -> List[dict]:
+        rows = self.conn.execute("SELECT gid, title, handle, updated_at FROM collections ORDER BY id")
+        return [{"id": r[0], "title": r[1], "handle": r[2], "updatedAt": r[3]} for r in rows]
+
+    def metafields(self, product_id) -> Dict[str, str]:
+        """product_id: gid or numeric id"""
+        rows = self.conn.execute(
+            "SELECT key, value FROM product_metafields WHERE product_id = ?", (gid_to_int(product_id),)
+        )
+        return {r[0]: r[1] for r in rows}
+
+    def product_ids_with_metafields(self) -> ProductIdSet:
+        """Products that carry any custom.promo_* metafield (as of the last refresh)."""
+        rows = self.conn.execute("SELECT DISTINCT product_id FROM product_metafields ORDER BY product_id")
+        return ProductIdSet.from_sorted(r[0] for r in rows)
+
+    def export_snapshot(self, path: str, shop: str = "") -> int:
+        """Write the mirror out as a catalog_snapshot file (for DRY_RUN_OFFLINE)."""
+        members: Dict[int, List[str]] = {}
+        for cid, pid in self.conn.execute("SELECT collection_id, product_id FROM product_collections"):
+            members.setdefault(pid, []).append(collection_gid(cid))
+        mfs: Dict[int, Dict[str, str]] = {}
+        for pid, k, v in self.conn.execute("SELECT product_id, key, value FROM product_metafields"):
+            mfs.setdefault(pid, {})[k] = v
+
+        products = [
+            {"id": gid, "vendor": vendor, "updated_at": updated_at,
+             "collections": members.get(pid, []), "metafields": mfs.get(pid, {})}
+            for pid, gid, vendor, updated_at in self.conn.execute("SELECT id, gid, vendor, updated_at FROM products")
+        ]
+        save_snapshot(path, products, shop or Config.SHOPIFY_SHOP, Config.MF_NAMESPACE, saved_at=self.refreshed_at)
+        return len(products)
+
+
+def list_all_collections(client: ShopifyClient) -> List[dict]:
+    q = """
+    query($cursor: String) {
+      collections(first: 250, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { id title handle updatedAt }
+      }
+    }
+    """
+    return list(client.paginate(q, path=("collections",)))
+
+
+def open_catalog_mirror() -> Optional[CatalogMirror]:
+    """CatalogMirror for Config.CATALOG_MIRROR (of the default shop), or None when the mirror is not configured."""
+    if not Config.CATALOG_MIRROR:
+        return None
+    return CatalogMirror(shop_path(Config.CATALOG_MIRROR, shop_targets()[0]))
+
+
+def main():
+    require_env()
+    full = "--full" in sys.argv
+    # one mirror per shop with SHOPIFY_SHOPS (catalog_mirror_<name>.sqlite)
+    for target in shop_targets():
+        mirror = CatalogMirror(shop_path(Config.CATALOG_MIRROR or "catalog_mirror.sqlite", target))
+        try:
+            mirror.refresh(ShopifyClient(target), full=full)
+            if "--export-snapshot" in sys.argv:
+                path = shop_path(Config.CATALOG_SNAPSHOT, target)
+                n = mirror.export_snapshot(path, target.shop)
+                print(f"Wrote {path} ({n} products)")
+        finally:
+            mirror.close()
+
+
+if __name__ == "__main__":
+    main()
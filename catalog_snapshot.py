@@ -0,0 +1,228 @@
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from promo_config import Config, PROMO_METAFIELD_KEYS, require_env, normalize, shop_path, shop_targets
+from shopify_client import ShopifyClient
+from product_ids import ProductIdSet, product_id as numeric_product_id
+
+
+"""
+catalog_snapshot.py
+
+Local snapshot of the Shopify catalog, used for a fully offline dry run.
+
+Per product it keeps only what the promo sync needs:
+- product id (gid), vendor, updated_at
+- collection ids (gids)
+- current custom.promo_* metafield values
+
+File format: gzip JSON
+{
+  "version": 1,
+  "saved_at": "2026-01-31T06:00:00+00:00",
+  "shop": "xxx.myshopify.com",
+  "namespace": "custom",
+  "products": [
+    {"id": "gid://shopify/Product/1", "vendor": "Acme", "updated_at": "2026-01-30T10:00:00Z",
+     "collections": ["gid://shopify/Collection/9"],
+     "metafields": {"promo_sale_start_date": "2026-02-01"}}
+  ]
+}
+
+Create / refresh it with:
+python catalog_snapshot.py [path]
+"""
+
+
+SNAPSHOT_VERSION = 1
+
+# Nested connections multiply query cost: 20 products * (30 collections + 10 metafields) stays under 1000.
+PRODUCTS_PAGE_SIZE = 20
+COLLECTIONS_PER_PRODUCT = 30
+METAFIELDS_PER_PRODUCT = 10
+
+
+class CatalogSnapshot:
+    def __init__(self, products: List[dict], saved_at: datetime, shop: str = "", namespace: str = "custom"):
+        self.products = products
+        self.saved_at = saved_at
+        self.shop = shop
+        self.namespace = namespace
+
+        self._by_id: Dict[int, dict] = {}
+        by_vendor: Dict[str, List[int]] = {}
+        by_collection: Dict[str, List[int]] = {}
+        for p in products:
+            pid = numeric_product_id(p["id"])
+            self._by_id[pid] = p
+            by_vendor.setdefault(normalize(p.get("vendor", "")), []).append(pid)
+            for cid in p.get("collections", []):
+                by_collection.setdefault(cid, []).append(pid)
+        self._by_vendor = {k: ProductIdSet(v) for k, v in by_vendor.items()}
+        self._by_collection = {k: ProductIdSet(v) for k, v in by_collection.items()}
+
+    def product_count(self) -> int:
+        return len(self.products)
+
+    def age_hours(self, now: Optional[datetime] = None) -> float:
+        now = now or datetime.now(timezone.utc)
+        return (now - self.saved_at).total_seconds() / 3600.0
+
+    def product_ids_by_vendor(self, vendor: str) -> ProductIdSet:
+        return self._by_vendor.get(normalize(vendor)) or ProductIdSet()
+
+    def product_ids_in_collection(self, collection_id: str) -> ProductIdSet:
+        return self._by_collection.get(ShopifyClient.to_collection_gid(collection_id)) or ProductIdSet()
+
+    def metafields(self, product_id) -> Dict[str, str]:
+        """product_id: gid or numeric id"""
+        p = self._by_id.get(numeric_product_id(product_id))
+        return dict(p.get("metafields", {})) if p else {}
+
+    def product_ids_with_metafields(self) -> ProductIdSet:
+        """Products that carry any custom.promo_* metafield in the snapshot."""
+        return ProductIdSet(p["id"] for p in self.products if p.get("metafields"))
+
+
+def load_snapshot(path: str) -> CatalogSnapshot:
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        data = json.load(fh)
+    if data.get("version") != SNAPSHOT_VERSION:
+        raise RuntimeError(f"Unsupported catalog snapshot version {data.get('version')} in {path}")
+    saved_at = datetime.fromisoformat(data["saved_at"])
+    if saved_at.tzinfo is None:
+        saved_at = saved_at.replace(tzinfo=timezone.utc)
+    return CatalogSnapshot(data.get("products", []), saved_at, data.get("shop", ""), data.get("namespace", "custom"))
+
+
+def save_snapshot(path: str, products: List[dict], shop: str = "", namespace: str = "custom",
+                  saved_at: Optional[datetime] = None) -> None:
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": (saved_at or datetime.now(timezone.utc)).isoformat(timespec="seconds"),
+        "shop": shop,
+        "namespace": namespace,
+        "products": products,
+    }
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False)
+    # replace in one step so a crash never leaves a half-written snapshot behind
+    os.replace(tmp, path)
+
+
+def fetch_snapshot_products(client: ShopifyClient, namespace: str, keys: Set[str],
+                            search: Optional[str] = None) -> List[dict]:
+    """
+    Page products with vendor, updatedAt, collection ids and promo metafields.
+    search: optional Shopify product search string (e.g. "updated_at:>='2026-01-31T06:00:00Z'").
+    """
+    q = """
+    query($cursor: String, $namespace: String!, $q: String) {
+      products(first: %d, after: $cursor, query: $q) {
+        pageInfo { hasNextPage endCursor }
+        nodes {
+          id
+          vendor
+          updatedAt
+          collections(first: %d) { pageInfo { hasNextPage endCursor } nodes { id } }
+          metafields(first: %d, namespace: $namespace) { nodes { key value } }
+        }
+      }
+    }
+    """ % (PRODUCTS_PAGE_SIZE, COLLECTIONS_PER_PRODUCT, METAFIELDS_PER_PRODUCT)
+
+    products: List[dict] = []
+
+    for conn in client.pages(q, {"namespace": namespace, "q": search}):
+        for n in conn["nodes"]:
+            cols = n.get("collections") or {}
+            collection_ids = [c["id"] for c in cols.get("nodes", [])]
+            if (cols.get("pageInfo") or {}).get("hasNextPage"):
+                collection_ids.extend(fetch_more_product_collections(client, n["id"], cols["pageInfo"]["endCursor"]))
+            products.append({
+                "id": n["id"],
+                "vendor": (n.get("vendor") or "").strip(),
+                "updated_at": n.get("updatedAt", ""),
+                "collections": collection_ids,
+                "metafields": {
+                    m["key"]: m.get("value")
+                    for m in (n.get("metafields") or {}).get("nodes", [])
+                    if m.get("key") in keys
+                },
+            })
+
+        if len(products) % 1000 == 0:
+            print(f"  Snapshot: {len(products)} products...")
+
+    return products
+
+
+def fetch_snapshot_product(client: ShopifyClient, product_id: str, namespace: str, keys: Set[str]) -> Optional[dict]:
+    """One product in the fetch_snapshot_products shape, or None if it no longer exists."""
+    q = """
+    query($id: ID!, $namespace: String!) {
+      product(id: $id) {
+        id
+        vendor
+        updatedAt
+        collections(first: %d) { pageInfo { hasNextPage endCursor } nodes { id } }
+        metafields(first: %d, namespace: $namespace) { nodes { key value } }
+      }
+    }
+    """ % (COLLECTIONS_PER_PRODUCT, METAFIELDS_PER_PRODUCT)
+    n = client.graphql(q, {"id": product_id, "namespace": namespace})["data"].get("product")
+    if not n:
+        return None
+    cols = n.get("collections") or {}
+    collection_ids = [c["id"] for c in cols.get("nodes", [])]
+    if (cols.get("pageInfo") or {}).get("hasNextPage"):
+        collection_ids.extend(fetch_more_product_collections(client, n["id"], cols["pageInfo"]["endCursor"]))
+    return {
+        "id": n["id"],
+        "vendor": (n.get("vendor") or "").strip(),
+        "updated_at": n.get("updatedAt", ""),
+        "collections": collection_ids,
+        "metafields": {
+            m["key"]: m.get("value")
+            for m in (n.get("metafields") or {}).get("nodes", [])
+            if m.get("key") in keys
+        },
+    }
+
+
+def fetch_more_product_collections(client: ShopifyClient, product_id: str, cursor: str) -> List[str]:
+    # Rare: product belongs to more collections than fit in the nested page
+    q = """
+    query($id: ID!, $cursor: String) {
+      product(id: $id) {
+        collections(first: 250, after: $cursor) {
+          pageInfo { hasNextPage endCursor }
+          nodes { id }
+        }
+      }
+    }
+    """
+    return [c["id"] for c in client.paginate(q, {"id": product_id}, ("product", "collections"), cursor)]
+
+
+def main():
+    require_env()
+    base_path = sys.argv[1] if len(sys.argv) > 1 else Config.CATALOG_SNAPSHOT
+    # one snapshot per shop with SHOPIFY_SHOPS (catalog_snapshot_<name>.json.gz)
+    for target in shop_targets():
+        path = shop_path(base_path, target)
+        shop = ShopifyClient(target)
+
+        print(f"Saving catalog snapshot of {target.shop} -> {path}")
+        products = fetch_snapshot_products(shop, Config.MF_NAMESPACE, set(PROMO_METAFIELD_KEYS))
+        save_snapshot(path, products, target.shop, Config.MF_NAMESPACE)
+        print(f"Wrote {path} ({len(products)} products)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "tools"))
+
+from promo_config import Config
+from run_metrics import METRICS
+from run_profiler import profiling
+from time_budget import run_budget
+
+
+"""
+cli.py
+
+One entry point for the sync and the reports. Several commands can run in one process:
+
+python cli.py sync
+python cli.py dry-run vendor-report views excel
+python cli.py sync vendor-report vendor-hub-report collections-export views excel
+python cli.py --shard 2/4 sync         (one of four workers, see sync_shards.py)
+python cli.py --time-budget 2h sync collections-export   (one deadline for all commands, see time_budget.py)
+
+Commands in one invocation share a single ShopifyClient, so they share:
+- one pooled HTTP session (keep-alive connections)
+- the GraphQL cost budget (throttle state)
+- the client's in-run cache: collection-by-title lookups, product id lists, REST counts
+  and the full vendor scan are fetched once, whichever command asks first
+- the response cache (response_cache.py): the reports' read-only lookups are also reused
+  by later runs until RESPONSE_CACHE_TTL_SECONDS; --bypass-cache asks Shopify again
+
+Each command still writes its own outputs and metrics/<run>_*.json, exactly like the
+standalone scripts (which keep working).
+
+Commands:
+  sync                       promo metafields, DRY_RUN=0 (writes to Shopify)
+  dry-run                    promo metafields, DRY_RUN=1
+  stale-sweep                stale_sweep.py: delete leftover promo dates (DRY_RUN as set)
+  vendor-report              all_vendors_to_shopify_counts.py   (SM_Vendor -> counts)
+  vendor-hub-report          Vendor_Hub_to_Shopify_counts.py    (VH_Vendors -> counts)
+  shopify-vendor-report      shopify_vendor_counts.py           (vendors of all products)
+  vendor-collections-report  get_all_vendors_with_collections.py
+  collections-export         export_shopify_collections.py
+  views                      tools/generate_views.py
+  excel                      tools/export_view_to_excel.py
+"""
+
+
+def _run_sync(shop, dry_run: bool) -> None:
+    import retail_promotions_to_shopify_metafields as sync
+    configured = Config.DRY_RUN
+    Config.DRY_RUN = dry_run
+    try:
+        # main() profiles itself (PROFILE=...) and writes its own metrics
+        sync.main(shop=shop)
+    finally:
+        # later commands (stale-sweep) see DRY_RUN as configured, not this command's mode
+        Config.DRY_RUN = configured
+
+
+def _run_sweep(shop) -> None:
+    import stale_sweep
+    # DRY_RUN as configured (default 1): the sweep only deletes when asked to
+    stale_sweep.main(shop=shop)
+
+
+def _run_report(module_name: str, run_name: str) -> Callable:
+    def run(shop) -> None:
+        module = __import__(module_name)
+        with profiling(run_name):
+            module.main(shop)
+    return run
+
+
+def _run_tool(module_name: str) -> Callable:
+    def run(shop) -> None:
+        module = __import__(module_name)
+        code = module.main()
+        if code:
+            raise RuntimeError(f"{module_name} exited with code {code}")
+    return run
+
+
+# name -> (runner, needs Shopify)
+COMMANDS: Dict[str, Tuple[Callable, bool]] = {
+    "sync": (lambda shop: _run_sync(shop, dry_run=False), True),
+    "dry-run": (lambda shop: _run_sync(shop, dry_run=True), True),
+    "stale-sweep": (_run_sweep, True),
+    "vendor-report": (_run_report("all_vendors_to_shopify_counts", "all_vendors_report"), True),
+    "vendor-hub-report": (_run_report("Vendor_Hub_to_Shopify_counts", "vendor_hub_report"), True),
+    "shopify-vendor-report": (_run_report("shopify_vendor_counts", "vendor_report"), True),
+    "vendor-collections-report": (_run_report("get_all_vendors_with_collections", "vendor_collections_report"), True),
+    "collections-export": (_run_report("export_shopify_collections", "collections_export"), True),
+    "views": (_run_tool("generate_views"), False),
+    "excel": (_run_tool("export_view_to_excel"), False),
+}
+
+
+def run_commands(commands: List[str], keep_going: bool = False) -> int:
+    shop = None
+    failed: List[str] = []
+    timings: List[Tuple[str, float, str]] = []
+
+    for name in commands:
+        runner, needs_shop = COMMANDS[name]
+        if needs_shop and shop is None and not (name == "dry-run" and Config.DRY_RUN_OFFLINE):
+            from shopify_client import ShopifyClient
+            shop = ShopifyClient()
+
+        print("")
+        print(f"##### {name} #####")
+        # each command reports its own metrics
+        METRICS.reset()
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            runner(shop)
+        except Exception as e:
+            status = f"failed: {e}"
+            failed.append(name)
+            print(f"{name} failed: {e}")
+        timings.append((name, time.perf_counter() - t0, status))
+        if failed and not keep_going:
+            break
+
+    print("")
+    print("=== cli summary ===")
+    for name, seconds, status in timings:
+        print(f"  {name:<26} {seconds:>9.1f}s  {status}")
+    skipped = commands[len(timings):]
+    if skipped:
+        print(f"  skipped after failure: {', '.join(skipped)}")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Retail promotions -> Shopify: sync and reports",
+        epilog="Commands: " + ", ".join(COMMANDS),
+    )
+    ap.add_argument("commands", nargs="+", choices=list(COMMANDS), metavar="command",
+                    help="one or more commands, run in the given order in one process")
+    ap.add_argument("--keep-going", action="store_true", help="run the remaining commands after a failure")
+    ap.add_argument("--shard", default=Config.SYNC_SHARD, metavar="i/N",
+                    help="sync/dry-run: process shard i of N (same as SYNC_SHARD)")
+    ap.add_argument("--time-budget", default=Config.TIME_BUDGET, metavar="DURATION",
+                    help="e.g. 2h (same as TIME_BUDGET): one deadline for all commands; the sync and the "
+                         "collections export stop new work before it and record what is left")
+    ap.add_argument("--bypass-cache", action="store_true",
+                    help="ask Shopify instead of the response cache (same as RESPONSE_CACHE_BYPASS=1); "
+                         "fresh responses are still stored")
+    args = ap.parse_args(argv)
+    Config.SYNC_SHARD = args.shard
+    Config.RESPONSE_CACHE_BYPASS = Config.RESPONSE_CACHE_BYPASS or args.bypass_cache
+    Config.TIME_BUDGET = args.time_budget
+    run_budget()  # starts the clock now, so later commands get what the earlier ones left
+    return run_commands(args.commands, args.keep_going)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
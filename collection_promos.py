@@ -0,0 +1,258 @@
+import json
+import re
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from promo_config import Config, PROMO_METAFIELD_KEYS, ShopTarget, shop_path
+from retail_promotions_to_shopify_metafields import (
+    VendorPlan, build_date_metafield, compute_scope_actions, to_date_only,
+)
+from run_metrics import METRICS
+from shopify_client import ShopifyClient
+
+
+"""
+collection_promos.py
+
+PROMO_TARGET=collection: the four promo dates are written once per scope instead of on
+every product of it, so a promo change costs O(scopes) writes instead of O(products).
+
+- CollectionID scopes: metafields on the collection itself
+  (custom.promo_sale_start_date ... on gid://shopify/Collection/<id>)
+- vendor fallback scopes: one shop metafield custom.promo_vendors (json), keyed by the
+  vendor's handle: {"acme-tools": {"promo_sale_start_date": "2026-10-20", ...}}
+
+The theme (Custom liquid.liquid) resolves a product's dates: its own metafields first
+(product mode), then the first of its collections that has promo dates, then the vendor
+record. test_custom_liquid.py renders the banner against sample data.
+
+- overlapping scopes on one owner end like product mode: key by key, the later scope in
+  plan order wins
+- the current values are read first (one batched request for all collections, one for the
+  vendor record); only what differs is written or deleted
+- the vendor record is merged, not replaced (sync_daemon.py passes only changed scopes);
+  entries whose banners are all over are dropped
+- no products are read, so SYNC_SHARD does not apply and TIME_BUDGET is not needed
+"""
+
+
+# metafieldsSet takes at most 25 metafields per call
+METAFIELDS_SET_LIMIT = 25
+
+OwnerDates = Dict[str, Optional[date]]   # metafield key -> REAL date, None = must not exist
+
+
+def vendor_handle(vendor: str) -> str:
+    """The theme's `product.vendor | handleize` (Shopify's handleize, for ASCII vendor names)."""
+    return re.sub(r"[^a-z0-9]+", "-", (vendor or "").lower()).strip("-")
+
+
+def owner_dates(vendor_plans: List[VendorPlan], today: date) -> Tuple[Dict[str, OwnerDates], Dict[str, OwnerDates]]:
+    """(collection gid -> dates, vendor handle -> dates), scopes applied in plan order"""
+    collections: Dict[str, OwnerDates] = {}
+    vendors: Dict[str, OwnerDates] = {}
+    for w in vendor_plans:
+        actions = compute_scope_actions(w, today)
+        if w.collection_ids:
+            owners = [collections.setdefault(ShopifyClient.to_collection_gid(c), {}) for c in w.collection_ids]
+        else:
+            owners = [vendors.setdefault(vendor_handle(w.vendor), {})]
+        for state in owners:
+            state.update({k: None for k in actions.to_delete})
+            state.update(actions.to_set)
+    return collections, vendors
+
+
+def vendor_entry_over(entry: dict, today: date) -> bool:
+    """True when none of the entry's banners can show any more (sale end / PI end or start + Z are past)."""
+    ends = []
+    sale_end = to_date_only(entry.get(Config.METAFIELD_SALE_END_DATE))
+    if sale_end is not None:
+        ends.append(sale_end)
+    pi_start = to_date_only(entry.get(Config.METAFIELD_PRICE_INCREASE_START))
+    pi_end = to_date_only(entry.get(Config.METAFIELD_PRICE_INCREASE_END))
+    if pi_end is not None:
+        ends.append(pi_end)
+    elif pi_start is not None:
+        ends.append(pi_start + timedelta(days=Config.Days_After_Price_Increase))
+    return all(end < today for end in ends)
+
+
+def merge_vendor_record(record: dict, vendors: Dict[str, OwnerDates], today: date) -> dict:
+    """The shop's vendor record after this plan: planned vendors updated, finished entries dropped."""
+    merged = {}
+    for handle, entry in record.items():
+        if isinstance(entry, dict) and handle not in vendors and not vendor_entry_over(entry, today):
+            merged[handle] = entry
+    for handle, dates in vendors.items():
+        entry = {k: v for k, v in (record.get(handle) or {}).items() if k in PROMO_METAFIELD_KEYS}
+        for k, d in dates.items():
+            if d is None:
+                entry.pop(k, None)
+            else:
+                entry[k] = d.isoformat()
+        if entry:
+            merged[handle] = entry
+    return dict(sorted(merged.items()))
+
+
+def _collection_changes(dates: OwnerDates, current: Dict[str, dict]) -> Tuple[Dict[str, date], Dict[str, str]]:
+    """(keys to write, key -> metafield id to delete) for one collection"""
+    to_set = {k: d for k, d in dates.items() if d is not None and (current.get(k) or {}).get("value") != d.isoformat()}
+    to_delete = {k: current[k]["id"] for k, d in dates.items() if d is None and k in current}
+    return to_set, to_delete
+
+
+def sync_collection_promos(vendor_plans: List[VendorPlan], today: date, target: ShopTarget,
+                           shop: Optional[ShopifyClient] = None) -> dict:
+    """PROMO_TARGET=collection counterpart of sync_shop(): same plan, one write per owner. Returns the shop's result summary."""
+    t0 = time.perf_counter()
+    offline = Config.DRY_RUN and Config.DRY_RUN_OFFLINE
+    if shop is None and not offline:
+        shop = ShopifyClient(target)
+    ns = Config.MF_NAMESPACE
+
+    collections, vendors = owner_dates(vendor_plans, today)
+    print(f"Promo dates on collections / vendor record: {len(collections)} collections, {len(vendors)} vendors "
+          f"(from {len(vendor_plans)} scopes)")
+    print("")
+
+    current: Dict[str, Optional[Dict[str, dict]]] = {}
+    shop_id, record_mf, record = None, None, {}
+    if shop is not None:
+        with METRICS.span("owner_lookup"):
+            current = shop.collection_metafields(list(collections), ns) if collections else {}
+            shop_id, record_mf = shop.shop_metafield(ns, Config.METAFIELD_VENDOR_PROMOS)
+        try:
+            record = json.loads(record_mf["value"]) if record_mf else {}
+        except ValueError:
+            print(f"  Unreadable {ns}.{Config.METAFIELD_VENDOR_PROMOS}; it is rebuilt from this plan")
+        if not isinstance(record, dict):
+            record = {}
+
+    plan_entries = []
+    writes: List[Tuple[str, Dict[str, date]]] = []
+    deletes: List[Tuple[str, Dict[str, str]]] = []
+    missing = 0
+    for gid, dates in collections.items():
+        entry = {
+            "owner": gid,
+            "set": {k: d.isoformat() for k, d in sorted(dates.items()) if d is not None},
+            "delete": sorted(k for k, d in dates.items() if d is None),
+        }
+        if shop is None:
+            to_set, to_delete = {k: d for k, d in dates.items() if d is not None}, {}
+        elif current.get(gid) is None:
+            print(f"[Collection] {gid}: not found, skipped")
+            missing += 1
+            entry["missing"] = True
+            plan_entries.append(entry)
+            continue
+        else:
+            to_set, to_delete = _collection_changes(dates, current[gid])
+        entry["changes"] = len(to_set) + len(to_delete)
+        plan_entries.append(entry)
+        if to_set or to_delete:
+            print(f"[Collection] {gid}: set {', '.join(sorted(to_set)) or '-'}; delete {', '.join(sorted(to_delete)) or '-'}")
+        if to_set:
+            writes.append((gid, to_set))
+        if to_delete:
+            deletes.append((gid, to_delete))
+
+    new_record = merge_vendor_record(record, vendors, today)
+    record_changed = new_record != record
+    for handle, dates in vendors.items():
+        plan_entries.append({
+            "owner": f"vendor:{handle}",
+            "set": {k: d.isoformat() for k, d in sorted(dates.items()) if d is not None},
+            "delete": sorted(k for k, d in dates.items() if d is None),
+        })
+    dropped = sorted(set(record) - set(new_record) - set(vendors))
+    if record_changed:
+        print(f"[Vendor record] {ns}.{Config.METAFIELD_VENDOR_PROMOS}: {len(new_record)} vendors"
+              + (f" ({len(dropped)} finished entries dropped)" if dropped else ""))
+    METRICS.incr("scopes", len(vendor_plans))
+
+    print("=== Done ===")
+    result = {"shop": target.name or target.shop, "scopes": len(vendor_plans), "promo_target": "collection"}
+    if target.name:
+        result["name"] = target.name
+    if Config.DRY_RUN:
+        print("Dry run mode. No changes written.")
+        print(f"Would write {sum(len(s) for _, s in writes)} metafields on {len(writes)} collections, "
+              f"delete {sum(len(d) for _, d in deletes)} on {len(deletes)} collections"
+              + (", rewrite the vendor record" if record_changed else ""))
+        out_file = shop_path("collection_promo_plan.json", target)
+        try:
+            with open(out_file, "w", encoding="utf-8") as fh:
+                json.dump(plan_entries, fh, ensure_ascii=False, indent=2)
+            print(f"Wrote {out_file}")
+        except Exception as e:
+            print(f"Failed to write {out_file}: {e}")
+        result.update(collections_to_write=len(writes), collections_to_delete=len(deletes),
+                      vendor_record_changes=record_changed)
+    else:
+        written = deleted = failed = 0
+        batch: List[dict] = []
+        batch_owners = 0
+
+        def flush() -> None:
+            nonlocal batch, batch_owners, written, failed
+            if not batch:
+                return
+            try:
+                with METRICS.span("write"):
+                    shop.metafields_set(batch)
+                written += batch_owners
+                METRICS.incr("writes", batch_owners)
+            except Exception as e:
+                failed += batch_owners
+                print(f"  Failed to set metafields on {batch_owners} collections: {e}")
+            batch, batch_owners = [], 0
+
+        for gid, to_set in writes:
+            if len(batch) + len(to_set) > METAFIELDS_SET_LIMIT:
+                flush()
+            batch += [build_date_metafield(gid, ns, k, d) for k, d in sorted(to_set.items())]
+            batch_owners += 1
+        flush()
+
+        for gid, to_delete in deletes:
+            for k, mid in sorted(to_delete.items()):
+                try:
+                    with METRICS.span("delete"):
+                        shop.metafield_delete(mid)
+                    deleted += 1
+                    METRICS.incr("deletes")
+                except Exception as e:
+                    failed += 1
+                    print(f"  Failed to delete metafield {k} ({mid}) on {gid}: {e}")
+
+        if record_changed:
+            try:
+                with METRICS.span("write"):
+                    shop.metafields_set([{
+                        "ownerId": shop_id,
+                        "namespace": ns,
+                        "key": Config.METAFIELD_VENDOR_PROMOS,
+                        "type": "json",
+                        "value": json.dumps(new_record, ensure_ascii=False, separators=(",", ":")),
+                    }])
+                METRICS.incr("writes")
+            except Exception as e:
+                failed += 1
+                record_changed = False
+                print(f"  Failed to write the vendor record: {e}")
+
+        print(f"Total collections updated: {written}")
+        print(f"Total metafields deleted: {deleted}")
+        print(f"Vendor record: {'written' if record_changed else 'unchanged'} ({len(new_record)} vendors)")
+        result.update(collections_updated=written, metafields_deleted=deleted,
+                      vendor_record_written=record_changed, vendor_record_entries=len(new_record))
+        if failed:
+            result["failed"] = failed
+    if missing:
+        result["collections_missing"] = missing
+    result["seconds"] = round(time.perf_counter() - t0, 1)
+    return result
@@ -0,0 +1,313 @@
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from promo_config import Config
+from run_metrics import METRICS
+
+
+"""
+db_pool.py
+
+SQL Server access shared by the sync and the vendor reports.
+
+- One small connection pool per process. DatabaseConnection() checks a connection out,
+  close() hands it back (rolled back, still open), so the sync and the reports in one
+  cli.py run reuse the same ODBC connections instead of logging in again each time.
+- A pooled connection idle for longer than DB_POOL_PING_SECONDS is checked with SELECT 1
+  before it is handed out; a dead one is closed and replaced. A connection whose query
+  failed with a connection-level error is not returned to the pool.
+- Vendor column discovery for SM_Vendor / VH_Vendors is cached in memory and in
+  DB_SCHEMA_CACHE, so later runs query the right column directly instead of
+  "try Vendor, fail, SELECT TOP 1 *, retry".
+
+DB_POOL_SIZE          idle connections kept (default 2, 0 = no pooling)
+DB_POOL_PING_SECONDS  health check idle connections older than this (default 30, 0 = always)
+DB_SCHEMA_CACHE       default ".db_schema_cache.json" ("" = memory only)
+"""
+
+
+VENDOR_COLUMN_CANDIDATES = ("vendor", "vendorname", "name", "vendor_name")
+
+# pyodbc SQLSTATE classes that mean the connection itself is gone, not just the statement
+_CONNECTION_SQLSTATES = ("08", "HYT")
+
+
+def _connection_string() -> str:
+    return (
+        f"DRIVER={{SQL Server}};"
+        f"SERVER={Config.DB_SERVER};"
+        f"DATABASE={Config.DB_NAME};"
+        f"UID={Config.DB_USER};"
+        f"PWD={Config.DB_PASSWORD}"
+    )
+
+
+def _is_connection_error(e: Exception) -> bool:
+    state = str(e.args[0]) if getattr(e, "args", None) else ""
+    return state.startswith(_CONNECTION_SQLSTATES)
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.last_used = time.monotonic()
+        self.broken = False
+
+
+class ConnectionPool:
+    def __init__(self, size: int, ping_seconds: float):
+        self.size = size
+        self.ping_seconds = ping_seconds
+        self._idle: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.replaced = 0
+
+    def acquire(self) -> _PooledConnection:
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                return self._open()
+            if self._healthy(pooled):
+                self.reused += 1
+                METRICS.incr("db_connections_reused")
+                return pooled
+            self.replaced += 1
+            METRICS.incr("db_connections_replaced")
+            self._discard(pooled)
+
+    def release(self, pooled: _PooledConnection) -> None:
+        if not pooled.broken:
+            try:
+                # end any open (read) transaction so the next user starts clean
+                pooled.conn.rollback()
+            except Exception:
+                pooled.broken = True
+        if pooled.broken:
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(pooled)
+                return
+        self._discard(pooled)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+
+    def _open(self) -> _PooledConnection:
+        # imported here: only the DB code paths need the ODBC driver
+        import pyodbc
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            conn = pyodbc.connect(_connection_string())
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            METRICS.observe_request("db:connect", time.perf_counter() - t0, status)
+        self.opened += 1
+        return _PooledConnection(conn)
+
+    def _healthy(self, pooled: _PooledConnection) -> bool:
+        if time.monotonic() - pooled.last_used < self.ping_seconds:
+            return True
+        try:
+            cur = pooled.conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchall()
+            finally:
+                cur.close()
+            return True
+        except Exception as e:
+            print(f"  DB connection failed health check ({e}); reconnecting")
+            return False
+
+    @staticmethod
+    def _discard(pooled: _PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def connection_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(Config.DB_POOL_SIZE, Config.DB_POOL_PING_SECONDS)
+            atexit.register(_pool.close_all)
+        return _pool
+
+
+class DatabaseConnection:
+    """A pooled connection: close() returns it to the process-wide pool."""
+
+    def __init__(self):
+        self._pool = connection_pool()
+        self._pooled = self._pool.acquire()
+        self.conn = self._pooled.conn
+        self.cursor = self.conn.cursor()
+
+    def query(self, sql: str) -> List[Dict]:
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            self.cursor.execute(sql)
+            cols = [c[0] for c in self.cursor.description]
+            return [dict(zip(cols, row)) for row in self.cursor.fetchall()]
+        except Exception as e:
+            status = "error"
+            if _is_connection_error(e):
+                self._pooled.broken = True
+            raise
+        finally:
+            METRICS.observe_request("db:query", time.perf_counter() - t0, status)
+
+    @property
+    def broken(self) -> bool:
+        return self._pooled is not None and self._pooled.broken
+
+    def close(self):
+        if self._pooled is None:
+            return
+        try:
+            self.cursor.close()
+        except Exception:
+            self._pooled.broken = True
+        finally:
+            self._pool.release(self._pooled)
+            self._pooled = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =========================
+# Vendor column discovery
+# =========================
+_schema_cache: Optional[Dict[str, str]] = None
+_schema_lock = threading.Lock()
+
+
+def _schema_cache_path() -> str:
+    return Config.DB_SCHEMA_CACHE
+
+
+def _cache_key(table: str) -> str:
+    return f"{Config.DB_SERVER}/{table}".lower()
+
+
+def _load_schema_cache() -> Dict[str, str]:
+    global _schema_cache
+    if _schema_cache is None:
+        _schema_cache = {}
+        path = _schema_cache_path()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+                _schema_cache = {str(k): str(v) for k, v in (data.get("vendor_columns") or {}).items()}
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"  Ignoring unreadable {path}: {e}")
+    return _schema_cache
+
+
+def _save_schema_cache(cache: Dict[str, str]) -> None:
+    path = _schema_cache_path()
+    if not path:
+        return
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"vendor_columns": cache}, fh, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"  Could not write {path}: {e}")
+
+
+def cached_vendor_column(table: str) -> Optional[str]:
+    with _schema_lock:
+        return _load_schema_cache().get(_cache_key(table))
+
+
+def remember_vendor_column(table: str, column: Optional[str]) -> None:
+    key = _cache_key(table)
+    with _schema_lock:
+        cache = _load_schema_cache()
+        if cache.get(key) == column:
+            return
+        if column is None:
+            cache.pop(key, None)
+        else:
+            cache[key] = column
+        _save_schema_cache(cache)
+
+
+def _distinct_vendors_sql(table: str, column: str) -> str:
+    return (
+        f"SELECT DISTINCT LTRIM(RTRIM([{column}])) AS Vendor "
+        f"FROM {table} "
+        f"WHERE [{column}] IS NOT NULL AND LTRIM(RTRIM([{column}])) <> ''"
+    )
+
+
+def fetch_distinct_vendors(table: str) -> List[str]:
+    """
+    Distinct non-empty vendor names of `table` (e.g. Ecomm_DB_PROD.dbo.SM_Vendor).
+    Uses the cached vendor column; otherwise tries "Vendor", then probes the table for a candidate.
+    """
+    db = DatabaseConnection()
+    try:
+        column = cached_vendor_column(table)
+        if column:
+            try:
+                rows = db.query(_distinct_vendors_sql(table, column))
+                return [r["Vendor"] for r in rows if r.get("Vendor")]
+            except Exception as e:
+                if db.broken:
+                    raise
+                print(f"  Cached vendor column [{column}] of {table} failed ({e}); rediscovering")
+                remember_vendor_column(table, None)
+
+        # First try the expected column name
+        try:
+            rows = db.query(_distinct_vendors_sql(table, "Vendor"))
+            remember_vendor_column(table, "Vendor")
+            return [r["Vendor"] for r in rows if r.get("Vendor")]
+        except Exception:
+            if db.broken:
+                raise
+
+        # Fallback: probe the table to find a suitable column name
+        probe = db.query(f"SELECT TOP 1 * FROM {table}")
+        if not probe:
+            return []
+        candidates = [c for c in probe[0].keys() if c.lower() in VENDOR_COLUMN_CANDIDATES]
+        if not candidates:
+            return []
+        column = candidates[0]
+        rows = db.query(_distinct_vendors_sql(table, column))
+        remember_vendor_column(table, column)
+        return [r["Vendor"] for r in rows if r.get("Vendor")]
+    finally:
+        db.close()
@@ -5,13 +5,19 @@ import time
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
 
-from retail_promotions_to_shopify_metafields import Config, ShopifyClient, require_env
+from promo_config import Config, require_env
+from shopify_client import ShopifyClient, ShopifyCountError
+from catalog_mirror import CatalogMirror, open_catalog_mirror
+from run_metrics import METRICS, write_run_metrics
+from run_profiler import profiling
+from time_budget import TimeBudget, run_budget, write_leftover
 
 
 DEFAULT_XLSX = "shopify_collections_export.xlsx"
 DEFAULT_CSV = "shopify_collections_export.csv"
 DEFAULT_SQL = "shopify_collections_table.sql"
 DEFAULT_TABLE = "dbo.Shopify_Collections"
+LEFTOVER_PATH = "collections_export_leftover.json"
 
 
 def parse_numeric_id(gid: str) -> Optional[int]:
@@ -28,49 +34,42 @@ def parse_numeric_id(gid: str) -> Optional[int]:
         return None
 
 
-def list_collections(client: ShopifyClient) -> List[Dict[str, str]]:
-    rows: List[Dict[str, str]] = []
-    cursor = None
-    has_next = True
+def collection_row(n: dict) -> Dict[str, str]:
+    gid = n.get("id", "")
+    count = n.get("productsCount") or {}
+    return {
+        "collection_gid": gid,
+        "collection_id": str(parse_numeric_id(gid) or ""),
+        "title": n.get("title", ""),
+        "handle": n.get("handle", ""),
+        "updated_at": n.get("updatedAt", ""),
+        # only an exact inline count is used; anything else is counted in enrich_collections
+        "product_count": str(count["count"]) if count.get("precision", "EXACT") == "EXACT" and count.get("count") is not None else "",
+        "vendors": "",
+    }
+
+
+def list_collections(client: ShopifyClient, mirror: Optional[CatalogMirror] = None,
+                     with_counts: bool = False) -> List[Dict[str, str]]:
+    """with_counts: request productsCount inline in the listing pages (no per-collection count requests)."""
+    if mirror is not None:
+        return [collection_row(n) for n in mirror.list_collections()]
 
+    count_field = " productsCount { count precision }" if with_counts else ""
     q = """
     query($cursor: String) {
       collections(first: 250, after: $cursor) {
         pageInfo { hasNextPage endCursor }
-        nodes { id title handle updatedAt }
+        nodes { id title handle updatedAt%s }
       }
     }
-    """
-
-    while has_next:
-        data = client.graphql(q, {"cursor": cursor})
-        conn = data["data"]["collections"]
-        nodes = conn.get("nodes", [])
-
-        for n in nodes:
-            gid = n.get("id", "")
-            rows.append(
-                {
-                    "collection_gid": gid,
-                    "collection_id": str(parse_numeric_id(gid) or ""),
-                    "title": n.get("title", ""),
-                    "handle": n.get("handle", ""),
-                    "updated_at": n.get("updatedAt", ""),
-                    "product_count": "",
-                    "vendors": "",
-                }
-            )
+    """ % count_field
 
-        has_next = conn["pageInfo"]["hasNextPage"]
-        cursor = conn["pageInfo"]["endCursor"]
-
-    return rows
+    return [collection_row(n) for n in client.paginate(q, path=("collections",), cache=True)]
 
 
 def get_vendors_in_collection(client: ShopifyClient, collection_id: str) -> List[str]:
     vendors = set()
-    cursor = None
-    has_next = True
 
     q = """
     query($id: ID!, $cursor: String) {
@@ -83,54 +82,71 @@ def get_vendors_in_collection(client: ShopifyClient, collection_id: str) -> List
     }
     """
 
-    while has_next:
-        data = client.graphql(q, {"id": collection_id, "cursor": cursor})
-        conn = data["data"]["collection"]["products"]
-        for n in conn.get("nodes", []):
-            v = (n.get("vendor") or "").strip()
-            if v:
-                vendors.add(v)
-        has_next = conn["pageInfo"]["hasNextPage"]
-        cursor = conn["pageInfo"]["endCursor"]
+    for n in client.paginate(q, {"id": collection_id}, ("collection", "products"), cache=True):
+        v = (n.get("vendor") or "").strip()
+        if v:
+            vendors.add(v)
 
     return sorted(vendors)
 
 
-def enrich_collections(rows: List[Dict[str, str]], client: ShopifyClient) -> None:
+def enrich_from_mirror(rows: List[Dict[str, str]], mirror: CatalogMirror) -> None:
+    # indexed lookups, no API calls and no rate limiting
+    for r in rows:
+        gid = r.get("collection_gid")
+        r["product_count"] = str(mirror.count_in_collection(gid))
+        r["vendors"] = ";".join(mirror.vendors_in_collection(gid))
+        METRICS.incr("collections")
+
+
+def enrich_collections(rows: List[Dict[str, str]], client: ShopifyClient,
+                       budget: Optional[TimeBudget] = None) -> List[Dict[str, str]]:
+    """Returns the rows a time budget left unenriched (empty when all were done)."""
     total = len(rows)
     start_time = time.time()
-    
-    for idx, r in enumerate(rows, 1):
-        gid = r.get("collection_gid")
-        title = r.get("title", "")[:50]
-        
-        if idx % 10 == 0 or idx == total:
-            elapsed = time.time() - start_time
-            avg_time = elapsed / idx
-            remaining = (total - idx) * avg_time
-            print(f"  [{idx}/{total} - {idx*100//total}%] ETA: {int(remaining//60)}m{int(remaining%60)}s - Last: {title}", flush=True)
-        
-        try:
-            cnt = client.rest_count_products_in_collection(gid)
-        except Exception as e:
-            print(f"  ! Count error for '{title}': {str(e)[:80]}", flush=True)
-            cnt = 0
-            time.sleep(2)
-        
-        try:
-            vendors = get_vendors_in_collection(client, gid)
-            vendors_str = ";".join(vendors)
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            print(f"  ! Vendor error for '{title}': {str(e)[:80]}", flush=True)
-            vendors_str = ""
-            time.sleep(2)
+    progress = budget.track(total, "collections", "collections export") if budget is not None else None
 
-        r["product_count"] = str(cnt)
-        r["vendors"] = vendors_str
-        
-        time.sleep(0.15)  # Rate limiting
+    for idx, r in enumerate(rows, 1):
+        if progress is not None:
+            if progress.should_stop():
+                return rows[idx - 1:]
+            progress.advance()
+        with METRICS.span("collection", label=r.get("title", "")):
+            gid = r.get("collection_gid")
+            title = r.get("title", "")[:50]
+
+            if idx % 10 == 0 or idx == total:
+                elapsed = time.time() - start_time
+                avg_time = elapsed / idx
+                remaining = (total - idx) * avg_time
+                print(f"  [{idx}/{total} - {idx*100//total}%] ETA: {int(remaining//60)}m{int(remaining%60)}s - Last: {title}", flush=True)
+
+            cnt = r.get("product_count", "")
+            if cnt == "":
+                # not in the listing (with_counts off, or inexact): count this one on its own
+                try:
+                    with METRICS.span("count"):
+                        cnt = str(client.count_products_in_collection(gid))
+                except ShopifyCountError as e:
+                    print(f"  ! Count error for '{title}': {str(e)[:80]}", flush=True)
+
+            try:
+                with METRICS.span("vendors"):
+                    vendors = get_vendors_in_collection(client, gid)
+                vendors_str = ";".join(vendors)
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                print(f"  ! Vendor error for '{title}': {str(e)[:80]}", flush=True)
+                vendors_str = ""
+                time.sleep(2)
+
+            r["product_count"] = cnt
+            r["vendors"] = vendors_str
+            METRICS.incr("collections")
+
+            time.sleep(0.15)  # Rate limiting
+    return []
 
 
 def write_csv(path: str, rows: List[Dict[str, str]], extra: Dict[str, str]) -> None:
@@ -197,9 +213,11 @@ END;
         f.write(sql)
 
 
-def main() -> None:
+def main(shop: Optional[ShopifyClient] = None) -> None:
+    """shop: client to reuse (cli.py passes one shared client and its in-run cache)."""
     require_env()
-    client = ShopifyClient()
+    client = shop or ShopifyClient()
+    budget = run_budget()
 
     exported_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
     extra = {
@@ -207,14 +225,24 @@ def main() -> None:
         "exported_at": exported_at,
     }
 
-    rows = list_collections(client)
-    
-    print(f"Enriching {len(rows)} collections with product counts and vendors...")
-    print(f"This may take 30-60 minutes. Progress will be saved every 50 collections.")
+    mirror = open_catalog_mirror()
+    with METRICS.span("list_collections"):
+        rows = list_collections(client, mirror, with_counts=True)
+
+    if mirror is not None:
+        print(f"Enriching {len(rows)} collections from catalog mirror: {mirror.path}")
+    else:
+        print(f"Enriching {len(rows)} collections with product counts and vendors...")
+        print(f"This may take 30-60 minutes. Progress will be saved every 50 collections.")
     sys.stdout.flush()
     
+    left: List[Dict[str, str]] = []
     try:
-        enrich_collections(rows, client)
+        with METRICS.span("enrich"):
+            if mirror is not None:
+                enrich_from_mirror(rows, mirror)
+            else:
+                left = enrich_collections(rows, client, budget)
     except KeyboardInterrupt:
         print("\n\nInterrupted! Saving partial results...")
     except Exception as e:
@@ -243,7 +271,24 @@ def main() -> None:
     else:
         print(f"Excel failed (openpyxl missing). CSV created: {csv_path}")
     print(f"SQL: {sql_path}")
+    if left:
+        print(f"Time budget: {len(left)} collections were not enriched (no vendors, counts from the listing only)")
+    write_leftover(LEFTOVER_PATH, {
+        "exported_at": exported_at,
+        "budget_seconds": budget.seconds,
+        "elapsed_seconds": round(budget.elapsed(), 1),
+        "collections": len(rows),
+        "left": [{"collection_gid": r["collection_gid"], "title": r["title"]} for r in left],
+    } if left else None)
+    write_run_metrics("collections_export")
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    ap = argparse.ArgumentParser(description="Export Shopify collections with product counts and vendors")
+    ap.add_argument("--time-budget", default=Config.TIME_BUDGET, metavar="DURATION",
+                    help="e.g. 45m (same as TIME_BUDGET): stop enriching before it runs out, "
+                         f"list the rest in {LEFTOVER_PATH}")
+    Config.TIME_BUDGET = ap.parse_args().time_budget
+    with profiling("collections_export"):
+        main()
@@ -1,100 +1,111 @@
 import json
 import time
+from typing import Optional
 
-from retail_promotions_to_shopify_metafields import ShopifyClient, Config
+from promo_config import Config
+from shopify_client import ShopifyClient, ShopifyCountError
+from catalog_mirror import CatalogMirror, open_catalog_mirror
+from run_metrics import METRICS, write_run_metrics
+from run_profiler import profiling
 
-# Optional Excel output dependency
-try:
-    from openpyxl import Workbook
-    _HAS_OPENPYXL = True
-except Exception:
-    _HAS_OPENPYXL = False
+
+def _openpyxl_workbook():
+    # Optional Excel output dependency, imported only when the report is written
+    try:
+        from openpyxl import Workbook
+        return Workbook
+    except Exception:
+        return None
 
 
-def fetch_all_vendors_from_shopify(shop: ShopifyClient) -> dict:
+def fetch_all_vendors_from_shopify(shop: ShopifyClient, mirror: Optional[CatalogMirror] = None) -> dict:
     """
-    Fetch all vendors from Shopify products
+    Fetch all vendors from Shopify products (or from the catalog mirror when configured)
     Returns: dict mapping vendor name to product count
     """
-    q = '''
-    query($cursor: String) {
-      products(first: 250, after: $cursor) {
-        pageInfo { hasNextPage endCursor }
-        nodes { id vendor }
-      }
-    }
-    '''
+    if mirror is not None:
+        print(f"Reading vendors from catalog mirror: {mirror.path}")
+        return mirror.vendor_counts()
 
     vendor_counts = {}
-    cursor = None
-    has_next = True
     total_products = 0
 
-    print("Fetching all products from Shopify to extract vendors...")
-    while has_next:
-        data = shop.graphql(q, {"cursor": cursor})
-        conn = data["data"]["products"]
-        
-        for n in conn["nodes"]:
-            total_products += 1
-            v = (n.get("vendor") or "").strip()
-            if v:
-                vendor_counts[v] = vendor_counts.get(v, 0) + 1
-
-        has_next = conn["pageInfo"]["hasNextPage"]
-        cursor = conn["pageInfo"]["endCursor"]
-        
-        if total_products % 500 == 0:
-            print(f"  Processed {total_products} products...")
+    print("Extracting vendors from all Shopify products...")
+    for _, v in shop.list_product_vendors():
+        total_products += 1
+        METRICS.incr("products")
+        if v:
+            vendor_counts[v] = vendor_counts.get(v, 0) + 1
 
     print(f"  Total products: {total_products}")
     print(f"  Unique vendors: {len(vendor_counts)}")
     return vendor_counts
 
 
-def main():
+def main(shop: Optional[ShopifyClient] = None):
+    """shop: client to reuse (cli.py passes one shared client and its in-run cache)."""
     print("=== Shopify Vendors with Collection Matching ===\n")
-    shop = ShopifyClient()
+    shop = shop or ShopifyClient()
+    mirror = open_catalog_mirror()
 
     # Fetch all vendors from Shopify products
-    vendor_counts = fetch_all_vendors_from_shopify(shop)
+    with METRICS.span("fetch_vendors"):
+        vendor_counts = fetch_all_vendors_from_shopify(shop, mirror)
     vendors = sorted(vendor_counts.keys())
     
     print(f"\nProcessing {len(vendors)} vendors...\n")
 
     results = []
 
-    for idx, vendor in enumerate(vendors, 1):
-        print(f"[{idx}/{len(vendors)}] {vendor}")
-        
-        # We already have the product count from the initial fetch
-        vendor_product_count = vendor_counts[vendor]
-        print(f"  Vendor products: {vendor_product_count}")
-        
-        # Check for matching collection
-        col = shop.find_collection_by_title_exact(vendor)
-        has_collection = col is not None
-        collection_name = "false"
-        collection_product_count = "false"
-        
-        if has_collection:
-            col_id, col_title = col
-            collection_name = col_title
-            collection_product_count = shop.rest_count_products_in_collection(col_id)
-            print(f"  Collection matched: {collection_name} ({collection_product_count} products)")
-        else:
-            print(f"  No matching collection")
-
-        results.append({
-            "vendor": vendor,
-            "vendor_product_count": vendor_product_count,
-            "has_collection": has_collection,
-            "collection_name": collection_name,
-            "collection_product_count": collection_product_count
-        })
-
-        time.sleep(max(0.0, getattr(Config, "SLEEP_BETWEEN_CALLS", 0.12)))
-        print()
+    prefetched = False
+    if mirror is None:
+        # collection matches and collection counts in a few batched requests
+        with METRICS.span("prefetch"):
+            prefetched = shop.prefetch_vendor_collections(vendors, count_vendors=False)
+
+    with METRICS.span("collection_matching"):
+        for idx, vendor in enumerate(vendors, 1):
+            with METRICS.span("vendor", label=vendor):
+                print(f"[{idx}/{len(vendors)}] {vendor}")
+                METRICS.incr("vendors")
+
+                # We already have the product count from the initial fetch
+                vendor_product_count = vendor_counts[vendor]
+                print(f"  Vendor products: {vendor_product_count}")
+
+                # Check for matching collection
+                lookup = mirror if mirror is not None else shop
+                col = lookup.find_collection_by_title_exact(vendor)
+                has_collection = col is not None
+                collection_name = "false"
+                collection_product_count = "false"
+
+                if has_collection:
+                    col_id, col_title = col
+                    collection_name = col_title
+                    if mirror is not None:
+                        collection_product_count = mirror.count_in_collection(col_id)
+                    else:
+                        try:
+                            collection_product_count = shop.count_products_in_collection(col_id)
+                        except ShopifyCountError as e:
+                            print(f"  Error counting collection products: {e}")
+                            collection_product_count = None
+                    print(f"  Collection matched: {collection_name} ({collection_product_count} products)")
+                else:
+                    print(f"  No matching collection")
+
+                results.append({
+                    "vendor": vendor,
+                    "vendor_product_count": vendor_product_count,
+                    "has_collection": has_collection,
+                    "collection_name": collection_name,
+                    "collection_product_count": collection_product_count
+                })
+
+                if mirror is None and not prefetched:
+                    time.sleep(max(0.0, getattr(Config, "SLEEP_BETWEEN_CALLS", 0.12)))
+                print()
 
     # Write JSON
     with open("shopify_vendor_counts.json", "w", encoding="utf-8") as fh:
@@ -113,7 +124,8 @@ def main():
         print(f"Failed to write CSV: {e}")
 
     # Write Excel
-    if _HAS_OPENPYXL:
+    Workbook = _openpyxl_workbook()
+    if Workbook is not None:
         try:
             wb = Workbook()
             ws = wb.active
@@ -140,7 +152,9 @@ def main():
         print("! openpyxl not installed, skipping Excel output")
 
     print(f"\nTotal vendors processed: {len(results)}")
+    write_run_metrics("vendor_collections_report")
 
 
 if __name__ == "__main__":
-    main()
+    with profiling("vendor_collections_report"):
+        main()
@@ -0,0 +1,217 @@
+import atexit
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+
+"""
+http_cassette.py
+
+Record / replay of the HTTP traffic ShopifyClient sends, for deterministic offline
+profiling and benchmarking with real-shaped responses.
+
+HTTP_CASSETTE_MODE:
+- ""        (default) live requests, nothing recorded
+- record    live requests; every request/response pair is appended to HTTP_CASSETTE
+- replay    no network; responses come from HTTP_CASSETTE
+
+Cassette file: gzip JSON lines, one interaction per line
+{"method": "POST", "path": "/admin/api/2024-01/graphql.json", "body": {...}, "status": 200,
+ "headers": {"X-Shopify-Shop-Api-Call-Limit": "...", ...}, "response": "<raw body>", "elapsed": 0.23}
+
+- The response body is kept verbatim, so extensions.cost / throttleStatus replay exactly.
+- The access token is never written. Shop host is dropped from the key, so a cassette
+  recorded against one shop (or the mock server) replays under any SHOPIFY_SHOP.
+- Requests match on method + path + query string + JSON body (GraphQL whitespace ignored).
+  Identical requests replay their recorded responses in order (e.g. THROTTLED, then the data);
+  once used up the last one is repeated.
+
+HTTP_REPLAY_LATENCY_MS:
+- ""          no delay (fastest)
+- recorded    sleep the recorded response time
+- <number>    sleep a fixed number of milliseconds per request
+"""
+
+
+class CassetteMiss(RuntimeError):
+    pass
+
+
+class CassetteResponse:
+    """The subset of requests.Response that ShopifyClient uses."""
+
+    def __init__(self, status_code: int, text: str, headers: Optional[Dict[str, str]] = None, url: str = ""):
+        self.status_code = status_code
+        self.text = text
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.url = url
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _request_key(method: str, url: str, body: Optional[dict]) -> str:
+    u = urlparse(url)
+    path = u.path + (f"?{u.query}" if u.query else "")
+    if body is not None:
+        body = dict(body)
+        if isinstance(body.get("query"), str):
+            body["query"] = _WS_RE.sub(" ", body["query"]).strip()
+        return f"{method} {path} {json.dumps(body, sort_keys=True, ensure_ascii=False)}"
+    return f"{method} {path}"
+
+
+class Cassette:
+    """Transport with the requests.get / requests.post call shape used by ShopifyClient."""
+
+    def __init__(self, path: str, mode: str, latency: str = ""):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"HTTP_CASSETTE_MODE must be record or replay, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency = (latency or "").strip().lower()
+        self._lock = threading.Lock()
+        self._fh = None
+        self._recorded: Dict[str, List[dict]] = {}
+        self._position: Dict[str, int] = {}
+
+        if mode == "replay":
+            self._load()
+        else:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            # append: several scripts (or runs) can record into one cassette
+            self._fh = gzip.open(path, "at", encoding="utf-8")
+            atexit.register(self.close)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise RuntimeError(f"HTTP cassette not found: {self.path} (record one with HTTP_CASSETTE_MODE=record)")
+        with gzip.open(self.path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # torn last line of an interrupted recording
+                    continue
+                key = _request_key(rec["method"], rec["path"], rec.get("body"))
+                self._recorded.setdefault(key, []).append(rec)
+
+    def interaction_count(self) -> int:
+        return sum(len(v) for v in self._recorded.values())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    # -------------------------
+    # requests-compatible calls
+    # -------------------------
+    def post(self, url: str, headers: Optional[dict] = None, json: Optional[dict] = None, timeout=None):
+        return self._request("POST", url, headers, json, timeout)
+
+    def get(self, url: str, headers: Optional[dict] = None, timeout=None):
+        return self._request("GET", url, headers, None, timeout)
+
+    def _request(self, method: str, url: str, headers: Optional[dict], body: Optional[dict], timeout):
+        if self.mode == "replay":
+            return self._replay(method, url, body)
+
+        u = urlparse(url)
+        t0 = time.perf_counter()
+        resp = shared_session(f"{u.scheme}://{u.netloc}").request(method, url, headers=headers, json=body, timeout=timeout)
+        elapsed = time.perf_counter() - t0
+        rec = {
+            "method": method,
+            "path": u.path + (f"?{u.query}" if u.query else ""),
+            "body": body,
+            "status": resp.status_code,
+            "headers": dict(resp.headers),
+            "response": resp.text,
+            "elapsed": round(elapsed, 4),
+        }
+        with self._lock:
+            if self._fh is not None:
+                self._fh.write(_dumps(rec) + "\n")
+                self._fh.flush()
+        return resp
+
+    def _replay(self, method: str, url: str, body: Optional[dict]) -> CassetteResponse:
+        key = _request_key(method, url, body)
+        with self._lock:
+            recs = self._recorded.get(key)
+            if not recs:
+                raise CassetteMiss(f"No recorded response in {self.path} for {key[:300]}")
+            i = self._position.get(key, 0)
+            rec = recs[min(i, len(recs) - 1)]
+            self._position[key] = i + 1
+
+        if self.latency == "recorded":
+            time.sleep(float(rec.get("elapsed") or 0))
+        elif self.latency:
+            time.sleep(float(self.latency) / 1000.0)
+
+        return CassetteResponse(int(rec["status"]), rec.get("response") or "", rec.get("headers"), url)
+
+
+def _dumps(rec: dict) -> str:
+    return json.dumps(rec, ensure_ascii=False, separators=(",", ":"))
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+
+
+def shared_session(key: str = "") -> requests.Session:
+    """
+    One pooled HTTP session per process and key (keep-alive connections reused by every
+    ShopifyClient of that shop). ShopifyClient uses its admin base URL as the key.
+    """
+    with _cassettes_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            _sessions[key] = session
+        return session
+
+
+def open_http_transport(mode: str, path: str, latency: str = "", session_key: str = ""):
+    """
+    Transport for ShopifyClient: the shared pooled session for session_key when no cassette
+    is configured. One Cassette per file per process, shared by every ShopifyClient.
+    """
+    mode = (mode or "").strip().lower()
+    if not mode:
+        return shared_session(session_key)
+    key = os.path.abspath(path)
+    with _cassettes_lock:
+        cassette = _cassettes.get(key)
+        if cassette is None or cassette.mode != mode:
+            cassette = Cassette(path, mode, latency)
+            _cassettes[key] = cassette
+            if mode == "replay":
+                print(f"Replaying HTTP from cassette {path} ({cassette.interaction_count()} interactions)")
+            else:
+                print(f"Recording HTTP to cassette {path}")
+        return cassette
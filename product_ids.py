@@ -0,0 +1,133 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import islice
+from typing import Iterable, Iterator, Union
+
+
+"""
+product_ids.py
+
+ProductIdSet: the product ids of a scope, as a sorted array('q') of numeric ids
+(8 bytes each) instead of lists and sets of "gid://shopify/Product/..." strings.
+
+Scope resolution (shopify_client, catalog_mirror, catalog_snapshot,
+resolve_scope_product_ids, sharding) passes these around; union, intersection and
+membership work on the numbers. GIDs are rebuilt only where a product is sent to the
+API (gids(), product_gid()).
+
+A ProductIdSet is never changed after it is built, so the clients can cache and
+hand out the same instance. Union and intersection walk the sorted arrays and write
+straight into a new array: no Python sets of int objects, no re-sort.
+"""
+
+
+PRODUCT_GID_PREFIX = "gid://shopify/Product/"
+
+ProductId = Union[int, str]
+
+
+def product_id(value: ProductId) -> int:
+    """numeric id of a product gid ("gid://shopify/Product/123"), numeric string or int"""
+    if isinstance(value, int):
+        return value
+    return int(value.rsplit("/", 1)[-1])
+
+
+def product_gid(pid: int) -> str:
+    return f"{PRODUCT_GID_PREFIX}{pid}"
+
+
+def _distinct(ascending: Iterable[int]) -> Iterator[int]:
+    """drops repeats from an ascending sequence"""
+    last = None
+    for pid in ascending:
+        if pid != last:
+            yield pid
+            last = pid
+
+
+class ProductIdSet:
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids: Iterable[ProductId] = ()):
+        ids = array("q", map(product_id, ids))
+        if not all(a < b for a, b in zip(ids, islice(ids, 1, None))):
+            ids = array("q", _distinct(sorted(ids)))
+        self._ids = ids
+
+    @classmethod
+    def from_sorted(cls, ids: Iterable[int]) -> "ProductIdSet":
+        """ids already ascending and distinct (e.g. SELECT ... ORDER BY id on a key): no sort/dedup pass"""
+        return cls._wrap(array("q", ids))
+
+    @classmethod
+    def _wrap(cls, ids: array) -> "ProductIdSet":
+        """takes ownership of an ascending, distinct array('q') without copying it"""
+        s = cls.__new__(cls)
+        s._ids = ids
+        return s
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __contains__(self, value) -> bool:
+        try:
+            pid = product_id(value)
+        except (AttributeError, TypeError, ValueError):
+            return False
+        i = bisect_left(self._ids, pid)
+        return i < len(self._ids) and self._ids[i] == pid
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ProductIdSet) and self._ids == other._ids
+
+    def __repr__(self) -> str:
+        return f"ProductIdSet({len(self._ids)} products)"
+
+    def __or__(self, other: "ProductIdSet") -> "ProductIdSet":
+        return self.union(other)
+
+    def __and__(self, other: "ProductIdSet") -> "ProductIdSet":
+        return self.intersection(other)
+
+    @property
+    def nbytes(self) -> int:
+        return self._ids.itemsize * len(self._ids)
+
+    def gids(self) -> Iterator[str]:
+        for pid in self._ids:
+            yield f"{PRODUCT_GID_PREFIX}{pid}"
+
+    def union(self, *others: "ProductIdSet") -> "ProductIdSet":
+        others = [o for o in others if len(o)]
+        if not others:
+            return self
+        if not len(self._ids) and len(others) == 1:
+            return others[0]
+        return ProductIdSet.from_sorted(_distinct(merge(self._ids, *(o._ids for o in others))))
+
+    def intersection(self, other: "ProductIdSet") -> "ProductIdSet":
+        small, large = (self._ids, other._ids) if len(self) <= len(other) else (other._ids, self._ids)
+        out = array("q")
+        if len(small) * 16 < len(large):
+            # pointer into the larger side only moves forward; bisect skips the gaps between matches
+            i, n = 0, len(large)
+            for pid in small:
+                i = bisect_left(large, pid, i)
+                if i == n:
+                    break
+                if large[i] == pid:
+                    out.append(pid)
+                    i += 1
+        else:
+            # each side is distinct, so an id seen twice in a row in the merge is in both
+            last = None
+            for pid in merge(small, large):
+                if pid == last:
+                    out.append(pid)
+                last = pid
+        return ProductIdSet._wrap(out)
@@ -0,0 +1,238 @@
+import os
+from dataclasses import dataclass
+from typing import List
+
+
+"""
+promo_config.py
+
+Settings shared by every script (read from the environment / .env), kept free of
+heavy imports so that Shopify-only scripts start fast.
+"""
+
+
+def _load_dotenv() -> None:
+    # Optional: load .env automatically if python-dotenv installed.
+    # Only import dotenv when there is a .env to read (cwd or next to the scripts).
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in (os.path.join(os.getcwd(), ".env"), os.path.join(here, ".env")):
+        if os.path.exists(path):
+            try:
+                from dotenv import load_dotenv
+                load_dotenv(path)
+            except Exception:
+                pass
+            return
+
+
+_load_dotenv()
+
+
+# =========================
+# Config (ENV)
+# =========================
+class Config:
+    # Shopify
+    SHOPIFY_SHOP = os.getenv("SHOPIFY_SHOP", "").strip()
+    SHOPIFY_TOKEN = os.getenv("SHOPIFY_TOKEN", "").strip()
+    SHOPIFY_API_VERSION = os.getenv("SHOPIFY_API_VERSION", "2024-04").strip()
+    REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "30"))
+    # Optional override of https://<SHOPIFY_SHOP>, e.g. http://127.0.0.1:8765 for tools/mock_shopify_server.py
+    SHOPIFY_ADMIN_URL = os.getenv("SHOPIFY_ADMIN_URL", "").strip().rstrip("/")
+    # Multi-shop sync: comma separated target names, e.g. "us,ca". Each name N reads
+    # SHOPIFY_SHOP_N / SHOPIFY_TOKEN_N (and optional SHOPIFY_ADMIN_URL_N). Empty = SHOPIFY_SHOP only.
+    SHOPIFY_SHOPS = os.getenv("SHOPIFY_SHOPS", "").strip()
+    # webhook_receiver.py: the app's client secret Shopify signs webhooks with (SHOPIFY_WEBHOOK_SECRET_<NAME> per shop)
+    SHOPIFY_WEBHOOK_SECRET = os.getenv("SHOPIFY_WEBHOOK_SECRET", "").strip()
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1").strip()
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8787"))
+    # look up a changed product's collections / a changed collection's products via the API (0 = payload only)
+    WEBHOOK_FETCH_MEMBERSHIP = os.getenv("WEBHOOK_FETCH_MEMBERSHIP", "1").strip().lower() in ("1", "true", "yes")
+    # HTTP record/replay (http_cassette.py): "" = live, "record" = live + save, "replay" = offline from the cassette
+    HTTP_CASSETTE_MODE = os.getenv("HTTP_CASSETTE_MODE", "").strip().lower()
+    HTTP_CASSETTE = os.getenv("HTTP_CASSETTE", "cassettes/shopify.jsonl.gz").strip()
+    HTTP_REPLAY_LATENCY_MS = os.getenv("HTTP_REPLAY_LATENCY_MS", "").strip()
+    # Wait before sending a GraphQL request until the cost bucket is estimated to hold this much, or the
+    # last requested cost of the same query if higher (0 = only react to THROTTLED errors)
+    GRAPHQL_MIN_AVAILABLE = float(os.getenv("GRAPHQL_MIN_AVAILABLE", "100"))
+    # Cursor listings (ShopifyClient.pages / paginate): request the next page while the current one
+    # is processed (0 = one page after the other)
+    PAGINATION_PREFETCH = os.getenv("PAGINATION_PREFETCH", "1").strip().lower() in ("1", "true", "yes")
+    # Batched (aliased) lookups: max estimated cost of one request. Shopify rejects single
+    # queries above 1000; the margin covers estimates that are a little low.
+    GRAPHQL_BATCH_MAX_COST = float(os.getenv("GRAPHQL_BATCH_MAX_COST", "900"))
+
+    # Response cache for read-only lookups marked cacheable (response_cache.py): memory LRU of
+    # RESPONSE_CACHE_MEMORY_ENTRIES responses, then RESPONSE_CACHE_PATH (SQLite, "" = memory only)
+    # shared by later runs for RESPONSE_CACHE_TTL_SECONDS and kept under RESPONSE_CACHE_MAX_MB.
+    # RESPONSE_CACHE_BYPASS=1: always ask Shopify (fresh responses are still stored)
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite").strip()
+    RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "21600"))
+    RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "200"))
+    RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "2000"))
+    RESPONSE_CACHE_BYPASS = os.getenv("RESPONSE_CACHE_BYPASS", "0").strip().lower() in ("1", "true", "yes")
+
+    # DB
+    DB_SERVER = os.getenv("DB_SERVER", r"sql01-union\sql2012").strip()
+    DB_NAME = os.getenv("DB_NAME", "Ecomm_DB_PROD").strip()
+    DB_USER = os.getenv("DB_USER", "ssis").strip()
+    DB_PASSWORD = os.getenv("DB_PASSWORD", "ssis").strip()
+    # db_pool.py: idle connections kept per process (0 = no pooling), health check (SELECT 1) of
+    # connections idle longer than this many seconds, and the discovered vendor-column cache file
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "2"))
+    DB_POOL_PING_SECONDS = float(os.getenv("DB_POOL_PING_SECONDS", "30"))
+    DB_SCHEMA_CACHE = os.getenv("DB_SCHEMA_CACHE", ".db_schema_cache.json").strip()
+
+    # X Y Z
+    # Default behavior (if env is missing): X/Y/Z = 5/15/5
+    # - X (X_DAYS_BEFORE_SALE_START): number of days before a Sale start to begin writing/keeping the metafield
+    # - Y (Y_DAYS_BEFORE_PI_START): number of days before a Price Increase start to begin writing/keeping the metafield
+    # - Z (Z_DAYS_AFTER_PI_START): when a Price Increase has no end date, the metafield is retained until Z days after the start
+    # Note: these settings only control whether the script writes/deletes Shopify metafields.
+    # The front-end display/formatting of dates is handled in Shopify Liquid templates.
+    Days_Before_Retail_Sale = int(os.getenv("X_DAYS_BEFORE_SALE_START", os.getenv("Days_Before_Retail_Sale", "5")))
+    Days_Before_Price_Increase = int(os.getenv("Y_DAYS_BEFORE_Price_Increase_START", os.getenv("Days_Before_Price_Increase", "15")))
+    Days_After_Price_Increase = int(os.getenv("Z_DAYS_AFTER_Price_Increase_START", os.getenv("Days_After_Price_Increase", "5")))
+    # Cleanup lookback window (days): include recently-ended promotions for delayed deletion
+    CLEANUP_LOOKBACK_DAYS = int(os.getenv("CLEANUP_LOOKBACK_DAYS", "7"))
+
+    # Behavior
+    DRY_RUN = os.getenv("DRY_RUN", "1").strip().lower() in ("1", "true", "yes")
+    DB_ONLY = os.getenv("DB_ONLY", "0").strip().lower() in ("1", "true", "yes")
+    SLEEP_BETWEEN_CALLS = float(os.getenv("SLEEP_BETWEEN_CALLS", "0.12"))
+
+    # Write journal (real runs only): lets an interrupted run resume where it stopped
+    SYNC_JOURNAL = os.getenv("SYNC_JOURNAL", "1").strip().lower() in ("1", "true", "yes")
+    SYNC_JOURNAL_DIR = os.getenv("SYNC_JOURNAL_DIR", "sync_journal").strip()
+
+    # Time budget for a run (time_budget.py): "5400", "90m", "1h30m"; empty = none. New work stops
+    # before the deadline and what is left is recorded for the next run.
+    TIME_BUDGET = os.getenv("TIME_BUDGET", "").strip()
+
+    # Real runs apply the scopes by urgency (banners appearing today, then disappearing, then the rest)
+    # instead of plan order; 0 = plan order
+    SYNC_PRIORITY = os.getenv("SYNC_PRIORITY", "1").strip().lower() in ("1", "true", "yes")
+
+    # Where the promo dates are written:
+    #   product    - on every product of a scope (default)
+    #   collection - once per scope: on the collection (CollectionID scopes) or in the shop's vendor
+    #                record (vendor fallback scopes); the theme looks the product's dates up there
+    #                (collection_promos.py)
+    #   metaobject - one metaobject per scope holds the dates, each product references it from one
+    #                metafield; products are only written when they join or leave a scope (promo_metaobjects.py)
+    PROMO_TARGET = os.getenv("PROMO_TARGET", "product").strip().lower()
+
+    # Stale metafield sweep (stale_sweep.py): where the products carrying custom.promo_* come from
+    #   bulk     - one bulk operation over the shop's products (default, always current)
+    #   mirror   - the CATALOG_MIRROR's product_metafields table
+    #   snapshot - the CATALOG_SNAPSHOT file
+    SWEEP_SOURCE = os.getenv("SWEEP_SOURCE", "bulk").strip().lower()
+
+    # Sharded sync (sync_shards.py): "i/N" = this worker takes shard i of N (1-based), "" = whole plan.
+    # SHARD_KEY: product (hash of the owning product id) or scope (hash of the product's first scope)
+    SYNC_SHARD = os.getenv("SYNC_SHARD", "").strip()
+    SHARD_KEY = os.getenv("SHARD_KEY", "product").strip().lower()
+    SYNC_SHARD_DIR = os.getenv("SYNC_SHARD_DIR", "sync_shards").strip()
+
+    # Daemon mode (sync_daemon.py): how often SM_Retail_Sales is checked for changes, and where the
+    # daemon remembers what it last applied per scope (so a restart does not need a full sweep)
+    DAEMON_POLL_SECONDS = float(os.getenv("DAEMON_POLL_SECONDS", "300"))
+    DAEMON_STATE = os.getenv("DAEMON_STATE", "sync_daemon_state.json").strip()
+
+    # Offline dry run (DRY_RUN=1 only): read product state from a local catalog snapshot, zero API calls
+    DRY_RUN_OFFLINE = os.getenv("DRY_RUN_OFFLINE", "0").strip().lower() in ("1", "true", "yes")
+    CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "catalog_snapshot.json.gz").strip()
+    SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("SNAPSHOT_MAX_AGE_HOURS", "24"))
+
+    # Local SQLite catalog mirror (catalog_mirror.py). Empty = disabled, read live from Shopify.
+    CATALOG_MIRROR = os.getenv("CATALOG_MIRROR", "").strip()
+    CATALOG_MIRROR_REFRESH = os.getenv("CATALOG_MIRROR_REFRESH", "1").strip().lower() in ("1", "true", "yes")
+
+    # Metafields
+    MF_NAMESPACE = "custom"
+    METAFIELD_SALE_START_DATE = "promo_sale_start_date"
+    METAFIELD_SALE_END_DATE = "promo_sale_end_date"
+    METAFIELD_PRICE_INCREASE_START = "promo_pi_start_date"
+    METAFIELD_PRICE_INCREASE_END = "promo_pi_end_date"
+    # PROMO_TARGET=collection: shop metafield (json) with the dates of vendor fallback scopes, keyed by vendor handle
+    METAFIELD_VENDOR_PROMOS = "promo_vendors"
+    # PROMO_TARGET=metaobject: metaobject type holding a scope's dates, product metafield referencing it
+    PROMO_METAOBJECT_TYPE = "promo_scope"
+    METAFIELD_PROMO_SCOPE = "promo_scope"
+
+
+PROMO_METAFIELD_KEYS = (
+    Config.METAFIELD_SALE_START_DATE,
+    Config.METAFIELD_SALE_END_DATE,
+    Config.METAFIELD_PRICE_INCREASE_START,
+    Config.METAFIELD_PRICE_INCREASE_END,
+)
+
+
+@dataclass(frozen=True)
+class ShopTarget:
+    name: str              # "" for the single SHOPIFY_SHOP setup; used in logs and per-shop file names
+    shop: str              # xxx.myshopify.com
+    token: str
+    admin_url: str = ""    # optional override of https://<shop> (mock server)
+    webhook_secret: str = ""
+
+    @property
+    def base_url(self) -> str:
+        return self.admin_url or f"https://{self.shop}"
+
+
+def _env_suffix(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name).upper()
+
+
+def shop_targets() -> List[ShopTarget]:
+    """The shops the sync writes to: SHOPIFY_SHOPS if set, else the single SHOPIFY_SHOP."""
+    names = [n.strip() for n in Config.SHOPIFY_SHOPS.split(",") if n.strip()]
+    if not names:
+        return [ShopTarget("", Config.SHOPIFY_SHOP, Config.SHOPIFY_TOKEN, Config.SHOPIFY_ADMIN_URL,
+                           Config.SHOPIFY_WEBHOOK_SECRET)]
+    targets = []
+    for name in names:
+        suffix = _env_suffix(name)
+        targets.append(ShopTarget(
+            name=name,
+            shop=os.getenv(f"SHOPIFY_SHOP_{suffix}", "").strip(),
+            token=os.getenv(f"SHOPIFY_TOKEN_{suffix}", "").strip(),
+            admin_url=os.getenv(f"SHOPIFY_ADMIN_URL_{suffix}", "").strip().rstrip("/"),
+            webhook_secret=os.getenv(f"SHOPIFY_WEBHOOK_SECRET_{suffix}", Config.SHOPIFY_WEBHOOK_SECRET).strip(),
+        ))
+    return targets
+
+
+def suffixed_path(path: str, suffix: str) -> str:
+    """vendor_product_counts.json + "us" -> vendor_product_counts_us.json"""
+    if not suffix or not path:
+        return path
+    root, ext = os.path.splitext(path)
+    if root.endswith(".json") or root.endswith(".jsonl"):
+        # catalog_snapshot.json.gz -> catalog_snapshot_us.json.gz
+        root, inner = os.path.splitext(root)
+        ext = inner + ext
+    return f"{root}_{suffix}{ext}"
+
+
+def shop_path(path: str, target: ShopTarget) -> str:
+    """Per-shop variant of an output/state path: vendor_product_counts.json -> vendor_product_counts_us.json"""
+    return suffixed_path(path, target.name)
+
+
+def require_env():
+    if Config.HTTP_CASSETTE_MODE == "replay":
+        # offline: responses come from the cassette, no shop credentials needed
+        return
+    for t in shop_targets():
+        if not t.shop or not t.token:
+            if t.name:
+                suffix = _env_suffix(t.name)
+                raise ValueError(f"Missing SHOPIFY_SHOP_{suffix} or SHOPIFY_TOKEN_{suffix} for shop {t.name!r} in SHOPIFY_SHOPS.")
+            raise ValueError("Missing SHOPIFY_SHOP or SHOPIFY_TOKEN. Put them in .env or environment variables.")
+
+
+def normalize(s: str) -> str:
+    return " ".join((s or "").strip().lower().split())
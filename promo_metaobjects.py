@@ -0,0 +1,213 @@
+import hashlib
+import json
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from promo_config import Config, PROMO_METAFIELD_KEYS, ShopTarget, shop_path
+from retail_promotions_to_shopify_metafields import VendorPlan, compute_scope_actions, resolve_scope_product_ids, scope_key
+from collection_promos import METAFIELDS_SET_LIMIT, vendor_handle
+from product_ids import product_gid
+from run_metrics import METRICS
+from shopify_client import ShopifyClient
+
+
+"""
+promo_metaobjects.py
+
+PROMO_TARGET=metaobject: one metaobject per scope (type PROMO_METAOBJECT_TYPE, default
+promo_scope) holds the scope's REAL dates; every product of the scope holds a single
+reference to it (custom.promo_scope, metaobject_reference).
+
+- date edits, extensions and early ends rewrite one metaobject, not every product
+- products are written only when they join a scope, move to another one or leave the
+  scopes of the plan (current members come from the metaobjects' referencedBy, so nothing
+  per product is read); a scope past CLEANUP_LOOKBACK_DAYS keeps its links and its
+  cleared dates
+- a product in several scopes references the last one in plan order, the scope that
+  product mode would have left its dates from
+- the metaobject and metafield definitions are created on the first real run
+
+The theme (Custom liquid.liquid) reads product.metafields.custom.promo_scope.value first,
+then the older per-product dates. Moving a shop over: see tools/migrate_promo_metaobjects.py.
+
+The first run links every product in a scope (25 per request); an interrupted run is
+simply run again, it only writes what is still missing.
+"""
+
+
+SCOPE_FIELD = "scope"
+
+
+def scope_handle(w: VendorPlan) -> str:
+    """Stable metaobject handle of a scope: vendor handle + hash of the scope key."""
+    digest = hashlib.sha1(scope_key(w).encode("utf-8")).hexdigest()[:10]
+    return f"{vendor_handle(w.vendor)[:80] or 'scope'}-{digest}"
+
+
+def scope_fields(w: VendorPlan, today: date) -> Dict[str, str]:
+    """Metaobject fields of a scope today; "" clears a date that must not show."""
+    actions = compute_scope_actions(w, today)
+    fields = {SCOPE_FIELD: scope_key(w)}
+    fields.update({k: "" for k in sorted(actions.to_delete)})
+    fields.update({k: d.isoformat() for k, d in sorted(actions.to_set.items())})
+    return fields
+
+
+def ensure_definitions(shop: ShopifyClient) -> str:
+    """The promo scope metaobject definition and the product reference metafield definition, created when missing."""
+    mo_type = Config.PROMO_METAOBJECT_TYPE
+    definition_id = shop.metaobject_definition_id(mo_type)
+    if definition_id is None:
+        definition_id = shop.metaobject_definition_create({
+            "type": mo_type,
+            "name": "Promo scope",
+            "displayNameKey": SCOPE_FIELD,
+            "access": {"storefront": "PUBLIC_READ"},
+            "fieldDefinitions": [{"key": SCOPE_FIELD, "name": "Scope", "type": "single_line_text_field"}]
+            + [{"key": k, "name": k.replace("_", " ").capitalize(), "type": "date"} for k in PROMO_METAFIELD_KEYS],
+        })
+        print(f"Created metaobject definition {mo_type} ({definition_id})")
+    if not shop.metafield_definition_exists("PRODUCT", Config.MF_NAMESPACE, Config.METAFIELD_PROMO_SCOPE):
+        shop.metafield_definition_create({
+            "name": "Promo scope",
+            "namespace": Config.MF_NAMESPACE,
+            "key": Config.METAFIELD_PROMO_SCOPE,
+            "type": "metaobject_reference",
+            "ownerType": "PRODUCT",
+            "validations": [{"name": "metaobject_definition_id", "value": definition_id}],
+        })
+        print(f"Created product metafield definition {Config.MF_NAMESPACE}.{Config.METAFIELD_PROMO_SCOPE}")
+    return definition_id
+
+
+def membership_changes(desired: Dict[int, str], current: Dict[int, str]) -> Tuple[Dict[int, str], List[int]]:
+    """(product id -> scope handle to link, product ids to unlink)"""
+    link = {pid: handle for pid, handle in desired.items() if current.get(pid) != handle}
+    unlink = sorted(pid for pid in current if pid not in desired)
+    return link, unlink
+
+
+def sync_metaobject_promos(vendor_plans: List[VendorPlan], today: date, target: ShopTarget,
+                           shop: Optional[ShopifyClient] = None, mirror=None) -> dict:
+    """PROMO_TARGET=metaobject counterpart of sync_shop(). Returns the shop's result summary."""
+    t0 = time.perf_counter()
+    shop = shop or ShopifyClient(target)
+    mo_type, ns, ref_key = Config.PROMO_METAOBJECT_TYPE, Config.MF_NAMESPACE, Config.METAFIELD_PROMO_SCOPE
+
+    with METRICS.span("owner_lookup"):
+        has_definition = shop.metaobject_definition_id(mo_type) is not None
+        existing = {m["handle"]: m for m in shop.list_metaobjects(mo_type)} if has_definition else {}
+    print(f"Promo scope metaobjects: {len(existing)} in the shop, {len(vendor_plans)} scopes in the plan")
+    if not has_definition:
+        print(f"  Metaobject definition {mo_type} does not exist yet" + ("" if Config.DRY_RUN else "; creating it"))
+    print("")
+
+    # dates: one metaobject per scope, written when a field differs
+    scopes: List[Tuple[VendorPlan, str, Dict[str, str], bool]] = []
+    for w in vendor_plans:
+        handle = scope_handle(w)
+        fields = scope_fields(w, today)
+        current = (existing.get(handle) or {}).get("fields") or {}
+        changed = handle not in existing or any((current.get(k) or "") != v for k, v in fields.items())
+        scopes.append((w, handle, fields, changed))
+
+    # membership: every product references the last scope (plan order) that contains it
+    desired: Dict[int, str] = {}
+    sizes: Dict[str, int] = {}
+    with METRICS.span("resolve"):
+        for w, handle, _, _ in scopes:
+            ids = resolve_scope_product_ids(w, shop, mirror)
+            sizes[handle] = len(ids)
+            for pid in ids:
+                desired[pid] = handle
+    # only the plan's own metaobjects: sync_daemon.py passes just the changed (and retired) scopes
+    current_refs: Dict[int, str] = {}
+    with METRICS.span("membership_lookup"):
+        for handle in dict.fromkeys(h for _, h, _, _ in scopes):
+            if handle in existing:
+                for pid in shop.products_referencing(existing[handle]["id"]):
+                    current_refs[pid] = handle
+    link, unlink = membership_changes(desired, current_refs)
+    METRICS.incr("scopes", len(vendor_plans))
+
+    for w, handle, fields, changed in scopes:
+        linking = sum(1 for h in link.values() if h == handle)
+        if changed or linking:
+            dates = ", ".join(f"{k}={v or '-'}" for k, v in fields.items() if k != SCOPE_FIELD)
+            print(f"[Scope] {scope_key(w)} -> {handle}: {'dates ' + dates if changed else 'dates unchanged'}; "
+                  f"{sizes[handle]} products, {linking} to link")
+    if unlink:
+        print(f"[Unlink] {len(unlink)} products are in no scope any more")
+
+    print("=== Done ===")
+    result = {"shop": target.name or target.shop, "scopes": len(vendor_plans), "promo_target": "metaobject"}
+    if target.name:
+        result["name"] = target.name
+    to_write = [s for s in scopes if s[3]]
+    if Config.DRY_RUN:
+        print("Dry run mode. No changes written.")
+        print(f"Would write {len(to_write)} metaobjects, link {len(link)} products, unlink {len(unlink)}")
+        out_file = shop_path("promo_metaobject_plan.json", target)
+        try:
+            with open(out_file, "w", encoding="utf-8") as fh:
+                json.dump([{"scope": scope_key(w), "handle": handle, "fields": fields, "changed": changed,
+                            "products": sizes[handle], "to_link": sum(1 for h in link.values() if h == handle)}
+                           for w, handle, fields, changed in scopes], fh, ensure_ascii=False, indent=2)
+            print(f"Wrote {out_file}")
+        except Exception as e:
+            print(f"Failed to write {out_file}: {e}")
+        result.update(metaobjects_to_write=len(to_write), products_to_link=len(link), products_to_unlink=len(unlink))
+        result["seconds"] = round(time.perf_counter() - t0, 1)
+        return result
+
+    ensure_definitions(shop)
+    ids = {handle: m["id"] for handle, m in existing.items()}
+    written = failed = linked = unlinked = 0
+    for w, handle, fields, changed in to_write:
+        try:
+            with METRICS.span("write"):
+                ids[handle] = shop.metaobject_upsert(mo_type, handle, fields)
+            written += 1
+            METRICS.incr("writes")
+        except Exception as e:
+            failed += 1
+            print(f"  Failed to write metaobject {handle} ({scope_key(w)}): {e}")
+
+    pending = [(pid, handle) for pid, handle in sorted(link.items()) if handle in ids]
+    for start in range(0, len(pending), METAFIELDS_SET_LIMIT):
+        chunk = pending[start:start + METAFIELDS_SET_LIMIT]
+        try:
+            with METRICS.span("write"):
+                shop.metafields_set([{"ownerId": product_gid(pid), "namespace": ns, "key": ref_key,
+                                      "type": "metaobject_reference", "value": ids[handle]} for pid, handle in chunk])
+            linked += len(chunk)
+            METRICS.incr("writes", len(chunk))
+        except Exception as e:
+            failed += len(chunk)
+            print(f"  Failed to link {len(chunk)} products: {e}")
+
+    if unlink:
+        with METRICS.span("delete_lookup"):
+            refs = shop.product_metafields([product_gid(pid) for pid in unlink], ns)
+        for gid, fields in refs.items():
+            mf = (fields or {}).get(ref_key)
+            if not mf:
+                continue
+            try:
+                with METRICS.span("delete"):
+                    shop.metafield_delete(mf["id"])
+                unlinked += 1
+                METRICS.incr("deletes")
+            except Exception as e:
+                failed += 1
+                print(f"  Failed to unlink {gid}: {e}")
+
+    print(f"Total metaobjects written: {written}")
+    print(f"Total products linked: {linked}")
+    print(f"Total products unlinked: {unlinked}")
+    result.update(metaobjects_written=written, products_linked=linked, products_unlinked=unlinked)
+    if failed:
+        result["failed"] = failed
+    result["seconds"] = round(time.perf_counter() - t0, 1)
+    return result
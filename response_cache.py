@@ -0,0 +1,252 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from promo_config import Config
+
+
+"""
+response_cache.py
+
+Two-tier cache of Shopify responses for the read-only lookups ShopifyClient marks as
+cacheable (graphql(..., cache=True): title searches, collection listings and lookups,
+productsCount batches, the vendor scan, REST counts). The sync's own reads (scope
+members, metafields, metaobjects) are never cached.
+
+- memory: LRU of RESPONSE_CACHE_MEMORY_ENTRIES responses, shared by every client in the process
+- disk:   SQLite at RESPONSE_CACHE_PATH ("" = memory only), zlib-compressed JSON, shared by
+          later runs and other processes; entries older than RESPONSE_CACHE_TTL_SECONDS are
+          ignored and purged, and the least recently used go first once the file holds more
+          than RESPONSE_CACHE_MAX_MB
+- key:    sha256 of (shop endpoint, query, variables), so shops and API versions never mix
+- tags:   the object types a query mentions (metafield, metaobject, product, collection),
+          kept in an index per tier (response_tags on disk). A successful mutation drops the
+          cached responses sharing a tag of MUTATION_TAGS; a mutation that changes nothing
+          cached (no tag, or no cached response with its tag) costs one indexed read and no
+          write. Mutations are never cached.
+- RESPONSE_CACHE_BYPASS=1 skips the lookups but still stores the fresh responses, which is
+  the way to refresh the cache.
+
+Disk errors (locked or unreadable file) never fail a run: the disk tier is skipped for
+that call.
+"""
+
+
+# older cache files are dropped and rebuilt (the cache holds nothing that cannot be fetched again)
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_responses_used_at ON responses(used_at);
+CREATE INDEX IF NOT EXISTS ix_responses_stored_at ON responses(stored_at);
+CREATE TABLE IF NOT EXISTS response_tags (
+    key TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (key, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_response_tags_tag ON response_tags(tag);
+"""
+
+TAG_WORDS = ("metafield", "metaobject", "product", "collection")
+
+# mutation -> object types whose cached responses it can change. Metafield and metaobject
+# writes change none of the cached lookups (nothing cacheable reads them), but say what they
+# touch; a mutation not listed here invalidates nothing.
+MUTATION_TAGS: Dict[str, Tuple[str, ...]] = {
+    "metafieldsSet": ("metafield",),
+    "metafieldDelete": ("metafield",),
+    "metafieldDefinitionCreate": ("metafield",),
+    "metaobjectUpsert": ("metaobject",),
+    "metaobjectDefinitionCreate": ("metaobject",),
+    "bulkOperationRunQuery": (),
+}
+
+_MUTATION_FIELD_RE = re.compile(r"(\w+)\s*\(")
+
+
+def query_tags(query: str) -> FrozenSet[str]:
+    """Object types a cached query reads."""
+    text = query.lower()
+    return frozenset(w for w in TAG_WORDS if w in text)
+
+
+def mutation_tags(query: str) -> FrozenSet[str]:
+    """Object types a mutation changes (MUTATION_TAGS of its fields, aliases included)."""
+    return frozenset(t for name in set(_MUTATION_FIELD_RE.findall(query)) for t in MUTATION_TAGS.get(name, ()))
+
+
+def cache_key(*parts) -> str:
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str = "", ttl_seconds: float = 21600.0, max_bytes: int = 200 * 1024 * 1024,
+                 memory_entries: int = 2000):
+        self.path = path
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.lock = threading.Lock()
+        self.memory: "OrderedDict[str, Tuple[float, dict, FrozenSet[str]]]" = OrderedDict()
+        self.memory_tags: Dict[str, Set[str]] = {}   # tag -> keys in memory
+        self.conn: Optional[sqlite3.Connection] = None
+        if path:
+            try:
+                self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    with self.conn:
+                        self.conn.execute("DROP TABLE IF EXISTS responses")
+                        self.conn.execute("DROP TABLE IF EXISTS response_tags")
+                    self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self.conn.executescript(SCHEMA)
+                with self.conn:
+                    expired = "SELECT key FROM responses WHERE stored_at < ?"
+                    cutoff = time.time() - self.ttl
+                    self.conn.execute(f"DELETE FROM response_tags WHERE key IN ({expired})", (cutoff,))
+                    self.conn.execute("DELETE FROM responses WHERE stored_at < ?", (cutoff,))
+            except sqlite3.Error as e:
+                print(f"Response cache {path} unavailable ({e}); caching in memory only")
+                self.conn = None
+
+    def close(self) -> None:
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self.memory.move_to_end(key)
+                    return entry[1]
+                self._forget(key)
+            if self.conn is None:
+                return None
+            try:
+                row = self.conn.execute("SELECT stored_at, body FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None or now - row[0] >= self.ttl:
+                    return None
+                value = json.loads(zlib.decompress(row[1]).decode("utf-8"))
+                tags = frozenset(t for (t,) in self.conn.execute("SELECT tag FROM response_tags WHERE key = ?", (key,)))
+                with self.conn:
+                    self.conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            except (sqlite3.Error, zlib.error, ValueError):
+                return None
+            self._remember(key, row[0], value, tags)
+            return value
+
+    def put(self, key: str, value: dict, tags: Iterable[str]) -> None:
+        now = time.time()
+        tags = frozenset(tags)
+        with self.lock:
+            self._remember(key, now, value, tags)
+            if self.conn is None:
+                return
+            body = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+            try:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO responses(key, stored_at, used_at, size, body) VALUES(?, ?, ?, ?, ?)",
+                        (key, now, now, len(body), body),
+                    )
+                    self.conn.execute("DELETE FROM response_tags WHERE key = ?", (key,))
+                    self.conn.executemany("INSERT INTO response_tags(key, tag) VALUES(?, ?)", [(key, t) for t in sorted(tags)])
+                    self._evict()
+            except sqlite3.Error:
+                pass
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        """Drop the responses that share a tag with a mutation (no tags: nothing)."""
+        tags = sorted(set(tags))
+        if not tags:
+            return
+        with self.lock:
+            for tag in tags:
+                for key in list(self.memory_tags.get(tag, ())):
+                    self._forget(key)
+            if self.conn is None:
+                return
+            marks = ",".join("?" * len(tags))
+            try:
+                if self.conn.execute(f"SELECT 1 FROM response_tags WHERE tag IN ({marks}) LIMIT 1", tags).fetchone() is None:
+                    return
+                with self.conn:
+                    tagged = f"SELECT key FROM response_tags WHERE tag IN ({marks})"
+                    self.conn.execute(f"DELETE FROM responses WHERE key IN ({tagged})", tags)
+                    self.conn.execute(f"DELETE FROM response_tags WHERE key IN ({tagged})", tags)
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            out = {"memory_entries": len(self.memory), "disk_entries": 0, "disk_bytes": 0}
+            if self.conn is not None:
+                try:
+                    n, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+                    out.update(disk_entries=n, disk_bytes=size)
+                except sqlite3.Error:
+                    pass
+            return out
+
+    def _remember(self, key: str, stored_at: float, value: dict, tags: FrozenSet[str]) -> None:
+        self._forget(key)
+        self.memory[key] = (stored_at, value, tags)
+        for tag in tags:
+            self.memory_tags.setdefault(tag, set()).add(key)
+        while len(self.memory) > self.memory_entries:
+            self._forget(next(iter(self.memory)))
+
+    def _forget(self, key: str) -> None:
+        entry = self.memory.pop(key, None)
+        for tag in entry[2] if entry is not None else ():
+            keys = self.memory_tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.memory_tags[tag]
+
+    def _evict(self) -> None:
+        """Least recently used first, down to 90% of max_bytes (inside the caller's transaction)."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY used_at").fetchall():
+            if total <= target:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.conn.execute("DELETE FROM response_tags WHERE key = ?", (key,))
+            total -= size
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def shared_response_cache() -> ResponseCache:
+    """One cache per RESPONSE_CACHE_PATH per process, shared by every ShopifyClient."""
+    path = Config.RESPONSE_CACHE_PATH
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path, Config.RESPONSE_CACHE_TTL_SECONDS, int(Config.RESPONSE_CACHE_MAX_MB * 1024 * 1024),
+                                  Config.RESPONSE_CACHE_MEMORY_ENTRIES)
+            _caches[path] = cache
+        return cache
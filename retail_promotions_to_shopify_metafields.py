@@ -1,20 +1,24 @@
-import os
 import time
-from dataclasses import dataclass
+import hashlib
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
 from datetime import datetime, date, timedelta
-from typing import Optional, Dict, List, Tuple, Set
+from typing import Optional, Dict, Iterable, List, Tuple, Set
 
-import pyodbc
-import requests
 import json
-from urllib.parse import quote_plus
 
-# Optional: load .env automatically if python-dotenv installed
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except Exception:
-    pass
+from promo_config import Config, ShopTarget, require_env, normalize, shop_path, shop_targets
+from shopify_client import ShopifyClient, ShopifyCountError
+from db_pool import DatabaseConnection
+from sync_journal import open_journal
+from sync_shards import owned_products, in_shard, parse_shard, shard_label, shard_path, write_shard_result
+from product_ids import ProductIdSet, product_gid
+from run_metrics import METRICS, write_run_metrics
+from run_profiler import profiling
+from time_budget import TimeBudget, read_leftover, run_budget, write_leftover
 
 
 """
@@ -38,59 +42,16 @@ Important constraints:
 - Python controls data existence:
     - Write metafields when today is inside display window
     - Delete metafields when today is outside display window
+
+Config lives in promo_config.py and ShopifyClient in shopify_client.py (imported from
+here by older scripts, so both names still resolve from this module). DatabaseConnection
+lives in db_pool.py (pooled; the ODBC driver is only imported when a connection is opened).
 """
 
 
 # =========================
-# Config (ENV)
+# Helpers
 # =========================
-class Config:
-    # Shopify
-    SHOPIFY_SHOP = os.getenv("SHOPIFY_SHOP", "").strip()
-    SHOPIFY_TOKEN = os.getenv("SHOPIFY_TOKEN", "").strip()
-    SHOPIFY_API_VERSION = os.getenv("SHOPIFY_API_VERSION", "2024-01").strip()
-    REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "30"))
-
-    # DB
-    DB_SERVER = os.getenv("DB_SERVER", r"sql01-union\sql2012").strip()
-    DB_NAME = os.getenv("DB_NAME", "Ecomm_DB_PROD").strip()
-    DB_USER = os.getenv("DB_USER", "ssis").strip()
-    DB_PASSWORD = os.getenv("DB_PASSWORD", "ssis").strip()
-
-    # X Y Z
-    # Default behavior (if env is missing): X/Y/Z = 5/15/5
-    # - X (X_DAYS_BEFORE_SALE_START): number of days before a Sale start to begin writing/keeping the metafield
-    # - Y (Y_DAYS_BEFORE_PI_START): number of days before a Price Increase start to begin writing/keeping the metafield
-    # - Z (Z_DAYS_AFTER_PI_START): when a Price Increase has no end date, the metafield is retained until Z days after the start
-    # Note: these settings only control whether the script writes/deletes Shopify metafields.
-    # The front-end display/formatting of dates is handled in Shopify Liquid templates.
-    Days_Before_Retail_Sale = int(os.getenv("X_DAYS_BEFORE_SALE_START", os.getenv("Days_Before_Retail_Sale", "5")))
-    Days_Before_Price_Increase = int(os.getenv("Y_DAYS_BEFORE_Price_Increase_START", os.getenv("Days_Before_Price_Increase", "15")))
-    Days_After_Price_Increase = int(os.getenv("Z_DAYS_AFTER_Price_Increase_START", os.getenv("Days_After_Price_Increase", "5")))
-    # Cleanup lookback window (days): include recently-ended promotions for delayed deletion
-    CLEANUP_LOOKBACK_DAYS = int(os.getenv("CLEANUP_LOOKBACK_DAYS", "7"))
-
-    # Behavior
-    DRY_RUN = os.getenv("DRY_RUN", "1").strip().lower() in ("1", "true", "yes")
-    DB_ONLY = os.getenv("DB_ONLY", "0").strip().lower() in ("1", "true", "yes")
-    SLEEP_BETWEEN_CALLS = float(os.getenv("SLEEP_BETWEEN_CALLS", "0.12"))
-
-    # Metafields
-    MF_NAMESPACE = "custom"
-    METAFIELD_SALE_START_DATE = "promo_sale_start_date"
-    METAFIELD_SALE_END_DATE = "promo_sale_end_date"
-    METAFIELD_PRICE_INCREASE_START = "promo_pi_start_date"
-    METAFIELD_PRICE_INCREASE_END = "promo_pi_end_date"
-
-def require_env():
-    if not Config.SHOPIFY_SHOP or not Config.SHOPIFY_TOKEN:
-        raise ValueError("Missing SHOPIFY_SHOP or SHOPIFY_TOKEN. Put them in .env or environment variables.")
-
-
-def normalize(s: str) -> str:
-    return " ".join((s or "").strip().lower().split())
-
-
 def to_date_only(v) -> Optional[date]:
     if v is None:
         return None
@@ -147,32 +108,17 @@ class VendorPlan:
             self.collection_ids = []
 
 
+@dataclass
+class ScopeActions:
+    sale_should_exist: bool
+    pi_should_exist: bool
+    to_set: Dict[str, date]     # metafield key -> REAL date, written on every product in scope
+    to_delete: Set[str]         # metafield keys that must not exist on products in scope
+
+
 # =========================
 # DB Access
 # =========================
-class DatabaseConnection:
-    def __init__(self):
-        self.conn = pyodbc.connect(
-            f"DRIVER={{SQL Server}};"
-            f"SERVER={Config.DB_SERVER};"
-            f"DATABASE={Config.DB_NAME};"
-            f"UID={Config.DB_USER};"
-            f"PWD={Config.DB_PASSWORD}"
-        )
-        self.cursor = self.conn.cursor()
-
-    def query(self, sql: str) -> List[Dict]:
-        self.cursor.execute(sql)
-        cols = [c[0] for c in self.cursor.description]
-        return [dict(zip(cols, row)) for row in self.cursor.fetchall()]
-
-    def close(self):
-        try:
-            self.cursor.close()
-        finally:
-            self.conn.close()
-
-
 class RetailPromotionsReader:
     """
     Reads promotions that should exist today based on display windows.
@@ -276,6 +222,17 @@ class RetailPromotionsReader:
             ))
         return rows
 
+    def table_checksum(self) -> Tuple[int, int]:
+        """(row count, checksum) of SM_Retail_Sales: cheap "did anything change" probe for sync_daemon.py."""
+        raw = self.db.query("""
+        SELECT
+            COUNT_BIG(*) AS N,
+            CHECKSUM_AGG(BINARY_CHECKSUM(ID, Vendor, CollectionID, EntryType, Date_of_Start, Date_of_End)) AS CS
+        FROM Ecomm_DB_PROD.dbo.SM_Retail_Sales
+        """)
+        r = raw[0] if raw else {}
+        return int(r.get("N") or 0), int(r.get("CS") or 0)
+
 
 # =========================
 # Aggregation
@@ -348,223 +305,79 @@ def aggregate_by_vendor(rows: List[RetailPromoRow], x: int, y: int, z: int) -> L
     return list(by_scope.values())
 
 
-# =========================
-# Shopify GraphQL Client
-# =========================
-class ShopifyClient:
-    @staticmethod
-    def to_collection_gid(collection_id: str) -> str:
-        cid = (collection_id or "").strip()
-        if cid.startswith("gid://"):
-            return cid
-        return f"gid://shopify/Collection/{cid}"
-
-    def __init__(self):
-        self.endpoint = f"https://{Config.SHOPIFY_SHOP}/admin/api/{Config.SHOPIFY_API_VERSION}/graphql.json"
-
-    def graphql(self, query: str, variables: Optional[dict] = None, retries: int = 4) -> dict:
-        headers = {
-            "X-Shopify-Access-Token": Config.SHOPIFY_TOKEN,
-            "Content-Type": "application/json",
-        }
-        payload = {"query": query, "variables": variables or {}}
-
-        last_err = None
-        for attempt in range(retries):
-            try:
-                resp = requests.post(self.endpoint, headers=headers, json=payload, timeout=Config.REQUEST_TIMEOUT)
+def compute_scope_actions(w: VendorPlan, today: date) -> ScopeActions:
+    sale_should_exist = (
+        w.sale_display_start is not None and w.sale_display_end is not None and
+        w.sale_display_start <= today <= w.sale_display_end
+    )
+    pi_should_exist = (
+        w.pi_display_start is not None and w.pi_display_end is not None and
+        w.pi_display_start <= today <= w.pi_display_end
+    )
 
-                if resp.status_code == 429 or resp.status_code in (500, 502, 503, 504):
-                    last_err = RuntimeError(f"Temporary Shopify error {resp.status_code}: {resp.text}")
-                    time.sleep(1.2 + attempt * 1.0)
-                    continue
+    # build set payloads using REAL dates (not display window)
+    to_set: Dict[str, date] = {}
+    if sale_should_exist and w.sale_real_start and w.sale_real_end:
+        to_set[Config.METAFIELD_SALE_START_DATE] = w.sale_real_start
+        to_set[Config.METAFIELD_SALE_END_DATE] = w.sale_real_end
 
-                if resp.status_code >= 400:
-                    raise RuntimeError(f"Shopify error {resp.status_code}: {resp.text}")
-
-                resp.raise_for_status()
-                data = resp.json()
-
-                if data.get("errors"):
-                    raise RuntimeError(f"GraphQL errors: {data['errors']}")
-
-                return data
-            except RuntimeError:
-                # Do not retry non-retryable API errors (e.g. 400/401/403/404/422)
-                # or GraphQL business errors. Raise immediately so the caller can see
-                # the real problem instead of waiting through unnecessary retries.
-                raise
-            except Exception as e:
-                # Retry only unexpected/network-type errors
-                last_err = e
-                if attempt < retries - 1:
-                    time.sleep(1.0 + attempt * 1.0)
-                
-        raise RuntimeError(f"Shopify GraphQL failed after retries: {last_err}")
-
-    def find_collection_by_title_exact(self, title: str) -> Optional[Tuple[str, str]]:
-        q = """
-        query($q: String!) {
-          collections(first: 20, query: $q) {
-            nodes { id title }
-          }
-        }
-        """
-        target = normalize(title)
+    if pi_should_exist and w.pi_real_start:
+        to_set[Config.METAFIELD_PRICE_INCREASE_START] = w.pi_real_start
+        if w.pi_real_end is not None:
+            to_set[Config.METAFIELD_PRICE_INCREASE_END] = w.pi_real_end
 
-        data = self.graphql(q, {"q": f'title:"{title}"'})
-        for n in data["data"]["collections"]["nodes"]:
-            if normalize(n.get("title", "")) == target:
-                return n["id"], n["title"]
+    # determine deletions:
+    # 1) if sale shouldn't exist -> delete sale keys
+    # 2) if pi shouldn't exist   -> delete pi keys
+    # 3) if pi should exist but DB has no PI end -> delete stale promo_pi_end_date only
+    to_delete: Set[str] = set()
 
-        data2 = self.graphql(q, {"q": f"title:{title}"})
-        for n in data2["data"]["collections"]["nodes"]:
-            if normalize(n.get("title", "")) == target:
-                return n["id"], n["title"]
+    if not sale_should_exist:
+        to_delete.update([Config.METAFIELD_SALE_START_DATE, Config.METAFIELD_SALE_END_DATE])
 
-        return None
+    if not pi_should_exist:
+        to_delete.update([Config.METAFIELD_PRICE_INCREASE_START, Config.METAFIELD_PRICE_INCREASE_END])
 
-    def list_product_ids_in_collection(self, collection_id: str) -> List[str]:
-        ids: List[str] = []
-        cursor = None
-        has_next = True
-        gql_collection_id = self.to_collection_gid(collection_id)
-
-        q = """
-        query($id: ID!, $cursor: String) {
-          collection(id: $id) {
-            products(first: 250, after: $cursor) {
-              pageInfo { hasNextPage endCursor }
-              nodes { id }
-            }
-          }
-        }
-        """
-        while has_next:
-            data = self.graphql(q, {"id": gql_collection_id, "cursor": cursor})
-            collection_data = data.get("data", {}).get("collection")
-            if not collection_data:
-                break
-            conn = collection_data["products"]
-            ids.extend([n["id"] for n in conn["nodes"]])
-            has_next = conn["pageInfo"]["hasNextPage"]
-            cursor = conn["pageInfo"]["endCursor"]
+    # IMPORTANT FIX:
+    # PI is active, but this PI has no real end date -> remove any old stale PI end metafield
+    if pi_should_exist and w.pi_real_end is None:
+        to_delete.add(Config.METAFIELD_PRICE_INCREASE_END)
 
-        return ids
+    return ScopeActions(sale_should_exist, pi_should_exist, to_set, to_delete)
 
-    def rest_count_products_in_collection(self, collection_id: str) -> int:
-        # collection_id may be a GraphQL gid like 'gid://shopify/Collection/12345'
-        # REST count endpoint expects the numeric id.
-        numeric_id = collection_id
-        try:
-            if collection_id.startswith("gid://"):
-                numeric_id = collection_id.rsplit("/", 1)[-1]
-        except Exception:
-            numeric_id = collection_id
 
-        url = f"https://{Config.SHOPIFY_SHOP}/admin/api/{Config.SHOPIFY_API_VERSION}/products/count.json?collection_id={quote_plus(numeric_id)}"
-        headers = {"X-Shopify-Access-Token": Config.SHOPIFY_TOKEN}
-        try:
-            resp = requests.get(url, headers=headers, timeout=Config.REQUEST_TIMEOUT)
-            resp.raise_for_status()
-            data = resp.json()
-            return int(data.get("count", 0))
-        except Exception:
-            return 0
+def scope_key(w: VendorPlan) -> str:
+    has_collection_id = len(w.collection_ids) > 0
+    return f"{w.vendor}::{'collection_id' if has_collection_id else 'vendor'}::{','.join(w.collection_ids)}"
 
-    def rest_count_products_by_vendor(self, vendor: str) -> int:
-        url = f"https://{Config.SHOPIFY_SHOP}/admin/api/{Config.SHOPIFY_API_VERSION}/products/count.json?vendor={quote_plus(vendor)}"
-        headers = {"X-Shopify-Access-Token": Config.SHOPIFY_TOKEN}
-        try:
-            resp = requests.get(url, headers=headers, timeout=Config.REQUEST_TIMEOUT)
-            resp.raise_for_status()
-            data = resp.json()
-            return int(data.get("count", 0))
-        except Exception:
-            return 0
-
-    def list_product_ids_by_vendor(self, vendor: str) -> List[str]:
-        ids: List[str] = []
-        cursor = None
-        has_next = True
-        target = normalize(vendor)
-
-        q = """
-        query($q: String!, $cursor: String) {
-          products(first: 250, after: $cursor, query: $q) {
-            pageInfo { hasNextPage endCursor }
-            nodes { id vendor }
-          }
-        }
-        """
-        qstr = f'vendor:"{vendor}"'
 
-        while has_next:
-            data = self.graphql(q, {"q": qstr, "cursor": cursor})
-            conn = data["data"]["products"]
+def plan_fingerprint(vendor_plans: List[VendorPlan]) -> str:
+    """
+    Stable hash of everything that decides what gets written/deleted.
+    Same plan on the same day -> same fingerprint -> a restarted run can reuse its journal.
+    """
+    items = sorted(json.dumps(asdict(w), sort_keys=True, default=str) for w in vendor_plans)
+    return hashlib.sha256("\n".join(items).encode("utf-8")).hexdigest()[:16]
 
-            for n in conn["nodes"]:
-                if normalize(n.get("vendor", "")) == target:
-                    ids.append(n["id"])
 
-            has_next = conn["pageInfo"]["hasNextPage"]
-            cursor = conn["pageInfo"]["endCursor"]
+def resolve_scope_product_ids(w: VendorPlan, shop: Optional[ShopifyClient] = None, catalog=None) -> ProductIdSet:
+    """
+    Product targeting priority:
+    1) if DB has CollectionID -> use it directly (deduped across collection ids)
+    2) otherwise fallback to all products by vendor
 
-        return ids
+    catalog: CatalogSnapshot / CatalogMirror to read from instead of paging the API.
+    Returns numeric ids in ascending order; .gids() for the API.
+    """
+    if w.collection_ids:
+        return ProductIdSet().union(*(
+            catalog.product_ids_in_collection(cid) if catalog is not None else shop.list_product_ids_in_collection(cid)
+            for cid in w.collection_ids
+        ))
 
-    def metafields_set(self, metafields: List[dict]) -> None:
-        m = """
-        mutation($m: [MetafieldsSetInput!]!) {
-          metafieldsSet(metafields: $m) {
-            metafields { id namespace key }
-            userErrors { field message }
-          }
-        }
-        """
-        data = self.graphql(m, {"m": metafields})
-        errs = data["data"]["metafieldsSet"]["userErrors"]
-        if errs:
-            raise RuntimeError(f"metafieldsSet userErrors: {errs}")
-
-    def get_metafield_ids(self, product_id: str, namespace: str, keys: List[str]) -> Dict[str, Optional[str]]:
-        q = """
-        query($id: ID!, $namespace: String!) {
-          product(id: $id) {
-            metafields(first: 100, namespace: $namespace) {
-              edges {
-                node {
-                  id
-                  key
-                  namespace
-                }
-              }
-            }
-          }
-        }
-        """
-        data = self.graphql(q, {"id": product_id, "namespace": namespace})
-        edges = data.get("data", {}).get("product", {}).get("metafields", {}).get("edges", []) or []
-
-        out = {k: None for k in keys}
-        for edge in edges:
-            node = edge.get("node") if edge else None
-            if node and node.get("key") in out:
-                out[node["key"]] = node.get("id")
-        return out
-
-    def metafield_delete(self, metafield_id: str) -> None:
-        m = """
-        mutation($id: ID!) {
-          metafieldDelete(input: {id: $id}) {
-            deletedId
-            userErrors { field message }
-          }
-        }
-        """
-        data = self.graphql(m, {"id": metafield_id})
-        errs = data["data"]["metafieldDelete"]["userErrors"]
-        if errs:
-            raise RuntimeError(f"metafieldDelete userErrors: {errs}")
+    if catalog is not None:
+        return catalog.product_ids_by_vendor(w.vendor)
+    return shop.list_product_ids_by_vendor(w.vendor)
 
 
 def build_date_metafield(owner_id: str, namespace: str, key: str, d: date) -> dict:
@@ -577,14 +390,255 @@ def build_date_metafield(owner_id: str, namespace: str, key: str, d: date) -> di
     }
 
 
+# =========================
+# Priority scheduling (real runs)
+# =========================
+PRIORITY_TIERS = ("appearing today", "disappearing today", "revalidation")
+
+
+def scope_tier(w: VendorPlan, today: date) -> int:
+    """0: a banner appears today (display start), 1: one disappears today (display end + 1), 2: no change today"""
+    if today in (w.sale_display_start, w.pi_display_start):
+        return 0
+    if any(end is not None and end + timedelta(days=1) == today for end in (w.sale_display_end, w.pi_display_end)):
+        return 1
+    return 2
+
+
+def scope_sizes(vendor_plans: List[VendorPlan], shop: ShopifyClient, mirror=None) -> Dict[int, Optional[int]]:
+    """plan index -> product count (None if unknown): mirror counts, or a few batched productsCount requests"""
+    if mirror is None:
+        try:
+            shop.count_products_by_vendors([w.vendor for w in vendor_plans if not w.collection_ids])
+            shop.count_products_in_collections([cid for w in vendor_plans for cid in w.collection_ids])
+        except ShopifyCountError as e:
+            print(f"Scope sizes unknown ({e}); scheduling by tier only")
+            return {}
+    sizes: Dict[int, Optional[int]] = {}
+    for i, w in enumerate(vendor_plans):
+        try:
+            if mirror is not None:
+                sizes[i] = (sum(mirror.count_in_collection(cid) for cid in w.collection_ids) if w.collection_ids
+                            else mirror.count_by_vendor(w.vendor))
+            else:
+                sizes[i] = (sum(shop.count_products_in_collection(cid) for cid in w.collection_ids) if w.collection_ids
+                            else shop.count_products_by_vendor(w.vendor))
+        except ShopifyCountError:
+            sizes[i] = None
+    return sizes
+
+
+def overlap_groups(vendor_plans: List[VendorPlan], scope_products: Iterable[List[ProductIdSet]] = ()) -> List[int]:
+    """
+    Group of every scope (the lowest plan index in it): scopes that may write the same product
+    share a group. Linked are scopes of the same vendor (vendor fallback vs its collections),
+    scopes with a CollectionID in common and, with scope_products (one list of per-scope
+    product ids per shop), scopes whose products intersect, whatever their vendor.
+    """
+    parent = list(range(len(vendor_plans)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def link(i: int, j: int) -> None:
+        a, b = find(i), find(j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    owners: Dict[Tuple[str, str], int] = {}
+    for i, w in enumerate(vendor_plans):
+        for token in [("vendor", normalize(w.vendor))] + [("collection", str(cid)) for cid in w.collection_ids]:
+            link(i, owners.setdefault(token, i))
+    for products in scope_products:
+        first: Dict[int, int] = {}
+        for i, ids in enumerate(products):
+            for pid in ids:
+                link(i, first.setdefault(pid, i))
+    return [find(i) for i in range(len(vendor_plans))]
+
+
+def schedule_scopes(vendor_plans: List[VendorPlan], today: date,
+                    sizes: Optional[Dict[int, Optional[int]]] = None,
+                    carried: Optional[Dict[str, int]] = None,
+                    groups: Optional[List[int]] = None) -> List[Tuple[int, int]]:
+    """
+    Order in which a real run applies the scopes: [(plan index, tier)], most urgent tier first.
+    carried: scope key -> tier of scopes a time-budgeted run left undone; they keep that tier
+    (a banner that should have appeared yesterday is still missing today).
+    groups: overlap_groups() of the plan (default: by vendor and CollectionID only).
+
+    Overlapping scopes (one overlap group) write the same products and the last one in plan
+    order wins on a shared product, so a group keeps its plan order: a scope is pulled up to
+    the most urgent tier among itself and the group's later scopes. Within a tier, each
+    group's run of scopes goes as one chain, smallest chain first (unknown sizes last), so
+    the most banners are live soonest. The end state equals plan order.
+    """
+    groups = groups if groups is not None else overlap_groups(vendor_plans)
+    tiers = [min(scope_tier(w, today), (carried or {}).get(scope_key(w), len(PRIORITY_TIERS))) for w in vendor_plans]
+    by_group: Dict[int, List[int]] = {}
+    for i in range(len(vendor_plans)):
+        by_group.setdefault(groups[i], []).append(i)
+    for indexes in by_group.values():
+        urgent = len(PRIORITY_TIERS)
+        for i in reversed(indexes):
+            urgent = min(urgent, tiers[i])
+            tiers[i] = urgent
+
+    chains: Dict[Tuple[int, int], List[int]] = {}
+    for i in range(len(vendor_plans)):
+        chains.setdefault((tiers[i], groups[i]), []).append(i)
+
+    def chain_order(item):
+        (tier, _), indexes = item
+        counts = [(sizes or {}).get(i) for i in indexes]
+        size = float("inf") if None in counts else sum(counts)
+        return tier, size, indexes[0]
+
+    return [(i, tier) for (tier, _), indexes in sorted(chains.items(), key=chain_order) for i in indexes]
+
+
+def leftover_entry(w: VendorPlan, tier: Optional[int], size: Optional[int] = None, products_done: int = 0) -> dict:
+    """One scope a time-budgeted run did not finish (see time_budget.write_leftover)."""
+    return {
+        "scope": scope_key(w),
+        "vendor": w.vendor,
+        "collection_ids": w.collection_ids,
+        "tier": PRIORITY_TIERS[tier] if tier is not None else None,
+        "products": size,
+        "products_done": products_done,
+    }
+
+
+# =========================
+# Offline dry run (catalog snapshot)
+# =========================
+def plan_offline_actions(vendor_plans: List[VendorPlan], snapshot, today: date) -> Tuple[List[dict], List[dict]]:
+    """
+    Exact per-product writes/deletes computed from a CatalogSnapshot (no API calls).
+
+    Scopes are applied in the same order as the real run, on a simulated copy of each
+    product's metafields, so a product covered by several scopes is counted correctly.
+    Returns (vendor_results, product_actions).
+    """
+    state: Dict[int, Dict[str, str]] = {}
+    vendor_results: List[dict] = []
+    product_actions: List[dict] = []
+
+    for w in vendor_plans:
+        actions = compute_scope_actions(w, today)
+        key = scope_key(w)
+
+        product_ids = resolve_scope_product_ids(w, catalog=snapshot)
+
+        will_write = 0
+        will_delete = 0
+        for pid in product_ids:
+            METRICS.incr("products")
+            current = state.get(pid)
+            if current is None:
+                current = snapshot.metafields(pid)
+                state[pid] = current
+
+            writes = {k: d.isoformat() for k, d in actions.to_set.items() if current.get(k) != d.isoformat()}
+            deletes = sorted(k for k in actions.to_delete if k in current)
+
+            current.update(writes)
+            for k in deletes:
+                current.pop(k, None)
+
+            if writes:
+                will_write += 1
+            if deletes:
+                will_delete += 1
+            if writes or deletes:
+                product_actions.append({"scope": key, "product": product_gid(pid), "set": writes, "delete": deletes})
+
+        vendor_results.append({
+            "vendor": w.vendor,
+            "used_collection_id": len(w.collection_ids) > 0,
+            "collection_ids": w.collection_ids,
+            "products_found": len(product_ids),
+            "will_write": will_write,
+            "will_delete": will_delete,
+        })
+
+    return vendor_results, product_actions
+
+
+def run_offline_dry_run(vendor_plans: List[VendorPlan], today: date, target: Optional[ShopTarget] = None) -> dict:
+    target = target or shop_targets()[0]
+    if Config.CATALOG_MIRROR:
+        from catalog_mirror import CatalogMirror
+        path = shop_path(Config.CATALOG_MIRROR, target)
+        print(f"Offline dry run from catalog mirror: {path}")
+        snapshot = CatalogMirror(path)
+    else:
+        from catalog_snapshot import load_snapshot
+        path = shop_path(Config.CATALOG_SNAPSHOT, target)
+        print(f"Offline dry run from catalog snapshot: {path}")
+        snapshot = load_snapshot(path)
+    age = snapshot.age_hours()
+    print(f"  Snapshot saved at {snapshot.saved_at.isoformat()} ({age:.1f} h old, {snapshot.product_count()} products)")
+    if age > Config.SNAPSHOT_MAX_AGE_HOURS:
+        print(f"  WARNING: snapshot is older than SNAPSHOT_MAX_AGE_HOURS={Config.SNAPSHOT_MAX_AGE_HOURS:g}. "
+              f"Results may not match Shopify. Refresh with: python catalog_snapshot.py")
+    print("")
+
+    vendor_results, product_actions = plan_offline_actions(vendor_plans, snapshot, today)
+    for r in vendor_results:
+        print(f"  DRY_RUN SUMMARY for {r['vendor']}: products found={r['products_found']}, will WRITE metafields on {r['will_write']} products, will DELETE metafields on {r['will_delete']} products")
+
+    print("=== Done ===")
+    print("Dry run mode (offline). No changes written.")
+    products_to_write = sum(1 for a in product_actions if a['set'])
+    metafields_to_delete = sum(len(a['delete']) for a in product_actions)
+    print(f"Total products to write: {products_to_write}")
+    print(f"Total metafields to delete: {metafields_to_delete}")
+    for out_file, data in (("vendor_product_counts.json", vendor_results), ("dry_run_actions.json", product_actions)):
+        out_file = shop_path(out_file, target)
+        try:
+            with open(out_file, "w", encoding="utf-8") as fh:
+                json.dump(data, fh, ensure_ascii=False, indent=2)
+            print(f"Wrote {out_file}")
+        except Exception as e:
+            print(f"Failed to write {out_file}: {e}")
+
+    return {
+        "shop": target.name or target.shop,
+        "scopes": len(vendor_results),
+        "products_to_write": products_to_write,
+        "metafields_to_delete": metafields_to_delete,
+    }
+
+
 # =========================
 # Main
 # =========================
-def main():
+def run_sync(rows: Optional[List[RetailPromoRow]] = None, shop: Optional[ShopifyClient] = None):
+    """
+    rows: promotions to use instead of reading SM_Retail_Sales (benchmarks / tests).
+    shop: client to reuse (cli.py passes one shared client and its in-run cache).
+
+    With SHOPIFY_SHOPS the plan is applied to every listed shop in parallel, see
+    sync_all_shops(); a passed client then serves only the shop it belongs to.
+    """
     print("DB_ONLY =", Config.DB_ONLY)
 
-    if not Config.DB_ONLY:
+    offline = Config.DRY_RUN and Config.DRY_RUN_OFFLINE
+    if not Config.DB_ONLY and not offline:
         require_env()
+    shard = parse_shard(Config.SYNC_SHARD)
+    if shard is not None and offline:
+        raise ValueError("SYNC_SHARD does not apply to DRY_RUN_OFFLINE (no API calls to split); run it unsharded.")
+    if Config.PROMO_TARGET not in ("product", "collection", "metaobject"):
+        raise ValueError(f"PROMO_TARGET must be product, collection or metaobject, got {Config.PROMO_TARGET!r}")
+    if shard is not None and Config.PROMO_TARGET != "product":
+        raise ValueError(f"SYNC_SHARD does not apply to PROMO_TARGET={Config.PROMO_TARGET} (writes per scope); run it unsharded.")
+    if offline and Config.PROMO_TARGET == "metaobject":
+        raise ValueError("DRY_RUN_OFFLINE does not apply to PROMO_TARGET=metaobject (memberships are read from the shop).")
 
     print("=== Retail Promotions -> Shopify Metafields (GraphQL) ===")
     today = datetime.now().date()
@@ -594,28 +648,38 @@ def main():
     print(f"PI_POST_DAYS  (Z) = {Config.Days_After_Price_Increase}")
     print(f"CLEANUP_LOOKBACK_DAYS = {Config.CLEANUP_LOOKBACK_DAYS}")
     print(f"DRY_RUN = {Config.DRY_RUN}")
+    if offline:
+        print(f"DRY_RUN_OFFLINE = {Config.DRY_RUN_OFFLINE}")
     print(f"DB_NAME = {Config.DB_NAME}")
+    if Config.PROMO_TARGET != "product":
+        print(f"PROMO_TARGET = {Config.PROMO_TARGET}")
+    if shard is not None:
+        print(f"SYNC_SHARD = {shard[0]}/{shard[1]} (SHARD_KEY = {Config.SHARD_KEY})")
     print("")
 
-    db = DatabaseConnection()
-    try:
-        reader = RetailPromotionsReader(db)
-        rows = reader.fetch_active_today(
-            Config.Days_Before_Retail_Sale,
-            Config.Days_Before_Price_Increase,
-            Config.Days_After_Price_Increase,
-            Config.CLEANUP_LOOKBACK_DAYS,
-        )
-    finally:
-        db.close()
+    if rows is None:
+        with METRICS.span("db_query"):
+            db = DatabaseConnection()
+            try:
+                reader = RetailPromotionsReader(db)
+                rows = reader.fetch_active_today(
+                    Config.Days_Before_Retail_Sale,
+                    Config.Days_Before_Price_Increase,
+                    Config.Days_After_Price_Increase,
+                    Config.CLEANUP_LOOKBACK_DAYS,
+                )
+            finally:
+                db.close()
 
     if not rows:
         print("No active/recent retail promotions found in DB. Nothing to write/delete.")
         print(f"Note: CLEANUP_LOOKBACK_DAYS = {Config.CLEANUP_LOOKBACK_DAYS}")
-        print("If a scheduled run was missed beyond the cleanup lookback window, stale metafields may remain in Shopify.")
+        print("If a scheduled run was missed beyond the cleanup lookback window, stale metafields may remain in Shopify;")
+        print("python stale_sweep.py finds and deletes them.")
         return
 
-    vendor_plans = aggregate_by_vendor(rows, Config.Days_Before_Retail_Sale, Config.Days_Before_Price_Increase, Config.Days_After_Price_Increase)
+    with METRICS.span("aggregate"):
+        vendor_plans = aggregate_by_vendor(rows, Config.Days_Before_Retail_Sale, Config.Days_Before_Price_Increase, Config.Days_After_Price_Increase)
     print(f"Vendors to process: {len(vendor_plans)}")
     print("")
 
@@ -629,7 +693,50 @@ def main():
             )
         return
 
-    shop = ShopifyClient()
+    targets = shop_targets()
+    budget = None if offline else run_budget()
+    if len(targets) == 1:
+        shops = [sync_shop(vendor_plans, today, shop.target if shop is not None else targets[0], shop, budget)]
+    else:
+        # a passed client (cli.py's shared one) is reused for its own shop; the others get their own
+        clients = {shop.target.name: shop} if shop is not None else None
+        shops = sync_all_shops(vendor_plans, today, targets, clients, budget)
+    return {"date": today.isoformat(), "plan": plan_fingerprint(vendor_plans), "dry_run": Config.DRY_RUN, "shops": shops}
+
+
+def sync_shop(vendor_plans: List[VendorPlan], today: date, target: ShopTarget,
+              shop: Optional[ShopifyClient] = None, budget: Optional[TimeBudget] = None) -> dict:
+    """
+    Apply the plan (or this worker's SYNC_SHARD of it) to one shop. Returns the shop's result summary.
+    budget: stop new work before its deadline and record the rest in sync_leftover.json.
+    """
+    shard = parse_shard(Config.SYNC_SHARD)
+    t0 = time.perf_counter()
+    if Config.PROMO_TARGET == "collection":
+        from collection_promos import sync_collection_promos
+        with METRICS.span("collection_promos"):
+            return sync_collection_promos(vendor_plans, today, target, shop)
+    if Config.DRY_RUN and Config.DRY_RUN_OFFLINE:
+        with METRICS.span("offline_plan"):
+            return run_offline_dry_run(vendor_plans, today, target)
+
+    shop = shop or ShopifyClient(target)
+
+    mirror = None
+    if Config.CATALOG_MIRROR:
+        from catalog_mirror import CatalogMirror
+        mirror_path = shop_path(Config.CATALOG_MIRROR, target)
+        mirror = CatalogMirror(mirror_path)
+        if Config.CATALOG_MIRROR_REFRESH:
+            with METRICS.span("mirror_refresh"):
+                mirror.refresh(shop)
+        print(f"Scope resolution from catalog mirror: {mirror_path}")
+        print("")
+
+    if Config.PROMO_TARGET == "metaobject":
+        from promo_metaobjects import sync_metaobject_promos
+        with METRICS.span("metaobject_promos"):
+            return sync_metaobject_promos(vendor_plans, today, target, shop, mirror)
 
     vendor_results = []
 
@@ -637,164 +744,491 @@ def main():
 
     updated_products = 0
     deleted_metafields = 0
+    skipped_from_journal = 0
+    failed_scopes: List[str] = []
+
+    journal = None
+    if not Config.DRY_RUN:
+        journal_dir = os.path.join(Config.SYNC_JOURNAL_DIR, target.name) if target.name else Config.SYNC_JOURNAL_DIR
+        if shard is not None:
+            journal_dir = os.path.join(journal_dir, shard_label(shard))
+        journal = open_journal(journal_dir, today, plan_fingerprint(vendor_plans), Config.SYNC_JOURNAL)
+        if journal is not None and journal.resumed_entries:
+            print(f"Resuming interrupted run from journal: {journal.path} ({journal.resumed_entries} confirmed entries)")
+            print("")
+
+    # Sharded real run: resolve every scope first and keep only the products this shard owns
+    shard_products: Optional[ProductIdSet] = None
+    scope_indexes: List[int] = []
+    if shard is not None and not Config.DRY_RUN:
+        with METRICS.span("shard_plan"):
+            shard_products, total_products = owned_products(
+                ((scope_key(w), resolve_scope_product_ids(w, shop, mirror)) for w in vendor_plans),
+                shard, Config.SHARD_KEY,
+            )
+        print(f"Shard {shard[0]}/{shard[1]}: {len(shard_products)} of {total_products} products (by {Config.SHARD_KEY})")
+        print("")
 
-    for w in vendor_plans:
-        vendor = w.vendor
-        print(f"[Vendor] {vendor}")
-        if w.collection_ids:
-            print(f"  CollectionID from DB: {', '.join(w.collection_ids)}")
+    # What a time-budgeted run left undone; its urgent scopes keep their tier in this run
+    leftover_path = shard_path(shop_path("dry_run_leftover.json" if Config.DRY_RUN else "sync_leftover.json", target), shard)
+    carried: Dict[str, int] = {}
+    if not Config.DRY_RUN:
+        for entry in (read_leftover(leftover_path) or {}).get("left", []):
+            if entry.get("tier") in PRIORITY_TIERS:
+                carried[entry["scope"]] = PRIORITY_TIERS.index(entry["tier"])
+        if carried:
+            print(f"Left over from the last run: {len(carried)} scopes ({leftover_path})")
+
+    # Real runs: banners appearing today first, then disappearances, then revalidation.
+    # Dry runs (nothing written) keep plan order, so the report reads like the plan.
+    order = [(i, None) for i in range(len(vendor_plans))]
+    tier_scopes: Dict[int, int] = {}
+    sizes: Dict[int, Optional[int]] = {}
+    resolved: Optional[List[ProductIdSet]] = None
+    if not Config.DRY_RUN and (Config.SYNC_PRIORITY or budget is not None):
+        with METRICS.span("schedule"):
+            if Config.SYNC_PRIORITY:
+                # every scope's products up front (the loop needs them anyway): exact sizes, and
+                # scopes of different vendors that share products keep their plan order
+                resolved = [resolve_scope_product_ids(w, shop, mirror) for w in vendor_plans]
+                sizes = {i: len(ids) for i, ids in enumerate(resolved)}
+                order = schedule_scopes(vendor_plans, today, sizes, carried, overlap_groups(vendor_plans, [resolved]))
+            else:
+                sizes = scope_sizes(vendor_plans, shop, mirror)
+        for _, tier in order:
+            if tier is None:
+                break
+            tier_scopes[tier] = tier_scopes.get(tier, 0) + 1
+        if tier_scopes:
+            print("Priority: " + ", ".join(f"{PRIORITY_TIERS[t]} {n}" for t, n in sorted(tier_scopes.items())) + " scopes")
+            print("")
+    tiers_done: Dict[str, float] = {}
+    current_tier = None
+
+    def in_this_shard(w: VendorPlan) -> bool:
+        # dry run: whole scopes are split between shards
+        return shard is None or not Config.DRY_RUN or in_shard(scope_key(w), shard)
+
+    # Time budget: dry runs count scopes, real runs products (scope sizes, unknown ones at the average)
+    progress = None
+    left: List[dict] = []
+    if budget is not None:
+        if Config.DRY_RUN:
+            progress = budget.track(sum(1 for w in vendor_plans if in_this_shard(w)), "scopes", target.name)
         else:
-            print("  CollectionID from DB: (empty)")
+            known = [s for s in sizes.values() if s is not None]
+            average = sum(known) / len(known) if known else 1.0
+            total = sum(average if sizes.get(i) is None else sizes[i] for i in range(len(vendor_plans)))
+            if shard_products is not None and total_products:
+                total *= len(shard_products) / total_products
+            progress = budget.track(total, "products", target.name)
+
+    if Config.DRY_RUN and mirror is None:
+        # all scope counts in a few batched productsCount requests; the loop reads them from the cache
+        counted = [w for w in vendor_plans if shard is None or in_shard(scope_key(w), shard)]
+        try:
+            with METRICS.span("count_prefetch"):
+                shop.count_products_by_vendors([w.vendor for w in counted if not w.collection_ids])
+                shop.count_products_in_collections([cid for w in counted for cid in w.collection_ids])
+        except ShopifyCountError as e:
+            print(f"Batched product counts failed ({e}); counting per scope")
+            print("")
+
+    def left_after(position: int) -> List[dict]:
+        return [leftover_entry(vendor_plans[i], t, sizes.get(i)) for i, t in order[position:]
+                if in_this_shard(vendor_plans[i]) and not (journal is not None and journal.is_scope_done(scope_key(vendor_plans[i])))]
+
+    with METRICS.span("scopes"):
+        for position, (index, tier) in enumerate(order):
+            w = vendor_plans[index]
+            if progress is not None and in_this_shard(w) and progress.should_stop():
+                left = left_after(position)
+                break
+            if tier != current_tier:
+                if current_tier is not None:
+                    tiers_done[PRIORITY_TIERS[current_tier]] = round(time.perf_counter() - t0, 1)
+                current_tier = tier
+                if tier is not None:
+                    print(f"=== {PRIORITY_TIERS[tier]}: {tier_scopes[tier]} scopes "
+                          f"({time.perf_counter() - t0:.0f}s into the run) ===", flush=True)
+            if not in_this_shard(w):
+                continue
+            with METRICS.span("scope", label=scope_key(w)):
+                vendor = w.vendor
+                print(f"[Vendor] {vendor}")
+                if w.collection_ids:
+                    print(f"  CollectionID from DB: {', '.join(w.collection_ids)}")
+                else:
+                    print("  CollectionID from DB: (empty)")
 
-        print(f"  Sale display: {w.sale_display_start} -> {w.sale_display_end}")
-        print(f"  Sale REAL:    {w.sale_real_start} -> {w.sale_real_end}")
-        print(f"  PI display:   {w.pi_display_start} -> {w.pi_display_end}")
-        print(f"  PI REAL:      {w.pi_real_start} -> {w.pi_real_end}")
+                print(f"  Sale display: {w.sale_display_start} -> {w.sale_display_end}")
+                print(f"  Sale REAL:    {w.sale_real_start} -> {w.sale_real_end}")
+                print(f"  PI display:   {w.pi_display_start} -> {w.pi_display_end}")
+                print(f"  PI REAL:      {w.pi_real_start} -> {w.pi_real_end}")
 
-        sale_should_exist = (
-            w.sale_display_start is not None and w.sale_display_end is not None and
-            w.sale_display_start <= today <= w.sale_display_end
-        )
-        pi_should_exist = (
-            w.pi_display_start is not None and w.pi_display_end is not None and
-            w.pi_display_start <= today <= w.pi_display_end
-        )
+                actions = compute_scope_actions(w, today)
 
-        # Product targeting priority:
-        # 1) if DB has CollectionID -> use it directly
-        # 2) otherwise fallback to all products by vendor
-        has_collection_id = len(w.collection_ids) > 0
-        cache_key = f"{vendor}::{'collection_id' if has_collection_id else 'vendor'}::{','.join(w.collection_ids)}"
+                # Product targeting priority:
+                # 1) if DB has CollectionID -> use it directly
+                # 2) otherwise fallback to all products by vendor
+                has_collection_id = len(w.collection_ids) > 0
+                cache_key = scope_key(w)
 
-        if cache_key in product_cache:
-            product_count = product_cache[cache_key]
-        else:
-            if has_collection_id:
-                if Config.DRY_RUN:
-                    product_count = sum(shop.rest_count_products_in_collection(cid) for cid in w.collection_ids)
+                if journal is not None and journal.is_scope_done(cache_key):
+                    print("  Already completed in journal. Skip.")
+                    if progress is not None and sizes.get(index):
+                        progress.total -= sizes[index]  # no work left there: not part of the projection
+                    continue
+
+                product_ids = ProductIdSet()
+                count_error = None
+                with METRICS.span("resolve"):
+                    if not Config.DRY_RUN:
+                        # collect product ids for this vendor (respecting CollectionID priority)
+                        product_ids = resolved[index] if resolved is not None else resolve_scope_product_ids(w, shop, mirror)
+                        product_cache[cache_key] = len(product_ids)
+                        if shard_products is not None:
+                            product_ids = product_ids & shard_products
+
+                    if cache_key in product_cache:
+                        product_count = product_cache[cache_key]
+                    else:
+                        try:
+                            if mirror is not None:
+                                product_count = len(resolve_scope_product_ids(w, catalog=mirror))
+                            elif has_collection_id:
+                                product_count = sum(shop.count_products_in_collection(cid) for cid in w.collection_ids)
+                            else:
+                                product_count = shop.count_products_by_vendor(vendor)
+                        except ShopifyCountError as e:
+                            # reported as such instead of a silent 0
+                            count_error = str(e)
+                            product_count = 0
+
+                        product_cache[cache_key] = product_count
+
+                if has_collection_id:
+                    print("  Product scope source: CollectionID")
                 else:
-                    product_ids: Set[str] = set()
-                    for cid in w.collection_ids:
-                        product_ids.update(shop.list_product_ids_in_collection(cid))
-                    product_count = len(product_ids)
-                print("  Product scope source: CollectionID")
-            else:
-                print("  Product scope source: Vendor fallback (no CollectionID)")
-                product_count = shop.rest_count_products_by_vendor(vendor) if Config.DRY_RUN else len(shop.list_product_ids_by_vendor(vendor))
+                    print("  Product scope source: Vendor fallback (no CollectionID)")
 
-            product_cache[cache_key] = product_count
+                if count_error:
+                    print(f"  Products found: unknown ({count_error})")
+                else:
+                    print(f"  Products found: {product_count}")
+                METRICS.incr("scopes")
 
-        print(f"  Products found: {product_count}")
+                # If DRY_RUN we compute per-vendor write/delete counts using product_count (no per-product requests)
+                if Config.DRY_RUN:
+                    will_write = 0
+                    will_delete = 0
+
+                    # payload exists for a product if sale_should_exist with real dates OR pi_should_exist with pi_real_start
+                    if actions.to_set:
+                        will_write = product_count
+
+                    # keys_to_delete exist for a product if not sale_should_exist OR not pi_should_exist
+                    if actions.to_delete:
+                        will_delete = product_count
+
+                    print(f"  DRY_RUN SUMMARY for {vendor}: products found={product_count}, will WRITE metafields on {will_write} products, will DELETE metafields on {will_delete} products")
+                    entry = {
+                        "vendor": vendor,
+                        "used_collection_id": has_collection_id,
+                        "collection_ids": w.collection_ids,
+                        "products_found": product_count,
+                        "will_write": will_write,
+                        "will_delete": will_delete
+                    }
+                    if count_error:
+                        entry["count_error"] = count_error
+                    vendor_results.append(entry)
+                    scope_indexes.append(index)
+                    if progress is not None:
+                        progress.advance()
+                    # skip per-product processing in dry-run
+                    continue
 
-        # If DRY_RUN we compute per-vendor write/delete counts using product_count (no per-product requests)
-        if Config.DRY_RUN:
-            will_write = 0
-            will_delete = 0
-
-            # payload exists for a product if sale_should_exist with real dates OR pi_should_exist with pi_real_start
-            payload_will_exist = (sale_should_exist and w.sale_real_start and w.sale_real_end) or (pi_should_exist and w.pi_real_start)
-            if payload_will_exist:
-                will_write = product_count
-
-            # keys_to_delete exist for a product if not sale_should_exist OR not pi_should_exist
-            keys_will_delete = (not sale_should_exist) or (not pi_should_exist) or (pi_should_exist and w.pi_real_end is None)
-            if keys_will_delete:
-                will_delete = product_count
-
-            print(f"  DRY_RUN SUMMARY for {vendor}: products found={product_count}, will WRITE metafields on {will_write} products, will DELETE metafields on {will_delete} products")
-            vendor_results.append({
-                "vendor": vendor,
-                "used_collection_id": has_collection_id,
-                "collection_ids": w.collection_ids,
-                "products_found": product_count,
-                "will_write": will_write,
-                "will_delete": will_delete
-            })
-            # skip per-product processing in dry-run
-            continue
+                # Non-dry-run: perform per-product reads and safe writes/deletes using real DB dates
+                print("")
+
+                print(f"  Processing {len(product_ids)} products for writes/deletes")
+
+                # per-product operations
+                scope_failed = False
+                stopped_at = None
+                for n, pid in enumerate(product_ids.gids()):
+                    if progress is not None:
+                        if progress.should_stop():
+                            stopped_at = n
+                            break
+                        progress.advance()
+                    METRICS.incr("products")
+                    if journal is not None and journal.is_done(cache_key, pid, "set") and journal.is_done(cache_key, pid, "delete"):
+                        skipped_from_journal += 1
+                        continue
+
+                    # build set payloads using REAL dates (not display window)
+                    to_set = [build_date_metafield(pid, Config.MF_NAMESPACE, k, d) for k, d in actions.to_set.items()]
+
+                    # set metafields if any
+                    if to_set and not (journal is not None and journal.is_done(cache_key, pid, "set")):
+                        try:
+                            with METRICS.span("write"):
+                                shop.metafields_set(to_set)
+                            updated_products += 1
+                            METRICS.incr("writes")
+                            if journal is not None:
+                                journal.record(cache_key, pid, "set")
+                        except Exception as e:
+                            scope_failed = True
+                            print(f"  Failed to set metafields for {pid}: {e}")
+                    elif not to_set and journal is not None:
+                        journal.record(cache_key, pid, "set")
+
+                    # determine deletions (see compute_scope_actions)
+                    keys_to_check = actions.to_delete
+
+                    if keys_to_check and not (journal is not None and journal.is_done(cache_key, pid, "delete")):
+                        try:
+                            with METRICS.span("delete_lookup"):
+                                existing = shop.get_metafield_ids(pid, Config.MF_NAMESPACE, list(keys_to_check))
+                            all_deleted = True
+                            for k, mid in existing.items():
+                                if mid:
+                                    try:
+                                        with METRICS.span("delete"):
+                                            shop.metafield_delete(mid)
+                                        deleted_metafields += 1
+                                        METRICS.incr("deletes")
+                                    except Exception as e:
+                                        all_deleted = False
+                                        scope_failed = True
+                                        print(f"  Failed to delete metafield {k} ({mid}) for {pid}: {e}")
+                            if all_deleted and journal is not None:
+                                journal.record(cache_key, pid, "delete")
+                        except Exception as e:
+                            scope_failed = True
+                            print(f"  Failed to fetch metafields for {pid}: {e}")
+                    elif not keys_to_check and journal is not None:
+                        journal.record(cache_key, pid, "delete")
+
+                if stopped_at is not None:
+                    # time budget: the rest of this scope and everything after it
+                    left = [leftover_entry(w, tier, sizes.get(index), stopped_at)] + left_after(position + 1)
+                    break
+
+                # only a scope without failures is skipped as a whole on restart
+                if scope_failed:
+                    failed_scopes.append(cache_key)
+                elif journal is not None:
+                    journal.record_scope_done(cache_key)
+                sys.stdout.flush()
+
+    if current_tier is not None:
+        tiers_done[PRIORITY_TIERS[current_tier]] = round(time.perf_counter() - t0, 1)
 
-        # Non-dry-run: perform per-product reads and safe writes/deletes using real DB dates
-        print("")
+    print("=== Done ===")
+    result = {"shop": target.name or target.shop, "scopes": len(vendor_plans)}
+    if target.name:
+        result["name"] = target.name
+    if Config.DRY_RUN:
+        print("Dry run mode. No changes written.")
+        out_file = shard_path(shop_path("vendor_product_counts.json", target), shard)
+        try:
+            with open(out_file, "w", encoding="utf-8") as fh:
+                json.dump(vendor_results, fh, ensure_ascii=False, indent=2)
+            print(f"Wrote {out_file}")
+        except Exception as e:
+            print(f"Failed to write {out_file}: {e}")
+        result["products_to_write"] = sum(r["will_write"] for r in vendor_results)
+        result["products_to_delete"] = sum(r["will_delete"] for r in vendor_results)
+        if shard is not None:
+            # tools/merge_shards.py rebuilds the full vendor_product_counts.json in plan order
+            result["scopes"] = len(vendor_results)
+            result["vendor_results"] = vendor_results
+            result["scope_indexes"] = scope_indexes
+    else:
+        print(f"Total products updated: {updated_products}")
+        print(f"Total metafields deleted: {deleted_metafields}")
+        if skipped_from_journal:
+            print(f"Products skipped (already confirmed in journal): {skipped_from_journal}")
+        if failed_scopes:
+            print(f"Scopes with failed writes/deletes: {len(failed_scopes)}")
+        if journal is not None:
+            if left:
+                journal.close()  # a same-day re-run resumes where this one stopped
+            else:
+                journal.complete()
+        result.update(products_updated=updated_products, metafields_deleted=deleted_metafields,
+                      skipped_from_journal=skipped_from_journal)
+        if failed_scopes:
+            # scope keys: sync_daemon.py does not record these as applied
+            result["failed_scopes"] = failed_scopes
+        if shard_products is not None:
+            result["products_in_shard"] = len(shard_products)
+        if tiers_done:
+            # seconds into the run at which each priority tier was finished
+            result["tiers_done"] = tiers_done
+    if progress is not None:
+        result["time_budget"] = progress.summary()
+    if left:
+        result["left_scopes"] = len(left)
+        result["left_scope_keys"] = [e["scope"] for e in left]
+        print(f"Time budget: {len(left)} scopes left for the next run")
+    try:
+        write_leftover(leftover_path, {
+            "date": today.isoformat(),
+            "plan": plan_fingerprint(vendor_plans),
+            "shop": target.name or target.shop,
+            "shard": shard_label(shard) if shard else None,
+            "dry_run": Config.DRY_RUN,
+            "time_budget": progress.summary(),
+            "left": left,
+        } if left else None)
+    except OSError as e:
+        print(f"Failed to write {leftover_path}: {e}")
+    result["seconds"] = round(time.perf_counter() - t0, 1)
+    return result
 
-        # collect product ids for this vendor (respecting CollectionID priority)
-        product_ids: List[str] = []
-        if has_collection_id:
-            seen: Set[str] = set()
-            for cid in w.collection_ids:
-                ids = shop.list_product_ids_in_collection(cid)
-                for pid in ids:
-                    if pid not in seen:
-                        seen.add(pid)
-                        product_ids.append(pid)
-        else:
-            product_ids = shop.list_product_ids_by_vendor(vendor)
 
-        print(f"  Processing {len(product_ids)} products for writes/deletes")
+# =========================
+# Multi-shop fan-out
+# =========================
+_shop_label = threading.local()
 
-        # per-product operations
-        for pid in product_ids:
-            # build set payloads using REAL dates (not display window)
-            to_set = []
-            if sale_should_exist and w.sale_real_start and w.sale_real_end:
-                to_set.append(build_date_metafield(pid, Config.MF_NAMESPACE, Config.METAFIELD_SALE_START_DATE, w.sale_real_start))
-                to_set.append(build_date_metafield(pid, Config.MF_NAMESPACE, Config.METAFIELD_SALE_END_DATE, w.sale_real_end))
-
-            if pi_should_exist and w.pi_real_start:
-                to_set.append(build_date_metafield(pid, Config.MF_NAMESPACE, Config.METAFIELD_PRICE_INCREASE_START, w.pi_real_start))
-                if w.pi_real_end is not None:
-                    to_set.append(build_date_metafield(pid, Config.MF_NAMESPACE, Config.METAFIELD_PRICE_INCREASE_END, w.pi_real_end))
-
-            # set metafields if any
-            if to_set:
-                try:
-                    shop.metafields_set(to_set)
-                    updated_products += 1
-                except Exception as e:
-                    print(f"  Failed to set metafields for {pid}: {e}")
 
-            # determine deletions:
-            # 1) if sale shouldn't exist -> delete sale keys
-            # 2) if pi shouldn't exist   -> delete pi keys
-            # 3) if pi should exist but DB has no PI end -> delete stale promo_pi_end_date only
-            keys_to_check: Set[str] = set()
+class _ShopPrefixedStdout:
+    """
+    sys.stdout while shops sync in parallel: each shop thread's output is written in
+    whole lines prefixed with [<shop>], so the interleaved log stays readable.
+    """
 
-            if not sale_should_exist:
-                keys_to_check.update([Config.METAFIELD_SALE_START_DATE, Config.METAFIELD_SALE_END_DATE])
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._pending: Dict[int, str] = {}
+
+    def write(self, text: str) -> int:
+        name = getattr(_shop_label, "name", None)
+        if not name:
+            with self._lock:
+                return self.stream.write(text)
+        tid = threading.get_ident()
+        with self._lock:
+            buf = self._pending.get(tid, "") + text
+            lines = buf.split("\n")
+            self._pending[tid] = lines.pop()
+            for line in lines:
+                self.stream.write(f"[{name}] {line}\n")
+        return len(text)
+
+    def flush(self) -> None:
+        name = getattr(_shop_label, "name", None)
+        with self._lock:
+            rest = self._pending.pop(threading.get_ident(), "")
+            if rest:
+                self.stream.write(f"[{name}] {rest}\n")
+            self.stream.flush()
+
+    def __getattr__(self, item):
+        return getattr(self.stream, item)
+
+
+def _sync_shop_thread(vendor_plans: List[VendorPlan], today: date, target: ShopTarget,
+                      shop: Optional[ShopifyClient] = None, budget: Optional[TimeBudget] = None) -> dict:
+    _shop_label.name = target.name
+    try:
+        with METRICS.span("shop", label=target.name):
+            return sync_shop(vendor_plans, today, target, shop, budget)
+    finally:
+        sys.stdout.flush()
+        _shop_label.name = None
 
-            if not pi_should_exist:
-                keys_to_check.update([Config.METAFIELD_PRICE_INCREASE_START, Config.METAFIELD_PRICE_INCREASE_END])
 
-            # IMPORTANT FIX:
-            # PI is active, but this PI has no real end date -> remove any old stale PI end metafield
-            if pi_should_exist and w.pi_real_end is None:
-                keys_to_check.add(Config.METAFIELD_PRICE_INCREASE_END)
+def sync_all_shops(vendor_plans: List[VendorPlan], today: date, targets: List[ShopTarget],
+                   clients: Optional[Dict[str, ShopifyClient]] = None,
+                   budget: Optional[TimeBudget] = None) -> List[dict]:
+    """
+    One plan (one SM_Retail_Sales read + aggregation), every shop in SHOPIFY_SHOPS in parallel.
+    Each shop has its own client (HTTP session, cost budget, cache), catalog mirror, journal
+    and output files, so wall time is close to the slowest shop rather than the sum.
 
-            if keys_to_check:
+    clients: target name -> client to reuse (sync_daemon.py keeps them warm between runs).
+    """
+    clients = clients or {}
+    print(f"Shops: {', '.join(f'{t.name} ({t.shop})' for t in targets)}")
+    print("")
+
+    results: Dict[str, dict] = {}
+    t0 = time.perf_counter()
+    stdout = sys.stdout
+    sys.stdout = _ShopPrefixedStdout(stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="shop") as pool:
+            futures = {pool.submit(_sync_shop_thread, vendor_plans, today, t, clients.get(t.name), budget): t for t in targets}
+            for fut in as_completed(futures):
+                t = futures[fut]
                 try:
-                    existing = shop.get_metafield_ids(pid, Config.MF_NAMESPACE, list(keys_to_check))
-                    for k, mid in existing.items():
-                        if mid:
-                            try:
-                                shop.metafield_delete(mid)
-                                deleted_metafields += 1
-                            except Exception as e:
-                                print(f"  Failed to delete metafield {k} ({mid}) for {pid}: {e}")
+                    results[t.name] = fut.result()
                 except Exception as e:
-                    print(f"  Failed to fetch metafields for {pid}: {e}")
+                    results[t.name] = {"shop": t.name, "error": f"{type(e).__name__}: {e}"}
+                    print(f"Shop {t.name} failed: {e}")
+    finally:
+        sys.stdout = stdout
 
-    print("=== Done ===")
-    if Config.DRY_RUN:
-        print("Dry run mode. No changes written.")
-        try:
-            with open("vendor_product_counts.json", "w", encoding="utf-8") as fh:
-                json.dump(vendor_results, fh, ensure_ascii=False, indent=2)
-            print("Wrote vendor_product_counts.json")
-        except Exception as e:
-            print(f"Failed to write vendor_product_counts.json: {e}")
-    else:
-        print(f"Total products updated: {updated_products}")
-        print(f"Total metafields deleted: {deleted_metafields}")
+    ordered = [results[t.name] for t in targets]
+    print("")
+    print(f"=== Shops ({time.perf_counter() - t0:.1f}s wall) ===")
+    for r in ordered:
+        if r.get("error"):
+            print(f"  {r['shop']:<16} FAILED {r['error']}")
+            continue
+        detail = ", ".join(f"{k}={v}" for k, v in r.items()
+                           if k not in ("shop", "name", "seconds", "vendor_results", "scope_indexes",
+                                         "failed_scopes", "left_scope_keys"))
+        print(f"  {r['shop']:<16} {r.get('seconds', 0.0):>8.1f}s  {detail}")
+
+    out_file = "sync_shop_results.json"
+    try:
+        with open(out_file, "w", encoding="utf-8") as fh:
+            json.dump(ordered, fh, ensure_ascii=False, indent=2)
+        print(f"Wrote {out_file}")
+    except Exception as e:
+        print(f"Failed to write {out_file}: {e}")
+
+    failed = [r["shop"] for r in ordered if r.get("error")]
+    if failed:
+        raise RuntimeError(f"Sync failed for {len(failed)} of {len(targets)} shops: {', '.join(failed)}")
+    return ordered
+
+
+def main(rows: Optional[List[RetailPromoRow]] = None, shop: Optional[ShopifyClient] = None):
+    shard = parse_shard(Config.SYNC_SHARD)
+    run_name = "sync" if not Config.DRY_RUN else "dry_run"
+    if shard is not None:
+        run_name += f"_{shard_label(shard)}"
+    run = None
+    try:
+        with profiling(run_name):
+            run = run_sync(rows, shop)
+    finally:
+        # also on failure: a crashed run's request/retry/throttle numbers are the interesting ones
+        write_run_metrics(run_name)
+        if shard is not None:
+            write_shard_result(Config.SYNC_SHARD_DIR, shard, Config.SHARD_KEY, run, METRICS.summary(run_name))
+    return run
 
 
 if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Retail promotions -> Shopify metafields")
+    ap.add_argument("--shard", default=Config.SYNC_SHARD, metavar="i/N",
+                    help="process shard i of N (same as SYNC_SHARD); merge with tools/merge_shards.py")
+    ap.add_argument("--time-budget", default=Config.TIME_BUDGET, metavar="DURATION",
+                    help="e.g. 90m or 1h30m (same as TIME_BUDGET): stop new work before it runs out, "
+                         "record the rest in sync_leftover.json")
+    args = ap.parse_args()
+    Config.SYNC_SHARD = args.shard
+    Config.TIME_BUDGET = args.time_budget
     main()
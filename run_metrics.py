@@ -0,0 +1,387 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+"""
+run_metrics.py
+
+Operational metrics for one run (sync, reports, exports).
+
+Recorded by ShopifyClient and DatabaseConnection:
+- requests per endpoint (GraphQL root field, REST path, DB) and status
+- latency histogram per endpoint
+- retries per endpoint, total throttle wait time
+- GraphQL cost (requested / actual) and the lowest throttle bucket level seen
+
+Recorded by the scripts:
+- items processed (products, writes, deletes, ...) -> per-second rates
+- timing spans around run phases (db_query, aggregate, scopes/scope/write, ...):
+      with METRICS.span("scope", label=scope_key(w)):
+  nested spans are totalled per path ("scopes/scope/write"); the slowest labelled
+  instances of each path are kept so a single slow scope stands out
+
+At the end of a run, write_run_metrics(run_name) writes:
+- <METRICS_DIR>/<run>_<UTC timestamp>.json   (one file per run, for comparing daily runs)
+- <METRICS_TEXTFILE_DIR>/<run>.prom          (Prometheus node_exporter textfile collector)
+"""
+
+
+# seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = "shopify_promo"
+
+# slowest labelled span instances kept per span path
+SLOWEST_SPANS_KEPT = 5
+
+_ROOT_FIELD_RE = re.compile(r"\{\s*(?:\w+\s*:\s*)?(\w+)")
+
+
+def graphql_endpoint(query: str) -> str:
+    """'graphql:<first root field>' e.g. graphql:collections, graphql:metafieldsSet"""
+    m = _ROOT_FIELD_RE.search(query or "")
+    return f"graphql:{m.group(1)}" if m else "graphql"
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if seconds <= le:
+                self.buckets[i] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.total, 6),
+            "avg_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "buckets": {str(le): n for le, n in zip(LATENCY_BUCKETS, self.buckets)},
+        }
+
+
+class _SpanTotal:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+
+    def add(self, seconds: float, label: Optional[str]) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if label is not None:
+            self.slowest.append((seconds, label))
+            self.slowest.sort(reverse=True)
+            del self.slowest[SLOWEST_SPANS_KEPT:]
+
+    def to_dict(self) -> dict:
+        d = {"count": self.count, "total_seconds": round(self.total, 6), "max_seconds": round(self.max, 6)}
+        if self.slowest:
+            d["slowest"] = [{"label": label, "seconds": round(sec, 6)} for sec, label in self.slowest]
+        return d
+
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self.requests: Dict[Tuple[str, str], int] = {}
+            self.latency: Dict[str, _Histogram] = {}
+            self.retries: Dict[str, int] = {}
+            self.throttle_wait_seconds = 0.0
+            self.graphql_cost_requested = 0.0
+            self.graphql_cost_actual = 0.0
+            self.throttle_min_available: Optional[float] = None
+            self.throttle_maximum: Optional[float] = None
+            self.items: Dict[str, int] = {}
+            self.spans: Dict[str, _SpanTotal] = {}
+
+    # -------------------------
+    # Recording
+    # -------------------------
+    def observe_request(self, endpoint: str, seconds: float, status: str = "ok") -> None:
+        with self._lock:
+            key = (endpoint, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(endpoint, _Histogram()).observe(seconds)
+
+    def add_retry(self, endpoint: str) -> None:
+        with self._lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+    def add_throttle_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.throttle_wait_seconds += seconds
+
+    def add_graphql_cost(self, cost: Optional[dict]) -> None:
+        """cost: the 'extensions.cost' object of a GraphQL response"""
+        if not cost:
+            return
+        with self._lock:
+            self.graphql_cost_requested += float(cost.get("requestedQueryCost") or 0)
+            self.graphql_cost_actual += float(cost.get("actualQueryCost") or 0)
+            status = cost.get("throttleStatus") or {}
+            available = status.get("currentlyAvailable")
+            if available is not None:
+                available = float(available)
+                if self.throttle_min_available is None or available < self.throttle_min_available:
+                    self.throttle_min_available = available
+            if status.get("maximumAvailable") is not None:
+                self.throttle_maximum = float(status["maximumAvailable"])
+
+    def incr(self, item: str, n: int = 1) -> None:
+        with self._lock:
+            self.items[item] = self.items.get(item, 0) + n
+
+    @contextmanager
+    def span(self, name: str, label: Optional[str] = None):
+        """Time a phase. Spans nest per thread; totals are kept per path ("scopes/scope/write")."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        path = "/".join(stack)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            stack.pop()
+            with self._lock:
+                self.spans.setdefault(path, _SpanTotal()).add(seconds, label)
+
+    def span_summary(self) -> Dict[str, dict]:
+        with self._lock:
+            return {path: t.to_dict() for path, t in sorted(self.spans.items())}
+
+    # -------------------------
+    # Output
+    # -------------------------
+    def summary(self, run_name: str) -> dict:
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            endpoints: Dict[str, dict] = {}
+            for (endpoint, status), n in sorted(self.requests.items()):
+                e = endpoints.setdefault(endpoint, {"requests": {}, "retries": self.retries.get(endpoint, 0)})
+                e["requests"][status] = n
+            for endpoint, h in self.latency.items():
+                endpoints.setdefault(endpoint, {"requests": {}, "retries": 0})["latency"] = h.to_dict()
+
+            return {
+                "run": run_name,
+                "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "duration_seconds": round(elapsed, 3),
+                "endpoints": endpoints,
+                "throttle_wait_seconds": round(self.throttle_wait_seconds, 3),
+                "graphql_cost": {
+                    "requested": self.graphql_cost_requested,
+                    "actual": self.graphql_cost_actual,
+                    "actual_per_second": round(self.graphql_cost_actual / elapsed, 3),
+                    "min_available": self.throttle_min_available,
+                    "maximum_available": self.throttle_maximum,
+                },
+                "items": dict(self.items),
+                "items_per_second": {k: round(v / elapsed, 3) for k, v in self.items.items()},
+                "spans": {path: t.to_dict() for path, t in sorted(self.spans.items())},
+            }
+
+    def to_prometheus(self, run_name: str) -> str:
+        s = self.summary(run_name)
+        p = METRIC_PREFIX
+        run = _label_value(run_name)
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+
+        metric("requests_total", "counter", "Requests by endpoint and status.")
+        for endpoint, e in s["endpoints"].items():
+            for status, n in e["requests"].items():
+                lines.append(f'{p}_requests_total{{run="{run}",endpoint="{_label_value(endpoint)}",status="{_label_value(status)}"}} {n}')
+
+        metric("request_duration_seconds", "histogram", "Request latency by endpoint.")
+        for endpoint, e in s["endpoints"].items():
+            h = e.get("latency")
+            if not h:
+                continue
+            labels = f'run="{run}",endpoint="{_label_value(endpoint)}"'
+            for le, n in h["buckets"].items():
+                lines.append(f'{p}_request_duration_seconds_bucket{{{labels},le="{le}"}} {n}')
+            lines.append(f'{p}_request_duration_seconds_bucket{{{labels},le="+Inf"}} {h["count"]}')
+            lines.append(f'{p}_request_duration_seconds_sum{{{labels}}} {h["sum_seconds"]}')
+            lines.append(f'{p}_request_duration_seconds_count{{{labels}}} {h["count"]}')
+
+        metric("retries_total", "counter", "Retried requests by endpoint.")
+        for endpoint, e in s["endpoints"].items():
+            lines.append(f'{p}_retries_total{{run="{run}",endpoint="{_label_value(endpoint)}"}} {e["retries"]}')
+
+        metric("throttle_wait_seconds_total", "counter", "Time spent sleeping because of rate limits.")
+        lines.append(f'{p}_throttle_wait_seconds_total{{run="{run}"}} {s["throttle_wait_seconds"]}')
+
+        metric("graphql_cost_total", "counter", "GraphQL query cost consumed.")
+        lines.append(f'{p}_graphql_cost_total{{run="{run}",kind="requested"}} {s["graphql_cost"]["requested"]}')
+        lines.append(f'{p}_graphql_cost_total{{run="{run}",kind="actual"}} {s["graphql_cost"]["actual"]}')
+        if s["graphql_cost"]["min_available"] is not None:
+            metric("graphql_throttle_min_available", "gauge", "Lowest GraphQL throttle bucket level seen (capacity headroom).")
+            lines.append(f'{p}_graphql_throttle_min_available{{run="{run}"}} {s["graphql_cost"]["min_available"]}')
+
+        metric("items_total", "counter", "Items processed (products, writes, deletes, ...).")
+        for item, n in sorted(s["items"].items()):
+            lines.append(f'{p}_items_total{{run="{run}",item="{_label_value(item)}"}} {n}')
+        metric("items_per_second", "gauge", "Average throughput over the run.")
+        for item, v in sorted(s["items_per_second"].items()):
+            lines.append(f'{p}_items_per_second{{run="{run}",item="{_label_value(item)}"}} {v}')
+
+        if s["spans"]:
+            metric("span_seconds_total", "gauge", "Time spent in each run phase (span path).")
+            for path, t in s["spans"].items():
+                lines.append(f'{p}_span_seconds_total{{run="{run}",span="{_label_value(path)}"}} {t["total_seconds"]}')
+            metric("span_count", "gauge", "Times each run phase (span path) was entered.")
+            for path, t in s["spans"].items():
+                lines.append(f'{p}_span_count{{run="{run}",span="{_label_value(path)}"}} {t["count"]}')
+
+        metric("run_duration_seconds", "gauge", "Wall time of the last run.")
+        lines.append(f'{p}_run_duration_seconds{{run="{run}"}} {s["duration_seconds"]}')
+        metric("last_run_timestamp_seconds", "gauge", "Unix time the last run finished.")
+        lines.append(f'{p}_last_run_timestamp_seconds{{run="{run}"}} {int(time.time())}')
+
+        return "\n".join(lines) + "\n"
+
+
+def _label_value(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _write_atomic(path: str, text: str) -> None:
+    # textfile collector may read at any moment: never expose a half-written file
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.replace(tmp, path)
+
+
+# One collector per process. ShopifyClient / DatabaseConnection record into it.
+METRICS = RunMetrics()
+
+
+def merge_summaries(run_name: str, summaries: List[dict]) -> dict:
+    """
+    Combine summary() dicts of runs that worked in parallel (sync shards): counts, costs and
+    waits are added up, duration is the longest run, rates are recomputed over that duration.
+    """
+    duration = max([s.get("duration_seconds") or 0.0 for s in summaries] or [0.0])
+    endpoints: Dict[str, dict] = {}
+    items: Dict[str, int] = {}
+    spans: Dict[str, dict] = {}
+    min_available: Optional[float] = None
+    maximum: Optional[float] = None
+    requested = actual = throttle_wait = 0.0
+
+    for s in summaries:
+        for name, e in (s.get("endpoints") or {}).items():
+            m = endpoints.setdefault(name, {"requests": {}, "retries": 0})
+            for status, n in (e.get("requests") or {}).items():
+                m["requests"][status] = m["requests"].get(status, 0) + n
+            m["retries"] += e.get("retries") or 0
+            lat = e.get("latency")
+            if lat:
+                ml = m.setdefault("latency", {"count": 0, "sum_seconds": 0.0, "buckets": {}})
+                ml["count"] += lat["count"]
+                ml["sum_seconds"] = round(ml["sum_seconds"] + lat["sum_seconds"], 6)
+                for le, n in lat["buckets"].items():
+                    ml["buckets"][le] = ml["buckets"].get(le, 0) + n
+                ml["avg_seconds"] = round(ml["sum_seconds"] / ml["count"], 6) if ml["count"] else 0.0
+        for k, n in (s.get("items") or {}).items():
+            items[k] = items.get(k, 0) + n
+        for path, t in (s.get("spans") or {}).items():
+            m = spans.setdefault(path, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "slowest": []})
+            m["count"] += t["count"]
+            m["total_seconds"] = round(m["total_seconds"] + t["total_seconds"], 6)
+            m["max_seconds"] = max(m["max_seconds"], t["max_seconds"])
+            m["slowest"] = sorted(m["slowest"] + t.get("slowest", []), key=lambda x: x["seconds"], reverse=True)[:SLOWEST_SPANS_KEPT]
+        cost = s.get("graphql_cost") or {}
+        requested += cost.get("requested") or 0.0
+        actual += cost.get("actual") or 0.0
+        if cost.get("min_available") is not None:
+            min_available = cost["min_available"] if min_available is None else min(min_available, cost["min_available"])
+        if cost.get("maximum_available") is not None:
+            maximum = cost["maximum_available"]
+        throttle_wait += s.get("throttle_wait_seconds") or 0.0
+
+    for m in spans.values():
+        if not m["slowest"]:
+            del m["slowest"]
+    elapsed = max(duration, 1e-9)
+    return {
+        "run": run_name,
+        "merged_runs": [s.get("run") for s in summaries],
+        "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "duration_seconds": round(duration, 3),
+        "endpoints": dict(sorted(endpoints.items())),
+        "throttle_wait_seconds": round(throttle_wait, 3),
+        "graphql_cost": {
+            "requested": requested,
+            "actual": actual,
+            "actual_per_second": round(actual / elapsed, 3),
+            "min_available": min_available,
+            "maximum_available": maximum,
+        },
+        "items": items,
+        "items_per_second": {k: round(v / elapsed, 3) for k, v in items.items()},
+        "spans": dict(sorted(spans.items())),
+    }
+
+
+def print_span_totals(summary: dict) -> None:
+    spans = summary.get("spans") or {}
+    if not spans:
+        return
+    duration = summary.get("duration_seconds") or 0.0
+    print("")
+    print("Time by phase:")
+    for path, t in spans.items():
+        depth = path.count("/")
+        share = f"{100.0 * t['total_seconds'] / duration:5.1f}%" if duration else ""
+        print(f"  {'  ' * depth}{path.rsplit('/', 1)[-1]:<{32 - 2 * depth}} {t['total_seconds']:>10.3f}s {share}  x{t['count']}")
+        for slow in t.get("slowest", [])[:3]:
+            print(f"  {'  ' * depth}    slowest: {slow['label']} {slow['seconds']:.3f}s")
+    print("")
+
+
+def write_run_metrics(run_name: str, metrics_dir: Optional[str] = None, textfile_dir: Optional[str] = None,
+                      metrics: Optional[RunMetrics] = None) -> Tuple[str, str]:
+    metrics = metrics or METRICS
+    metrics_dir = metrics_dir or os.getenv("METRICS_DIR", "metrics")
+    textfile_dir = textfile_dir or os.getenv("METRICS_TEXTFILE_DIR", "") or metrics_dir
+    os.makedirs(metrics_dir, exist_ok=True)
+    os.makedirs(textfile_dir, exist_ok=True)
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    json_path = os.path.join(metrics_dir, f"{run_name}_{stamp}.json")
+    prom_path = os.path.join(textfile_dir, f"{run_name}.prom")
+
+    summary = metrics.summary(run_name)
+    _write_atomic(json_path, json.dumps(summary, ensure_ascii=False, indent=2))
+    _write_atomic(prom_path, metrics.to_prometheus(run_name))
+    print_span_totals(summary)
+    print(f"Wrote metrics: {json_path}, {prom_path}")
+    return json_path, prom_path
@@ -0,0 +1,154 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+"""
+run_profiler.py
+
+Opt-in profiling of a whole run (sync, reports, collections export).
+
+PROFILE:
+- ""         (default) off
+- cprofile   deterministic profile -> <PROFILE_DIR>/<run>_<stamp>.prof   (pstats / snakeviz)
+                                    + <run>_<stamp>.txt                 (top functions by cumulative time)
+- sample     sampling profiler     -> <PROFILE_DIR>/<run>_<stamp>.folded (collapsed stacks)
+
+Both also write <run>_<stamp>.folded, the "frame;frame;frame count" format read by
+flamegraph.pl, speedscope and inferno. For cprofile it is derived from the caller graph,
+so it shows where time is spent but not every exact call path.
+
+PROFILE_DIR           default "profiles"
+PROFILE_INTERVAL_MS   sampling interval for PROFILE=sample (default 5)
+
+The sampler only sees Python frames: time blocked in a socket or ODBC call shows up
+under the Python function that made the call, which is what we want for "where does the run wait".
+"""
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread (default: the calling thread) from a background thread."""
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            key = ";".join(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as fh:
+            for stack, n in sorted(self.stacks.items()):
+                fh.write(f"{stack} {n}\n")
+
+
+def pstats_to_folded(stats: pstats.Stats, path: str) -> None:
+    """
+    Approximate collapsed stacks from a cProfile caller graph: each function's own time
+    is attributed along its heaviest caller chain (in microseconds).
+    """
+    raw = stats.stats  # func -> (cc, nc, tt, ct, callers)
+
+    def name(func) -> str:
+        filename, line, fn = func
+        return f"{fn} ({os.path.basename(filename)}:{line})"
+
+    def heaviest_chain(func) -> list:
+        chain = [func]
+        seen = {func}
+        while True:
+            callers = raw.get(chain[-1], (0, 0, 0, 0, {}))[4]
+            best = None
+            best_ct = -1.0
+            for caller, data in callers.items():
+                ct = data[3] if len(data) > 3 else 0.0
+                if caller not in seen and ct > best_ct:
+                    best, best_ct = caller, ct
+            if best is None:
+                return list(reversed(chain))
+            chain.append(best)
+            seen.add(best)
+
+    with open(path, "w", encoding="utf-8") as fh:
+        for func, (cc, nc, tt, ct, callers) in raw.items():
+            micros = int(tt * 1_000_000)
+            if micros <= 0:
+                continue
+            fh.write(";".join(name(f) for f in heaviest_chain(func)) + f" {micros}\n")
+
+
+@contextmanager
+def profiling(run_name: str, mode: Optional[str] = None, profile_dir: Optional[str] = None):
+    """Wrap a run: with profiling("sync"): run_sync()"""
+    mode = (mode if mode is not None else os.getenv("PROFILE", "")).strip().lower()
+    if not mode:
+        yield
+        return
+    if mode not in ("cprofile", "sample"):
+        print(f"Unknown PROFILE={mode!r} (use cprofile or sample). Profiling disabled.")
+        yield
+        return
+
+    profile_dir = profile_dir or os.getenv("PROFILE_DIR", "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    base = os.path.join(profile_dir, f"{run_name}_{stamp}")
+
+    if mode == "cprofile":
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(base + ".prof")
+            stats = pstats.Stats(prof)
+            with open(base + ".txt", "w", encoding="utf-8") as fh:
+                pstats.Stats(prof, stream=fh).sort_stats("cumulative").print_stats(60)
+            pstats_to_folded(stats, base + ".folded")
+            print(f"Wrote profile: {base}.prof, {base}.txt, {base}.folded")
+        return
+
+    interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000.0
+    sampler = SamplingProfiler(interval)
+    t0 = time.perf_counter()
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        sampler.write_folded(base + ".folded")
+        print(f"Wrote profile: {base}.folded ({sampler.samples} samples over {time.perf_counter() - t0:.1f}s)")
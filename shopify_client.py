@@ -0,0 +1,864 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote_plus
+
+from promo_config import Config, ShopTarget, normalize, shop_targets
+from http_cassette import open_http_transport
+from response_cache import cache_key, mutation_tags, query_tags, shared_response_cache
+from run_metrics import METRICS, graphql_endpoint
+from product_ids import ProductIdSet
+
+
+"""
+shopify_client.py
+
+Shopify Admin API client (GraphQL + REST counts) used by the sync and all reports.
+
+Shared by every ShopifyClient of the same shop in the process:
+- one pooled HTTP session (http_cassette.shared_session)
+- one GraphQL cost budget (cost_budget()), so clients do not race each other into THROTTLED
+Different shops (SHOPIFY_SHOPS, multi-shop sync) get their own session and budget: each
+shop has its own API rate limit.
+
+Per client: an in-run cache of read-only lookups (collection by title, product ids by
+collection/vendor as compact ProductIdSets, counts, the vendor scan of all products). Build one client and
+pass it around (cli.py does) to fetch each of these only once per run.
+
+Batched lookups (find_collections_by_title_exact, get_collections, count_products_*) pack
+many root fields into one GraphQL document with aliases (a0: ..., a1: ...). Each request's
+estimated cost stays under GRAPHQL_BATCH_MAX_COST and the shop's bucket size, so a report
+resolves hundreds of vendors in a handful of requests instead of one or two each.
+
+Read-only lookups the reports repeat (title searches, collection lookups, productsCount
+batches, the vendor scan, REST counts) pass cache=True: their responses are kept in the
+two-tier response cache (response_cache.py), in memory and on disk for later runs.
+Mutations invalidate the cached responses they could change (response_cache.MUTATION_TAGS).
+
+Cursor listings go through pages() / paginate(): page N+1 is requested in the background
+while the caller works through page N, and nodes are yielded as they come, so a listing
+never holds more than two pages.
+
+Product counts use GraphQL productsCount (SHOPIFY_API_VERSION 2024-04 or later; vendors
+above 10,000 products only count exactly from 2025-01, older versions report them as
+InexactCountError) and raise ShopifyCountError subclasses when a count is not known; the older rest_count_* helpers
+(REST products/count.json, being phased out by Shopify) return 0 on any failure.
+"""
+
+
+# =========================
+# Shopify GraphQL Client
+# =========================
+MAX_THROTTLED_RETRIES = 30
+
+# aliases per batched request, whatever the cost estimate allows
+MAX_BATCH_ALIASES = 100
+
+# requested cost of one alias (Shopify: 1 per object, 2 + first for a connection)
+TITLE_SEARCH_COST = 22.0     # collections(first: 20) { nodes { id title } }
+COLLECTION_FETCH_COST = 1.0  # collection(id:) { id title handle updatedAt }
+COUNT_COST = 2.0             # productsCount { count precision } / collection { productsCount }
+# productsCount caps at 10,000 unless limit: null; the argument only exists from this version on
+COUNT_LIMIT_API_VERSION = "2025-01"
+METAFIELD_LOOKUP_COST = 13.0  # collection / product(id:) { id metafields(first: 10) { nodes { id key value } } }
+METAFIELD_DELETE_COST = 10.0  # metafieldDelete (every mutation field costs 10)
+
+# seconds between currentBulkOperation polls
+BULK_POLL_SECONDS = 2.0
+
+_VARIABLE_RE = re.compile(r"\$(\w+)")
+
+
+def admin_base_url(target: Optional[ShopTarget] = None) -> str:
+    return (target or shop_targets()[0]).base_url
+
+
+def is_throttled(errors) -> bool:
+    return any(((e or {}).get("extensions") or {}).get("code") == "THROTTLED" for e in (errors or []))
+
+
+def throttle_wait_seconds(cost: Optional[dict]) -> float:
+    # time for the leaky bucket to refill to the requested cost
+    if not cost:
+        return 1.0
+    status = cost.get("throttleStatus") or {}
+    requested = float(cost.get("requestedQueryCost") or 0)
+    available = float(status.get("currentlyAvailable") or 0)
+    restore = float(status.get("restoreRate") or 50) or 50.0
+    return max(0.2, (requested - available) / restore)
+
+
+class ShopifyCountError(RuntimeError):
+    """A product count is not known (instead of reporting 0)."""
+
+
+class CountRequestError(ShopifyCountError):
+    """The productsCount request itself failed (HTTP / GraphQL errors, retries used up)."""
+
+
+class CollectionNotFoundError(ShopifyCountError):
+    """The collection id does not exist (or is not visible to the app)."""
+
+
+class InexactCountError(ShopifyCountError):
+    """Shopify only returned a lower bound (precision AT_LEAST)."""
+
+
+class CostBudget:
+    """GraphQL cost bucket as last reported by Shopify (extensions.cost.throttleStatus)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.available: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.restore_rate = 50.0
+        self.at = 0.0
+        # last requested cost per endpoint: what the next query of that kind will need
+        self.requested: Dict[str, float] = {}
+
+    def update(self, cost: Optional[dict], endpoint: str = "") -> None:
+        status = (cost or {}).get("throttleStatus") or {}
+        if status.get("currentlyAvailable") is None:
+            return
+        with self._lock:
+            if cost.get("requestedQueryCost") is not None:
+                self.requested[endpoint] = float(cost["requestedQueryCost"])
+            self.available = float(status["currentlyAvailable"])
+            self.maximum = float(status.get("maximumAvailable") or self.available)
+            self.restore_rate = float(status.get("restoreRate") or 50) or 50.0
+            self.at = time.monotonic()
+
+    def estimate(self) -> Optional[float]:
+        """Points in the bucket now (last report + refill since), None before the first response."""
+        with self._lock:
+            if self.available is None:
+                return None
+            return min(self.maximum or float("inf"), self.available + (time.monotonic() - self.at) * self.restore_rate)
+
+    def wait_seconds(self, min_available: float, endpoint: str = "", cost: Optional[float] = None) -> float:
+        """cost: requested cost of the next query if known, else the last one of the same endpoint."""
+        with self._lock:
+            if self.available is None or min_available <= 0:
+                return 0.0
+            needed = max(min_available, self.requested.get(endpoint, 0.0) if cost is None else cost)
+            needed = min(needed, self.maximum or needed)
+            estimate = self.available + (time.monotonic() - self.at) * self.restore_rate
+            if estimate >= needed:
+                return 0.0
+            return (needed - estimate) / self.restore_rate
+
+
+_cost_budgets: Dict[str, CostBudget] = {}
+_cost_budgets_lock = threading.Lock()
+
+
+def cost_budget(base_url: str) -> CostBudget:
+    """The process-wide cost budget of one shop."""
+    with _cost_budgets_lock:
+        budget = _cost_budgets.get(base_url)
+        if budget is None:
+            budget = CostBudget()
+            _cost_budgets[base_url] = budget
+        return budget
+
+
+class ShopifyClient:
+    @staticmethod
+    def to_collection_gid(collection_id: str) -> str:
+        cid = (collection_id or "").strip()
+        if cid.startswith("gid://"):
+            return cid
+        return f"gid://shopify/Collection/{cid}"
+
+    def __init__(self, target: Optional[ShopTarget] = None):
+        """target: shop to talk to (default: SHOPIFY_SHOP, or the first of SHOPIFY_SHOPS)."""
+        self.target = target or shop_targets()[0]
+        self.token = self.target.token
+        self.base_url = admin_base_url(self.target)
+        self.endpoint = f"{self.base_url}/admin/api/{Config.SHOPIFY_API_VERSION}/graphql.json"
+        self.http = open_http_transport(Config.HTTP_CASSETTE_MODE, Config.HTTP_CASSETTE, Config.HTTP_REPLAY_LATENCY_MS,
+                                        session_key=self.base_url)
+        self.budget = cost_budget(self.base_url)
+        self.responses = shared_response_cache()
+        self._cache: Dict[tuple, object] = {}
+
+    def _cached(self, key: tuple, load: Callable[[], object]):
+        # read-only lookups: the sync only writes metafields, which none of these depend on
+        if key not in self._cache:
+            self._cache[key] = load()
+        return self._cache[key]
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+    def graphql(self, query: str, variables: Optional[dict] = None, retries: int = 4,
+                cost: Optional[float] = None, cache: bool = False) -> dict:
+        """
+        cost: estimated requested cost (batched queries, whose size varies); default: learned per endpoint.
+        cache: read-only query whose response may come from / go to the response cache.
+        """
+        key = None
+        if cache:
+            key = cache_key(self.endpoint, " ".join(query.split()), variables or {})
+            hit = None if Config.RESPONSE_CACHE_BYPASS else self.responses.get(key)
+            if hit is not None:
+                METRICS.incr("response_cache_hits")
+                return hit
+            METRICS.incr("response_cache_misses")
+        mutation = query.lstrip().startswith("mutation")
+
+        headers = {
+            "X-Shopify-Access-Token": self.token,
+            "Content-Type": "application/json",
+        }
+        payload = {"query": query, "variables": variables or {}}
+        endpoint = graphql_endpoint(query)
+
+        last_err = None
+        attempt = 0
+        throttled = 0
+        while attempt < retries:
+            try:
+                wait = self.budget.wait_seconds(Config.GRAPHQL_MIN_AVAILABLE, endpoint, cost)
+                if wait > 0:
+                    METRICS.add_throttle_wait(wait)
+                    time.sleep(wait)
+                t0 = time.perf_counter()
+                try:
+                    resp = self.http.post(self.endpoint, headers=headers, json=payload, timeout=Config.REQUEST_TIMEOUT)
+                except Exception:
+                    METRICS.observe_request(endpoint, time.perf_counter() - t0, "network_error")
+                    raise
+                METRICS.observe_request(endpoint, time.perf_counter() - t0, resp.status_code)
+
+                if resp.status_code == 429 or resp.status_code in (500, 502, 503, 504):
+                    last_err = RuntimeError(f"Temporary Shopify error {resp.status_code}: {resp.text}")
+                    wait = 1.2 + attempt * 1.0
+                    if resp.status_code == 429:
+                        METRICS.add_throttle_wait(wait)
+                    time.sleep(wait)
+                    attempt += 1
+                    METRICS.add_retry(endpoint)
+                    continue
+
+                if resp.status_code >= 400:
+                    raise RuntimeError(f"Shopify error {resp.status_code}: {resp.text}")
+
+                resp.raise_for_status()
+                data = resp.json()
+                reported = (data.get("extensions") or {}).get("cost")
+                METRICS.add_graphql_cost(reported)
+                self.budget.update(reported, endpoint)
+
+                if data.get("errors"):
+                    # Cost-based throttling comes back as HTTP 200 + THROTTLED error.
+                    # Wait until the bucket has refilled enough for this query, then resend.
+                    # These waits do not use up the retry attempts.
+                    if is_throttled(data["errors"]) and throttled < MAX_THROTTLED_RETRIES:
+                        throttled += 1
+                        wait = throttle_wait_seconds(reported)
+                        METRICS.add_throttle_wait(wait)
+                        METRICS.add_retry(endpoint)
+                        time.sleep(wait)
+                        continue
+                    raise RuntimeError(f"GraphQL errors: {data['errors']}")
+
+                if key is not None:
+                    self.responses.put(key, data, query_tags(query))
+                elif mutation:
+                    self.responses.invalidate(mutation_tags(query))
+                return data
+            except RuntimeError:
+                # Do not retry non-retryable API errors (e.g. 400/401/403/404/422)
+                # or GraphQL business errors. Raise immediately so the caller can see
+                # the real problem instead of waiting through unnecessary retries.
+                raise
+            except Exception as e:
+                # Retry only unexpected/network-type errors
+                last_err = e
+                if attempt < retries - 1:
+                    time.sleep(1.0 + attempt * 1.0)
+                    METRICS.add_retry(endpoint)
+                attempt += 1
+
+        raise RuntimeError(f"Shopify GraphQL failed after retries: {last_err}")
+
+    def batch_size(self, alias_cost: float) -> int:
+        """
+        How many aliases of this cost to send now: up to GRAPHQL_BATCH_MAX_COST, but no more than
+        the bucket holds at the moment. Shopify checks the requested cost up front and refunds
+        the unused part, so a smaller batch that fits now beats waiting for a refill.
+        """
+        limit = Config.GRAPHQL_BATCH_MAX_COST
+        available = self.budget.estimate()
+        if available is not None:
+            # graphql() waits for GRAPHQL_MIN_AVAILABLE anyway
+            limit = min(limit, max(available, Config.GRAPHQL_MIN_AVAILABLE))
+        return max(1, min(MAX_BATCH_ALIASES, int(limit // max(alias_cost, 1.0))))
+
+    def graphql_aliased(self, field: str, var_types: Dict[str, str], variables: List[dict],
+                        alias_cost: float, operation: str = "query", cache: bool = False) -> List[object]:
+        """
+        Runs one root field once per variables dict, many per request: "a0: <field> a1: <field> ...".
+        field uses $name placeholders, e.g. "collection(id: $id) { id title }" with var_types {"id": "ID!"}.
+        operation: "mutation" for mutation fields (run in order, each on its own).
+        cache: read-only lookup, see graphql(); each batch is cached as sent.
+        Returns the field results in the order of `variables`.
+        """
+        out: List[object] = []
+        start = 0
+        while start < len(variables):
+            chunk = variables[start:start + self.batch_size(alias_cost)]
+            start += len(chunk)
+            decls: List[str] = []
+            parts: List[str] = []
+            values: Dict[str, object] = {}
+            for i, v in enumerate(chunk):
+                for name, typ in var_types.items():
+                    decls.append(f"${name}{i}: {typ}")
+                    values[f"{name}{i}"] = v.get(name)
+                parts.append(f"a{i}: " + _VARIABLE_RE.sub(lambda m: f"${m.group(1)}{i}", field))
+            head = f"{operation}({', '.join(decls)})" if decls else operation
+            data = self.graphql(head + " {\n  " + "\n  ".join(parts) + "\n}", values, cost=len(chunk) * alias_cost,
+                                cache=cache)
+            out.extend((data.get("data") or {}).get(f"a{i}") for i in range(len(chunk)))
+        return out
+
+    def pages(self, query: str, variables: Optional[dict] = None, path: Tuple[str, ...] = ("products",),
+              cursor: Optional[str] = None, cache: bool = False) -> Iterator[dict]:
+        """
+        The pages of a cursor connection in order: {nodes | edges, pageInfo} dicts.
+        query takes $cursor (after: $cursor); path leads from "data" to the connection, e.g.
+        ("collection", "products"), and a missing object on the way ends the listing.
+        cursor: resume after this endCursor. cache: see graphql().
+        With PAGINATION_PREFETCH the next page is already being requested while the caller
+        works through this one (one request in flight, at most two pages held).
+        """
+        def fetch(after: Optional[str]) -> Optional[dict]:
+            node = self.graphql(query, dict(variables or {}, cursor=after), cache=cache).get("data")
+            for key in path:
+                node = (node or {}).get(key)
+            return node
+
+        if not Config.PAGINATION_PREFETCH:
+            while True:
+                conn = fetch(cursor)
+                if conn is None:
+                    return
+                yield conn
+                if not conn["pageInfo"]["hasNextPage"]:
+                    return
+                cursor = conn["pageInfo"]["endCursor"]
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-prefetch") as pool:
+            pending = pool.submit(fetch, cursor)
+            while pending is not None:
+                conn = pending.result()
+                if conn is None:
+                    return
+                info = conn["pageInfo"]
+                pending = pool.submit(fetch, info["endCursor"]) if info["hasNextPage"] else None
+                yield conn
+
+    def paginate(self, query: str, variables: Optional[dict] = None, path: Tuple[str, ...] = ("products",),
+                 cursor: Optional[str] = None, cache: bool = False) -> Iterator[dict]:
+        """The nodes of every page of pages(), one at a time."""
+        for conn in self.pages(query, variables, path, cursor, cache):
+            yield from conn.get("nodes") or [e["node"] for e in conn.get("edges") or []]
+
+    @staticmethod
+    def _exact_title_match(nodes: List[dict], title: str) -> Optional[Tuple[str, str]]:
+        target = normalize(title)
+        for n in nodes or []:
+            if normalize(n.get("title", "")) == target:
+                return n["id"], n["title"]
+        return None
+
+    def find_collection_by_title_exact(self, title: str) -> Optional[Tuple[str, str]]:
+        return self._cached(("collection_by_title", normalize(title)), lambda: self._find_collection_by_title_exact(title))
+
+    def find_collections_by_title_exact(self, titles: Iterable[str]) -> Dict[str, Optional[Tuple[str, str]]]:
+        """
+        find_collection_by_title_exact for many titles: the same two searches (title:"x", then
+        title:x for misses), each batched, sharing the same cache.
+        """
+        titles = list(titles)
+        pending: List[str] = []
+        seen = set()
+        for t in titles:
+            key = normalize(t)
+            if key and key not in seen and ("collection_by_title", key) not in self._cache:
+                seen.add(key)
+                pending.append(t)
+
+        field = "collections(first: 20, query: $q) { nodes { id title } }"
+        for quoted in (True, False):
+            if not pending:
+                break
+            queries = [{"q": f'title:"{t}"' if quoted else f"title:{t}"} for t in pending]
+            misses: List[str] = []
+            for t, conn in zip(pending, self.graphql_aliased(field, {"q": "String!"}, queries, TITLE_SEARCH_COST, cache=True)):
+                match = self._exact_title_match((conn or {}).get("nodes"), t)
+                if match is None and quoted:
+                    misses.append(t)
+                else:
+                    self._cache[("collection_by_title", normalize(t))] = match
+            pending = misses
+
+        return {t: self._cache.get(("collection_by_title", normalize(t))) for t in titles}
+
+    def get_collections(self, collection_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """collection gid -> {id, title, handle, updatedAt}, None if it does not exist. Many per request."""
+        gids = list(dict.fromkeys(self.to_collection_gid(c) for c in collection_ids))
+        missing = [g for g in gids if ("collection", g) not in self._cache]
+        results = self.graphql_aliased("collection(id: $id) { id title handle updatedAt }", {"id": "ID!"},
+                                       [{"id": g} for g in missing], COLLECTION_FETCH_COST, cache=True)
+        for g, node in zip(missing, results):
+            self._cache[("collection", g)] = node
+        return {g: self._cache[("collection", g)] for g in gids}
+
+    def _find_collection_by_title_exact(self, title: str) -> Optional[Tuple[str, str]]:
+        q = """
+        query($q: String!) {
+          collections(first: 20, query: $q) {
+            nodes { id title }
+          }
+        }
+        """
+        data = self.graphql(q, {"q": f'title:"{title}"'}, cache=True)
+        match = self._exact_title_match(data["data"]["collections"]["nodes"], title)
+        if match:
+            return match
+
+        data2 = self.graphql(q, {"q": f"title:{title}"}, cache=True)
+        return self._exact_title_match(data2["data"]["collections"]["nodes"], title)
+
+    def list_product_ids_in_collection(self, collection_id: str) -> ProductIdSet:
+        key = ("collection_product_ids", self.to_collection_gid(collection_id))
+        return self._cached(key, lambda: self._list_product_ids_in_collection(collection_id))
+
+    def _list_product_ids_in_collection(self, collection_id: str) -> ProductIdSet:
+        q = """
+        query($id: ID!, $cursor: String) {
+          collection(id: $id) {
+            products(first: 250, after: $cursor) {
+              pageInfo { hasNextPage endCursor }
+              nodes { id }
+            }
+          }
+        }
+        """
+        nodes = self.paginate(q, {"id": self.to_collection_gid(collection_id)}, ("collection", "products"))
+        return ProductIdSet(n["id"] for n in nodes)
+
+    def count_products_by_vendors(self, vendors: Iterable[str]) -> Dict[str, int]:
+        """
+        vendor -> product count (productsCount(query: vendor:"x")), many vendors per request.
+        Raises CountRequestError if a request fails. Vendors whose count is inexact are left
+        out; count_products_by_vendor() raises their error.
+        """
+        vendors = list(vendors)
+        pending = list(dict.fromkeys(v for v in vendors if ("vendor_count", normalize(v)) not in self._cache))
+        # older versions have no cap (and no limit argument); a capped count comes back as AT_LEAST
+        limit = ", limit: null" if Config.SHOPIFY_API_VERSION >= COUNT_LIMIT_API_VERSION else ""
+        field = "productsCount(query: $q%s) { count precision }" % limit
+        results = self._batched_counts(field, {"q": "String!"}, [{"q": f'vendor:"{v}"'} for v in pending])
+        for v, node in zip(pending, results):
+            self._cache[("vendor_count", normalize(v))] = self._count_result(node, f"vendor {v!r}")
+        return self._counts_from_cache("vendor_count", {v: normalize(v) for v in vendors})
+
+    def count_products_by_vendor(self, vendor: str) -> int:
+        return self._count_or_raise("vendor_count", normalize(vendor), lambda: self.count_products_by_vendors([vendor]))
+
+    def count_products_in_collections(self, collection_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        collection id -> product count (collection { productsCount }), many per request.
+        Raises CountRequestError if a request fails. Missing collections are left out;
+        count_products_in_collection() raises CollectionNotFoundError for them.
+        """
+        collection_ids = list(collection_ids)
+        pending = list(dict.fromkeys(self.to_collection_gid(c) for c in collection_ids
+                                     if ("collection_count", self.to_collection_gid(c)) not in self._cache))
+        field = "collection(id: $id) { productsCount { count precision } }"
+        results = self._batched_counts(field, {"id": "ID!"}, [{"id": g} for g in pending])
+        for g, node in zip(pending, results):
+            if node is None:
+                self._cache[("collection_count", g)] = CollectionNotFoundError(f"collection {g} not found")
+            else:
+                self._cache[("collection_count", g)] = self._count_result(node.get("productsCount"), f"collection {g}")
+        return self._counts_from_cache("collection_count", {c: self.to_collection_gid(c) for c in collection_ids})
+
+    def count_products_in_collection(self, collection_id: str) -> int:
+        gid = self.to_collection_gid(collection_id)
+        return self._count_or_raise("collection_count", gid, lambda: self.count_products_in_collections([gid]))
+
+    def _batched_counts(self, field: str, var_types: Dict[str, str], variables: List[dict]) -> List[object]:
+        try:
+            return self.graphql_aliased(field, var_types, variables, COUNT_COST, cache=True)
+        except RuntimeError as e:
+            raise CountRequestError(f"productsCount failed: {e}") from e
+
+    @staticmethod
+    def _count_result(node: Optional[dict], what: str):
+        """int, or the ShopifyCountError to raise for this item."""
+        if not node or node.get("count") is None:
+            return CountRequestError(f"no productsCount returned for {what}")
+        if (node.get("precision") or "EXACT") != "EXACT":
+            return InexactCountError(f"productsCount for {what} is only a lower bound ({node['count']}+)")
+        return int(node["count"])
+
+    def _counts_from_cache(self, kind: str, keys: Dict[str, str]) -> Dict[str, int]:
+        out = {}
+        for name, key in keys.items():
+            value = self._cache.get((kind, key))
+            if isinstance(value, int):
+                out[name] = value
+        return out
+
+    def _count_or_raise(self, kind: str, key: str, load: Callable[[], object]) -> int:
+        if (kind, key) not in self._cache:
+            load()
+        value = self._cache[(kind, key)]
+        if isinstance(value, ShopifyCountError):
+            raise value
+        return value
+
+    def prefetch_vendor_collections(self, vendors: List[str], count_vendors: bool = True) -> bool:
+        """
+        Batched warm-up for the vendor reports' per-vendor lookups: vendor product counts
+        (count_vendors), collection by title for vendors with products, and the matched
+        collections' product counts. The report loop then reads everything from the cache.
+        False if a batch failed; the loop then falls back to per-vendor requests.
+        """
+        try:
+            if count_vendors:
+                counts = self.count_products_by_vendors(vendors)
+                vendors = [v for v in vendors if counts.get(v, 1)]
+            matches = self.find_collections_by_title_exact(vendors)
+            self.count_products_in_collections([m[0] for m in matches.values() if m])
+            return True
+        except Exception as e:
+            print(f"Batched lookups failed ({e}); falling back to per-vendor requests")
+            return False
+
+    def rest_count_products_in_collection(self, collection_id: str) -> int:
+        # collection_id may be a GraphQL gid like 'gid://shopify/Collection/12345'
+        # REST count endpoint expects the numeric id.
+        numeric_id = collection_id
+        try:
+            if collection_id.startswith("gid://"):
+                numeric_id = collection_id.rsplit("/", 1)[-1]
+        except Exception:
+            numeric_id = collection_id
+
+        url = f"{self.base_url}/admin/api/{Config.SHOPIFY_API_VERSION}/products/count.json?collection_id={quote_plus(numeric_id)}"
+        return self._rest_count(url)
+
+    def rest_count_products_by_vendor(self, vendor: str) -> int:
+        url = f"{self.base_url}/admin/api/{Config.SHOPIFY_API_VERSION}/products/count.json?vendor={quote_plus(vendor)}"
+        return self._rest_count(url)
+
+    def _rest_count(self, url: str) -> int:
+        key = ("rest_count", url)
+        if key in self._cache:
+            return self._cache[key]
+        response_key = cache_key("GET", url)
+        hit = None if Config.RESPONSE_CACHE_BYPASS else self.responses.get(response_key)
+        if hit is not None:
+            METRICS.incr("response_cache_hits")
+            self._cache[key] = int(hit["count"])
+            return self._cache[key]
+        METRICS.incr("response_cache_misses")
+        headers = {"X-Shopify-Access-Token": self.token}
+        t0 = time.perf_counter()
+        status = "network_error"
+        try:
+            resp = self.http.get(url, headers=headers, timeout=Config.REQUEST_TIMEOUT)
+            status = resp.status_code
+            resp.raise_for_status()
+            data = resp.json()
+            count = int(data.get("count", 0))
+            # failures (returned as 0) are not cached
+            self._cache[key] = count
+            self.responses.put(response_key, {"count": count}, query_tags(url))
+            return count
+        except Exception:
+            return 0
+        finally:
+            METRICS.observe_request("rest:products/count", time.perf_counter() - t0, status)
+
+    def list_product_ids_by_vendor(self, vendor: str) -> ProductIdSet:
+        return self._cached(("vendor_product_ids", normalize(vendor)), lambda: self._list_product_ids_by_vendor(vendor))
+
+    def _list_product_ids_by_vendor(self, vendor: str) -> ProductIdSet:
+        target = normalize(vendor)
+
+        q = """
+        query($q: String!, $cursor: String) {
+          products(first: 250, after: $cursor, query: $q) {
+            pageInfo { hasNextPage endCursor }
+            nodes { id vendor }
+          }
+        }
+        """
+        nodes = self.paginate(q, {"q": f'vendor:"{vendor}"'})
+        return ProductIdSet(n["id"] for n in nodes if normalize(n.get("vendor", "")) == target)
+
+    def list_product_vendors(self) -> List[Tuple[str, str]]:
+        """(product id, vendor) for every product in the shop. One full catalog scan per client."""
+        return list(self._cached(("product_vendors",), self._scan_product_vendors))
+
+    def _scan_product_vendors(self) -> List[Tuple[str, str]]:
+        q = """
+        query($cursor: String) {
+          products(first: 250, after: $cursor) {
+            pageInfo { hasNextPage endCursor }
+            nodes { id vendor }
+          }
+        }
+        """
+        out: List[Tuple[str, str]] = []
+
+        print("Fetching all products from Shopify...")
+        for n in self.paginate(q, cache=True):
+            out.append((n["id"], (n.get("vendor") or "").strip()))
+            if len(out) % 5000 == 0:
+                print(f"  Processed {len(out)} products...")
+
+        return out
+
+    def metafields_set(self, metafields: List[dict]) -> None:
+        m = """
+        mutation($m: [MetafieldsSetInput!]!) {
+          metafieldsSet(metafields: $m) {
+            metafields { id namespace key }
+            userErrors { field message }
+          }
+        }
+        """
+        data = self.graphql(m, {"m": metafields})
+        errs = data["data"]["metafieldsSet"]["userErrors"]
+        if errs:
+            raise RuntimeError(f"metafieldsSet userErrors: {errs}")
+
+    def get_metafield_ids(self, product_id: str, namespace: str, keys: List[str]) -> Dict[str, Optional[str]]:
+        q = """
+        query($id: ID!, $namespace: String!) {
+          product(id: $id) {
+            metafields(first: 100, namespace: $namespace) {
+              edges {
+                node {
+                  id
+                  key
+                  namespace
+                }
+              }
+            }
+          }
+        }
+        """
+        data = self.graphql(q, {"id": product_id, "namespace": namespace})
+        edges = data.get("data", {}).get("product", {}).get("metafields", {}).get("edges", []) or []
+
+        out = {k: None for k in keys}
+        for edge in edges:
+            node = edge.get("node") if edge else None
+            if node and node.get("key") in out:
+                out[node["key"]] = node.get("id")
+        return out
+
+    def collection_metafields(self, collection_ids: Iterable[str], namespace: str) -> Dict[str, Optional[Dict[str, dict]]]:
+        """collection gid -> {key: {id, value}} in the namespace, None if the collection does not exist. Many per request."""
+        gids = list(dict.fromkeys(self.to_collection_gid(c) for c in collection_ids))
+        return self._owner_metafields("collection", gids, namespace)
+
+    def product_metafields(self, product_ids: Iterable[str], namespace: str) -> Dict[str, Optional[Dict[str, dict]]]:
+        """product gid -> {key: {id, value}} in the namespace, None if the product does not exist. Many per request."""
+        return self._owner_metafields("product", list(dict.fromkeys(product_ids)), namespace)
+
+    def _owner_metafields(self, root: str, gids: List[str], namespace: str) -> Dict[str, Optional[Dict[str, dict]]]:
+        field = root + "(id: $id) { id metafields(first: 10, namespace: $namespace) { nodes { id key value } } }"
+        results = self.graphql_aliased(field, {"id": "ID!", "namespace": "String!"},
+                                       [{"id": g, "namespace": namespace} for g in gids], METAFIELD_LOOKUP_COST)
+        out: Dict[str, Optional[Dict[str, dict]]] = {}
+        for g, node in zip(gids, results):
+            if node is None:
+                out[g] = None
+                continue
+            nodes = (node.get("metafields") or {}).get("nodes") or []
+            out[g] = {n["key"]: {"id": n["id"], "value": n.get("value")} for n in nodes if n}
+        return out
+
+    def shop_metafield(self, namespace: str, key: str) -> Tuple[str, Optional[dict]]:
+        """(shop gid, {id, value} of the shop metafield or None)"""
+        q = """
+        query($namespace: String!, $key: String!) {
+          shop {
+            id
+            metafield(namespace: $namespace, key: $key) { id value }
+          }
+        }
+        """
+        data = self.graphql(q, {"namespace": namespace, "key": key})
+        node = data["data"]["shop"]
+        return node["id"], node.get("metafield")
+
+    def metaobject_definition_id(self, mo_type: str) -> Optional[str]:
+        q = "query($type: String!) { metaobjectDefinitionByType(type: $type) { id } }"
+        node = self.graphql(q, {"type": mo_type})["data"].get("metaobjectDefinitionByType")
+        return node["id"] if node else None
+
+    def metaobject_definition_create(self, definition: dict) -> str:
+        m = """
+        mutation($d: MetaobjectDefinitionCreateInput!) {
+          metaobjectDefinitionCreate(definition: $d) {
+            metaobjectDefinition { id }
+            userErrors { field message }
+          }
+        }
+        """
+        data = self.graphql(m, {"d": definition})["data"]["metaobjectDefinitionCreate"]
+        if data["userErrors"]:
+            raise RuntimeError(f"metaobjectDefinitionCreate userErrors: {data['userErrors']}")
+        return data["metaobjectDefinition"]["id"]
+
+    def metafield_definition_exists(self, owner_type: str, namespace: str, key: str) -> bool:
+        q = """
+        query($owner: MetafieldOwnerType!, $namespace: String!, $key: String!) {
+          metafieldDefinitions(first: 1, ownerType: $owner, namespace: $namespace, key: $key) { nodes { id } }
+        }
+        """
+        data = self.graphql(q, {"owner": owner_type, "namespace": namespace, "key": key})
+        return bool(data["data"]["metafieldDefinitions"]["nodes"])
+
+    def metafield_definition_create(self, definition: dict) -> None:
+        m = """
+        mutation($d: MetafieldDefinitionInput!) {
+          metafieldDefinitionCreate(definition: $d) {
+            createdDefinition { id }
+            userErrors { field message }
+          }
+        }
+        """
+        errs = self.graphql(m, {"d": definition})["data"]["metafieldDefinitionCreate"]["userErrors"]
+        if errs:
+            raise RuntimeError(f"metafieldDefinitionCreate userErrors: {errs}")
+
+    def list_metaobjects(self, mo_type: str) -> List[dict]:
+        """[{id, handle, fields: {key: value}}] of every metaobject of the type"""
+        q = """
+        query($type: String!, $cursor: String) {
+          metaobjects(type: $type, first: 250, after: $cursor) {
+            pageInfo { hasNextPage endCursor }
+            nodes { id handle fields { key value } }
+          }
+        }
+        """
+        return [{"id": n["id"], "handle": n["handle"], "fields": {x["key"]: x.get("value") for x in n.get("fields") or []}}
+                for n in self.paginate(q, {"type": mo_type}, ("metaobjects",))]
+
+    def metaobject_upsert(self, mo_type: str, handle: str, fields: Dict[str, str]) -> str:
+        """Create or update the metaobject with this handle; "" clears a field. Returns its gid."""
+        m = """
+        mutation($handle: MetaobjectHandleInput!, $mo: MetaobjectUpsertInput!) {
+          metaobjectUpsert(handle: $handle, metaobject: $mo) {
+            metaobject { id }
+            userErrors { field message }
+          }
+        }
+        """
+        data = self.graphql(m, {"handle": {"type": mo_type, "handle": handle},
+                                "mo": {"fields": [{"key": k, "value": v} for k, v in fields.items()]}})
+        data = data["data"]["metaobjectUpsert"]
+        if data["userErrors"]:
+            raise RuntimeError(f"metaobjectUpsert userErrors: {data['userErrors']}")
+        return data["metaobject"]["id"]
+
+    def products_referencing(self, metaobject_id: str) -> ProductIdSet:
+        """Products with a metafield that references the metaobject."""
+        q = """
+        query($id: ID!, $cursor: String) {
+          metaobject(id: $id) {
+            referencedBy(first: 250, after: $cursor) {
+              pageInfo { hasNextPage endCursor }
+              nodes { referencer { ... on Product { id } } }
+            }
+          }
+        }
+        """
+        refs = (((n or {}).get("referencer") or {}).get("id", "")
+                for n in self.paginate(q, {"id": metaobject_id}, ("metaobject", "referencedBy")))
+        return ProductIdSet(r for r in refs if str(r).startswith("gid://shopify/Product/"))
+
+    def metafield_delete(self, metafield_id: str) -> None:
+        m = """
+        mutation($id: ID!) {
+          metafieldDelete(input: {id: $id}) {
+            deletedId
+            userErrors { field message }
+          }
+        }
+        """
+        data = self.graphql(m, {"id": metafield_id})
+        errs = data["data"]["metafieldDelete"]["userErrors"]
+        if errs:
+            raise RuntimeError(f"metafieldDelete userErrors: {errs}")
+
+    def metafields_delete(self, metafield_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Deletes many metafields, one aliased metafieldDelete each, many per request
+        (metafieldsDelete needs API 2024-07). Returns metafield id -> error message, None when deleted.
+        """
+        ids = list(dict.fromkeys(metafield_ids))
+        field = "metafieldDelete(input: {id: $id}) { deletedId userErrors { field message } }"
+        results = self.graphql_aliased(field, {"id": "ID!"}, [{"id": i} for i in ids], METAFIELD_DELETE_COST,
+                                       operation="mutation")
+        out: Dict[str, Optional[str]] = {}
+        for mid, node in zip(ids, results):
+            if node is None:
+                out[mid] = "no result"
+                continue
+            errs = node.get("userErrors") or []
+            out[mid] = "; ".join(e.get("message", "") for e in errs) if errs else None
+        return out
+
+    def run_bulk_query(self, query: str) -> Iterator[dict]:
+        """
+        Runs a bulk operation query (no variables, no first/after) and yields its JSONL rows:
+        one per object, nested connection rows carry "__parentId". Waits for the operation.
+        """
+        m = """
+        mutation($query: String!) {
+          bulkOperationRunQuery(query: $query) {
+            bulkOperation { id status }
+            userErrors { field message }
+          }
+        }
+        """
+        data = self.graphql(m, {"query": query})["data"]["bulkOperationRunQuery"]
+        if data["userErrors"]:
+            raise RuntimeError(f"bulkOperationRunQuery userErrors: {data['userErrors']}")
+        op_id = data["bulkOperation"]["id"]
+
+        q = "query { currentBulkOperation { id status errorCode objectCount url } }"
+        while True:
+            node = self.graphql(q)["data"].get("currentBulkOperation") or {}
+            if node.get("id") != op_id:
+                raise RuntimeError(f"Bulk operation {op_id} is no longer the current one ({node.get('id')})")
+            if node["status"] == "COMPLETED":
+                break
+            if node["status"] in ("FAILED", "CANCELED", "EXPIRED"):
+                raise RuntimeError(f"Bulk operation {op_id} {node['status']}: {node.get('errorCode')}")
+            time.sleep(BULK_POLL_SECONDS)
+
+        print(f"Bulk operation {op_id}: {node.get('objectCount')} objects")
+        if not node.get("url"):
+            return
+        resp = self.http.get(node["url"], timeout=Config.REQUEST_TIMEOUT)
+        resp.raise_for_status()
+        for line in resp.text.splitlines():
+            if line.strip():
+                yield json.loads(line)
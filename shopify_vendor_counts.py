@@ -1,73 +1,78 @@
 import json
 from typing import Dict, List, Optional, Tuple
 
-from retail_promotions_to_shopify_metafields import Config, require_env, ShopifyClient, normalize
+from promo_config import Config, require_env, normalize
+from shopify_client import ShopifyClient, ShopifyCountError
+from catalog_mirror import CatalogMirror, open_catalog_mirror
+from run_metrics import METRICS, write_run_metrics
+from run_profiler import profiling
 
-# Optional Excel output dependency
-try:
-    from openpyxl import Workbook
-    _HAS_OPENPYXL = True
-except Exception:
-    _HAS_OPENPYXL = False
 
+def _openpyxl_workbook():
+    # Optional Excel output dependency, imported only when the report is written
+    try:
+        from openpyxl import Workbook
+        return Workbook
+    except Exception:
+        return None
 
-def fetch_vendor_counts() -> Dict[str, int]:
-    require_env()
-    shop = ShopifyClient()
 
-    q = '''
-    query($cursor: String) {
-      products(first: 250, after: $cursor) {
-        pageInfo { hasNextPage endCursor }
-        nodes { id vendor }
-      }
-    }
-    '''
+def fetch_vendor_counts(mirror: Optional[CatalogMirror] = None, shop: Optional[ShopifyClient] = None) -> Dict[str, int]:
+    if mirror is not None:
+        print(f"Reading vendor counts from catalog mirror: {mirror.path}")
+        return mirror.vendor_counts()
+
+    require_env()
+    shop = shop or ShopifyClient()
 
     counts: Dict[str, int] = {}
     display_name: Dict[str, str] = {}
 
-    cursor = None
-    has_next = True
-
-    print("Fetching all products from Shopify...")
-    while has_next:
-        data = shop.graphql(q, {"cursor": cursor})
-        conn = data["data"]["products"]
-        for n in conn["nodes"]:
-            v = (n.get("vendor") or "").strip()
-            if not v:
-                continue
-            key = normalize(v)
-            counts[key] = counts.get(key, 0) + 1
-            if key not in display_name:
-                display_name[key] = v
-
-        has_next = conn["pageInfo"]["hasNextPage"]
-        cursor = conn["pageInfo"]["endCursor"]
+    for _, v in shop.list_product_vendors():
+        METRICS.incr("products")
+        if not v:
+            continue
+        key = normalize(v)
+        counts[key] = counts.get(key, 0) + 1
+        if key not in display_name:
+            display_name[key] = v
 
     # build output mapping with original display names
     out = {display_name[k]: counts[k] for k in counts}
     return out
 
 
-def check_collection_for_vendor(shop: ShopifyClient, vendor: str) -> Tuple[bool, Optional[str], Optional[int]]:
+def check_collection_for_vendor(shop: ShopifyClient, vendor: str,
+                                mirror: Optional[CatalogMirror] = None) -> Tuple[bool, Optional[str], Optional[int]]:
     """
     Check if there's a collection matching the vendor name (case-insensitive).
     Returns: (has_collection, collection_name, collection_product_count)
     """
+    if mirror is not None:
+        col = mirror.find_collection_by_title_exact(vendor)
+        if col:
+            return True, col[1], mirror.count_in_collection(col[0])
+        return False, None, None
+
     col = shop.find_collection_by_title_exact(vendor)
     if col:
         col_id, col_title = col
-        count = shop.rest_count_products_in_collection(col_id)
+        try:
+            count = shop.count_products_in_collection(col_id)
+        except ShopifyCountError as e:
+            print(f"  Error counting collection products: {e}")
+            count = None
         return True, col_title, count
     return False, None, None
 
 
-def main():
+def main(shop: Optional[ShopifyClient] = None):
+    """shop: client to reuse (cli.py passes one shared client and its in-run cache)."""
     print("=== Shopify Vendor Counts with Collection Matching ===")
+    mirror = open_catalog_mirror()
     try:
-        counts = fetch_vendor_counts()
+        with METRICS.span("fetch_vendor_counts"):
+            counts = fetch_vendor_counts(mirror, shop)
     except Exception as e:
         print("Failed to fetch vendor counts:", e)
         return
@@ -79,20 +84,28 @@ def main():
     print(f"Total products counted: {total_products}")
     print("\nChecking for matching collections...")
 
-    shop = ShopifyClient()
+    shop = shop or ShopifyClient()
     results: List[dict] = []
 
-    for idx, (vendor, product_count) in enumerate(counts.items(), 1):
-        print(f"[{idx}/{total_vendors}] Checking vendor: {vendor}")
-        has_collection, collection_name, collection_count = check_collection_for_vendor(shop, vendor)
-        
-        results.append({
-            "vendor": vendor,
-            "vendor_product_count": product_count,
-            "has_collection": has_collection,
-            "collection_name": collection_name if has_collection else "false",
-            "collection_product_count": collection_count if has_collection else "false"
-        })
+    if mirror is None:
+        # collection matches and collection counts in a few batched requests
+        with METRICS.span("prefetch"):
+            shop.prefetch_vendor_collections(list(counts), count_vendors=False)
+
+    with METRICS.span("collection_matching"):
+        for idx, (vendor, product_count) in enumerate(counts.items(), 1):
+            print(f"[{idx}/{total_vendors}] Checking vendor: {vendor}")
+            with METRICS.span("vendor", label=vendor):
+                has_collection, collection_name, collection_count = check_collection_for_vendor(shop, vendor, mirror)
+            METRICS.incr("vendors")
+
+            results.append({
+                "vendor": vendor,
+                "vendor_product_count": product_count,
+                "has_collection": has_collection,
+                "collection_name": collection_name if has_collection else "false",
+                "collection_product_count": collection_count if has_collection else "false"
+            })
 
     # Write JSON output
     with open("shopify_vendor_counts.json", "w", encoding="utf-8") as fh:
@@ -109,7 +122,8 @@ def main():
         print(f"Failed to write CSV: {e}")
 
     # Write Excel output
-    if _HAS_OPENPYXL:
+    Workbook = _openpyxl_workbook()
+    if Workbook is not None:
         try:
             wb = Workbook()
             ws = wb.active
@@ -125,12 +139,15 @@ def main():
                 ])
             wb.save("shopify_vendor_counts.xlsx")
             print("\n✓ Wrote shopify_vendor_counts.json, shopify_vendor_counts.csv and shopify_vendor_counts.xlsx")
+            write_run_metrics("vendor_report")
             return
         except Exception as e:
             print(f"Failed to write xlsx: {e}")
 
     print("\n✓ Wrote shopify_vendor_counts.json and shopify_vendor_counts.csv")
+    write_run_metrics("vendor_report")
 
 
 if __name__ == "__main__":
-    main()
+    with profiling("vendor_report"):
+        main()
@@ -0,0 +1,258 @@
+import argparse
+import json
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from promo_config import Config, PROMO_METAFIELD_KEYS, ShopTarget, require_env, shop_path, shop_targets
+from retail_promotions_to_shopify_metafields import (
+    RetailPromoRow, RetailPromotionsReader, VendorPlan, aggregate_by_vendor, compute_scope_actions,
+    resolve_scope_product_ids,
+)
+from db_pool import DatabaseConnection
+from product_ids import ProductIdSet, product_gid, product_id
+from run_metrics import METRICS, write_run_metrics
+from run_profiler import profiling
+from shopify_client import ShopifyClient
+
+
+"""
+stale_sweep.py
+
+Finds leftover promo dates directly and deletes them.
+
+The sync only cleans up scopes it still sees: a promotion that ended more than
+CLEANUP_LOOKBACK_DAYS before a run (missed runs, a DB row edited or removed) leaves its
+custom.promo_* metafields in Shopify. Widening the lookback makes every run re-read more
+scopes; the sweep instead starts from the products that actually carry promo dates:
+
+1. list them with their promo metafields (SWEEP_SOURCE):
+   bulk     - one bulk operation over the shop's products, ids and values included (default)
+   mirror   - the CATALOG_MIRROR's product_metafields table, then one batched lookup of
+              just those products (refreshed first unless CATALOG_MIRROR_REFRESH=0)
+   snapshot - the same from the CATALOG_SNAPSHOT file
+2. work out what the current plan (same DB read as the sync) leaves on each of them:
+   scopes in plan order, the later scope wins key by key, like the sync
+3. delete every promo metafield the plan does not leave on its product, many per request
+
+Dates the plan sets to another value are counted, not touched: the next sync rewrites them.
+With PROMO_TARGET=collection / metaobject the dates do not live on products, so every
+product promo date is stale (this also finishes a move to those modes).
+
+Cost: the scan, the members of the current scopes among the carrying products, and
+one aliased metafieldDelete per stale metafield. Nothing scales with the lookback window.
+
+DRY_RUN=1 (default) only reports and writes stale_sweep.json.
+
+python stale_sweep.py [--shop NAME] [--source bulk|mirror|snapshot]
+python cli.py stale-sweep
+"""
+
+
+SWEEP_SOURCES = ("bulk", "mirror", "snapshot")
+
+# deletes per progress line
+DELETE_CHUNK = 500
+
+Carried = Dict[int, Dict[str, dict]]   # product id -> promo key -> {id, value}
+
+
+def bulk_query(namespace: str) -> str:
+    return ("{ products { edges { node { id metafields(namespace: %s) { edges { node { id key value } } } } } } }"
+            % json.dumps(namespace))
+
+
+def carried_from_bulk(shop: ShopifyClient, namespace: str) -> Carried:
+    out: Carried = {}
+    for row in shop.run_bulk_query(bulk_query(namespace)):
+        if row.get("__parentId") and row.get("key") in PROMO_METAFIELD_KEYS:
+            out.setdefault(product_id(row["__parentId"]), {})[row["key"]] = {"id": row["id"], "value": row.get("value")}
+    return out
+
+
+def carried_from_catalog(shop: ShopifyClient, catalog, namespace: str) -> Carried:
+    """catalog: CatalogMirror / CatalogSnapshot; its candidates are read live for the metafield ids."""
+    candidates = catalog.product_ids_with_metafields()
+    print(f"  {len(candidates)} products carry promo dates in the local catalog")
+    out: Carried = {}
+    for gid, fields in shop.product_metafields(list(candidates.gids()), namespace).items():
+        promo = {k: mf for k, mf in (fields or {}).items() if k in PROMO_METAFIELD_KEYS}
+        if promo:
+            out[product_id(gid)] = promo
+    return out
+
+
+def expected_dates(vendor_plans: List[VendorPlan], today: date, carriers: ProductIdSet,
+                   shop: ShopifyClient, catalog=None) -> Dict[int, Dict[str, Optional[date]]]:
+    """carrying product in a scope -> promo key -> date the sync leaves on it (None = deleted)"""
+    out: Dict[int, Dict[str, Optional[date]]] = {}
+    for w in vendor_plans:
+        actions = compute_scope_actions(w, today)
+        for pid in resolve_scope_product_ids(w, shop, catalog) & carriers:
+            state = out.setdefault(pid, {})
+            state.update({k: None for k in actions.to_delete})
+            state.update(actions.to_set)
+    return out
+
+
+def find_stale(carried: Carried, expected: Dict[int, Dict[str, Optional[date]]]) -> Tuple[List[dict], int]:
+    """(stale metafields, metafields the plan sets to another date)"""
+    stale: List[dict] = []
+    differing = 0
+    for pid in sorted(carried):
+        state = expected.get(pid)
+        for k, mf in sorted(carried[pid].items()):
+            want = (state or {}).get(k)
+            if want is None:
+                stale.append({"product": product_gid(pid), "key": k, "id": mf["id"], "value": mf.get("value"),
+                              "reason": "in no scope" if state is None else "cleared by its scope"})
+            elif mf.get("value") != want.isoformat():
+                differing += 1
+    return stale, differing
+
+
+def sweep_shop(vendor_plans: List[VendorPlan], today: date, target: ShopTarget,
+               shop: Optional[ShopifyClient] = None, show: int = 20) -> dict:
+    t0 = time.perf_counter()
+    shop = shop or ShopifyClient(target)
+    ns = Config.MF_NAMESPACE
+
+    catalog = None
+    with METRICS.span("sweep_scan"):
+        if Config.SWEEP_SOURCE == "mirror":
+            from catalog_mirror import CatalogMirror
+            catalog = CatalogMirror(shop_path(Config.CATALOG_MIRROR, target))
+            if Config.CATALOG_MIRROR_REFRESH:
+                catalog.refresh(shop)
+        elif Config.SWEEP_SOURCE == "snapshot":
+            from catalog_snapshot import load_snapshot
+            catalog = load_snapshot(shop_path(Config.CATALOG_SNAPSHOT, target))
+            print(f"  Catalog snapshot is {catalog.age_hours():.1f}h old")
+        carried = carried_from_bulk(shop, ns) if catalog is None else carried_from_catalog(shop, catalog, ns)
+    print(f"Products carrying promo dates: {len(carried)} ({sum(len(m) for m in carried.values())} metafields)")
+
+    expected: Dict[int, Dict[str, Optional[date]]] = {}
+    if Config.PROMO_TARGET == "product":
+        with METRICS.span("resolve"):
+            expected = expected_dates(vendor_plans, today, ProductIdSet(carried), shop, catalog)
+        print(f"  {len(expected)} of them are in a scope of the current plan ({len(vendor_plans)} scopes)")
+    else:
+        print(f"  PROMO_TARGET={Config.PROMO_TARGET}: no promo dates belong on products")
+    stale, differing = find_stale(carried, expected)
+
+    by_reason: Dict[str, int] = {}
+    for s in stale:
+        by_reason[s["reason"]] = by_reason.get(s["reason"], 0) + 1
+    print(f"Stale promo metafields: {len(stale)} on {len({s['product'] for s in stale})} products"
+          + (f" ({', '.join(f'{n} {r}' for r, n in sorted(by_reason.items()))})" if by_reason else ""))
+    for s in stale[:show]:
+        print(f"  {s['product']} {s['key']}={s['value']} ({s['reason']})")
+    if len(stale) > show:
+        print(f"  ... {len(stale) - show} more")
+    if differing:
+        print(f"Promo metafields with another date in the plan: {differing} (left to the sync)")
+    METRICS.incr("scopes", len(vendor_plans))
+
+    result = {"shop": target.name or target.shop, "source": Config.SWEEP_SOURCE, "carrying": len(carried),
+              "stale": len(stale), "differing": differing}
+    if target.name:
+        result["name"] = target.name
+    if Config.DRY_RUN:
+        print("Dry run mode. No changes written.")
+        out_file = shop_path("stale_sweep.json", target)
+        try:
+            with open(out_file, "w", encoding="utf-8") as fh:
+                json.dump(stale, fh, ensure_ascii=False, indent=2)
+            print(f"Wrote {out_file}")
+        except Exception as e:
+            print(f"Failed to write {out_file}: {e}")
+    else:
+        deleted = failed = 0
+        for start in range(0, len(stale), DELETE_CHUNK):
+            chunk = stale[start:start + DELETE_CHUNK]
+            with METRICS.span("delete"):
+                errors = shop.metafields_delete(s["id"] for s in chunk)
+            for s in chunk:
+                err = errors.get(s["id"])
+                if err is None:
+                    deleted += 1
+                    METRICS.incr("deletes")
+                else:
+                    failed += 1
+                    print(f"  Failed to delete {s['key']} ({s['id']}) on {s['product']}: {err}")
+            print(f"  Deleted {deleted}/{len(stale)}")
+        print(f"Total stale metafields deleted: {deleted}")
+        result["deleted"] = deleted
+        if failed:
+            result["failed"] = failed
+    result["seconds"] = round(time.perf_counter() - t0, 1)
+    return result
+
+
+def run_sweep(rows: Optional[List[RetailPromoRow]] = None, shop: Optional[ShopifyClient] = None,
+              shop_name: str = "") -> dict:
+    if Config.SWEEP_SOURCE not in SWEEP_SOURCES:
+        raise ValueError(f"SWEEP_SOURCE must be {', '.join(SWEEP_SOURCES)}, got {Config.SWEEP_SOURCE!r}")
+    if Config.SWEEP_SOURCE == "mirror" and not Config.CATALOG_MIRROR:
+        raise ValueError("SWEEP_SOURCE=mirror needs CATALOG_MIRROR")
+    require_env()
+
+    print("=== Stale promo metafield sweep ===")
+    today = datetime.now().date()
+    print(f"Today: {today}")
+    print(f"SWEEP_SOURCE = {Config.SWEEP_SOURCE}")
+    print(f"CLEANUP_LOOKBACK_DAYS = {Config.CLEANUP_LOOKBACK_DAYS}")
+    print(f"DRY_RUN = {Config.DRY_RUN}")
+    if Config.PROMO_TARGET != "product":
+        print(f"PROMO_TARGET = {Config.PROMO_TARGET}")
+    print("")
+
+    if rows is None:
+        with METRICS.span("db_query"):
+            db = DatabaseConnection()
+            try:
+                rows = RetailPromotionsReader(db).fetch_active_today(
+                    Config.Days_Before_Retail_Sale,
+                    Config.Days_Before_Price_Increase,
+                    Config.Days_After_Price_Increase,
+                    Config.CLEANUP_LOOKBACK_DAYS,
+                )
+            finally:
+                db.close()
+    vendor_plans = aggregate_by_vendor(rows, Config.Days_Before_Retail_Sale, Config.Days_Before_Price_Increase,
+                                       Config.Days_After_Price_Increase) if rows else []
+    if not vendor_plans:
+        print("No active/recent retail promotions: every promo date found is stale.")
+    print("")
+
+    targets = [t for t in shop_targets() if not shop_name or t.name == shop_name]
+    if not targets:
+        raise ValueError(f"Unknown shop {shop_name!r}")
+    shops = []
+    for target in targets:
+        if len(targets) > 1:
+            print(f"--- {target.name} ---")
+        # a passed client (cli.py's shared one) serves only its own shop
+        reuse = shop if shop is not None and (len(targets) == 1 or shop.target.name == target.name) else None
+        shops.append(sweep_shop(vendor_plans, today, target if reuse is None else reuse.target, reuse))
+        print("")
+    return {"date": today.isoformat(), "dry_run": Config.DRY_RUN, "shops": shops}
+
+
+def main(rows: Optional[List[RetailPromoRow]] = None, shop: Optional[ShopifyClient] = None, shop_name: str = ""):
+    run_name = "stale_sweep" if not Config.DRY_RUN else "stale_sweep_dry_run"
+    try:
+        with profiling(run_name):
+            return run_sweep(rows, shop, shop_name)
+    finally:
+        write_run_metrics(run_name)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Delete custom.promo_* metafields the current plan does not leave on their products")
+    ap.add_argument("--shop", default="", help="target name from SHOPIFY_SHOPS (default: all)")
+    ap.add_argument("--source", default=Config.SWEEP_SOURCE, choices=SWEEP_SOURCES,
+                    help="where the carrying products come from (same as SWEEP_SOURCE)")
+    args = ap.parse_args()
+    Config.SWEEP_SOURCE = args.source
+    main(shop_name=args.shop)
@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from promo_config import Config, require_env, shop_path, shop_targets
+from db_pool import DatabaseConnection
+from retail_promotions_to_shopify_metafields import (
+    RetailPromoRow, RetailPromotionsReader, ScopeActions, VendorPlan,
+    aggregate_by_vendor, compute_scope_actions, overlap_groups, resolve_scope_product_ids, scope_key,
+    sync_all_shops, sync_shop,
+)
+from product_ids import ProductIdSet
+from run_metrics import METRICS, write_run_metrics
+
+
+"""
+sync_daemon.py
+
+Long-running alternative to the scheduled daily sync. One process keeps the Shopify
+client(s) (HTTP sessions, cost budget), the SQL Server connection pool and the vendor
+column cache warm, and only syncs what changed:
+
+- every DAEMON_POLL_SECONDS it checks SM_Retail_Sales (row count + CHECKSUM_AGG); the
+  promotions are only re-read and re-aggregated when that changed, or on a new day
+- for every scope it remembers what was last applied (which keys are set to which REAL
+  dates, which keys are deleted). A scope whose actions differ today is synced:
+    - new / edited promotions
+    - X/Y/Z display-window boundaries: the day a banner appears (display start) and the
+      day after it ends (display end + 1)
+  A scope that dropped out of SM_Retail_Sales (row removed, or past CLEANUP_LOOKBACK_DAYS)
+  while it still had dates set is cleaned up (all promo keys deleted).
+- scopes that share products overlap (a vendor fallback and its collections, a collection in
+  several scopes, another vendor's products in a collection), so a change re-syncs every
+  scope overlapping it, in plan order, like the full run does
+- after midnight it wakes right away, so banners change on the right day instead of at
+  the next scheduled run
+
+What was applied is kept in DAEMON_STATE (default sync_daemon_state.json), so a restart
+continues without a full sweep; without the file (or with --full) the first pass syncs
+the whole plan. A failed pass keeps the old state and is retried at the next poll; so
+are the scopes of a pass whose writes or deletes failed.
+DRY_RUN=1 keeps the state in memory only (nothing was written).
+
+python sync_daemon.py                 run until stopped (Ctrl+C / SIGTERM)
+python sync_daemon.py --once          one pass, then exit
+python sync_daemon.py --full          ignore DAEMON_STATE: sync the whole plan first
+
+Products that join an already active scope are not noticed until that scope changes
+again (or --full / the daily sync); run catalog_mirror.py / webhook_receiver.py with
+CATALOG_MIRROR for scope resolution that follows the catalog.
+"""
+
+
+def scope_signature(actions: ScopeActions) -> dict:
+    """What a scope writes today: the part of its plan that decides the Shopify state."""
+    return {
+        "set": {k: d.isoformat() for k, d in sorted(actions.to_set.items())},
+        "delete": sorted(actions.to_delete),
+    }
+
+
+def window_transitions(w: VendorPlan) -> List[date]:
+    """Days on which one of the scope's banners appears (display start) or disappears (display end + 1)."""
+    days = []
+    for start, end in ((w.sale_display_start, w.sale_display_end), (w.pi_display_start, w.pi_display_end)):
+        if start is not None and end is not None:
+            days += [start, end + timedelta(days=1)]
+    return days
+
+
+def next_transition(vendor_plans: List[VendorPlan], today: date) -> Tuple[Optional[date], int]:
+    """(next day with a window boundary, number of scopes changing then)"""
+    upcoming: Dict[date, int] = {}
+    for w in vendor_plans:
+        for d in set(window_transitions(w)):
+            if d > today:
+                upcoming[d] = upcoming.get(d, 0) + 1
+    if not upcoming:
+        return None, 0
+    day = min(upcoming)
+    return day, upcoming[day]
+
+
+def affected_plans(vendor_plans: List[VendorPlan], applied: Dict[str, dict], today: date,
+                   scope_products: Optional[Callable[[List[VendorPlan]], List[List[ProductIdSet]]]] = None,
+                   ) -> Tuple[List[VendorPlan], Dict[str, dict]]:
+    """
+    applied: scope key -> {"vendor", "collection_ids", "signature"} of the last successful pass.
+    scope_products: per-scope product ids of each shop, for scopes of different vendors that
+    share products (see overlap_groups); only asked when something changed.
+    Returns (scopes to sync, state after they are synced): every overlap group with a changed
+    or retired scope, retired scopes first (they only delete), then the group's current scopes
+    in plan order, so the scope that wins a shared product still wins it.
+    """
+    current: Dict[str, dict] = {}
+    changed = set()
+    for i, w in enumerate(vendor_plans):
+        key = scope_key(w)
+        signature = scope_signature(compute_scope_actions(w, today))
+        current[key] = {"vendor": w.vendor, "collection_ids": list(w.collection_ids), "signature": signature}
+        if applied.get(key, {}).get("signature") != signature:
+            changed.add(i)
+
+    retired: List[VendorPlan] = []
+    for key, entry in applied.items():
+        if key in current or not entry["signature"]["set"]:
+            continue
+        # no display windows -> compute_scope_actions() deletes every promo key
+        retired.append(VendorPlan(vendor=entry["vendor"], collection_ids=list(entry["collection_ids"])))
+    if not changed and not retired:
+        return [], current
+
+    scopes = retired + vendor_plans
+    groups = overlap_groups(scopes, scope_products(scopes) if scope_products is not None else ())
+    hit = {groups[i] for i in range(len(retired))} | {groups[len(retired) + i] for i in changed}
+    return [w for i, w in enumerate(scopes) if groups[i] in hit], current
+
+
+def unfinished_scopes(results: List[dict], synced: List[VendorPlan]) -> List[str]:
+    """
+    Keys of the synced scopes that are not fully applied: failed writes/deletes or left by a
+    time budget. PROMO_TARGET=collection / metaobject only report a failure count, so a
+    failure there leaves the whole pass unapplied.
+    """
+    keys: List[str] = []
+    for r in results:
+        if r.get("failed") and "failed_scopes" not in r:
+            return [scope_key(w) for w in synced]
+        keys += r.get("failed_scopes", []) + r.get("left_scope_keys", [])
+    return list(dict.fromkeys(keys))
+
+
+def applied_state(state: Dict[str, dict], applied: Dict[str, dict], unfinished: List[str]) -> Dict[str, dict]:
+    """
+    State to record after a pass: unfinished current scopes are left out (synced again at the
+    next pass), unfinished retired scopes keep their old entry (cleaned up again).
+    """
+    out = {k: v for k, v in state.items() if k not in unfinished}
+    for key in unfinished:
+        if key not in state and key in applied:
+            out[key] = applied[key]
+    return out
+
+
+def load_state(path: str) -> Dict[str, dict]:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh).get("scopes") or {}
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Ignoring unreadable {path}: {e}")
+        return {}
+
+
+def save_state(path: str, scopes: Dict[str, dict]) -> None:
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"saved_at": datetime.now().isoformat(timespec="seconds"), "scopes": scopes},
+                  fh, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _read_promotions() -> List[RetailPromoRow]:
+    db = DatabaseConnection()
+    try:
+        return RetailPromotionsReader(db).fetch_active_today(
+            Config.Days_Before_Retail_Sale,
+            Config.Days_Before_Price_Increase,
+            Config.Days_After_Price_Increase,
+            Config.CLEANUP_LOOKBACK_DAYS,
+        )
+    finally:
+        db.close()
+
+
+def _promotions_checksum():
+    db = DatabaseConnection()
+    try:
+        return RetailPromotionsReader(db).table_checksum()
+    finally:
+        db.close()
+
+
+class SyncDaemon:
+    """
+    read_rows / checksum: replace the SM_Retail_Sales reads (benchmarks / tests); checksum
+    may return anything comparable, a changed value means "re-read the promotions".
+    """
+
+    def __init__(self, state_path: Optional[str] = None, full: bool = False,
+                 read_rows: Optional[Callable[[], List[RetailPromoRow]]] = None,
+                 checksum: Optional[Callable[[], object]] = None):
+        if Config.SYNC_SHARD:
+            raise ValueError("sync_daemon.py does not run sharded; unset SYNC_SHARD.")
+        self.offline = Config.DRY_RUN and Config.DRY_RUN_OFFLINE
+        if not self.offline:
+            require_env()
+        self.targets = shop_targets()
+        self.state_path = "" if Config.DRY_RUN else (Config.DAEMON_STATE if state_path is None else state_path)
+        self.applied: Dict[str, dict] = {} if full else load_state(self.state_path)
+        self.read_rows = read_rows or _read_promotions
+        self.checksum = checksum or _promotions_checksum
+        self.clients = {}
+        self.vendor_plans: Optional[List[VendorPlan]] = None
+        self._plan_date: Optional[date] = None
+        self._checksum = None
+        self._cache_date: Optional[date] = None
+        self.stop_event = threading.Event()
+        self.passes = 0
+        self.failures = 0
+
+    def _clients(self, today: date) -> Dict[str, object]:
+        if self.offline:
+            return {}
+        from shopify_client import ShopifyClient
+        for t in self.targets:
+            if t.name not in self.clients:
+                self.clients[t.name] = ShopifyClient(t)
+        if self._cache_date != today:
+            # product id lists / collection lookups are kept for a day; sessions and budgets for good
+            for client in self.clients.values():
+                client.clear_cache()
+            self._cache_date = today
+        return self.clients
+
+    def _scope_products(self, scopes: List[VendorPlan], today: date) -> List[List[ProductIdSet]]:
+        """Each shop's product ids per scope: from its CATALOG_MIRROR, else from the API (kept by the clients for the day)."""
+        clients = self._clients(today)
+        out = []
+        for t in self.targets:
+            if Config.CATALOG_MIRROR:
+                from catalog_mirror import CatalogMirror
+                mirror = CatalogMirror(shop_path(Config.CATALOG_MIRROR, t))
+                try:
+                    out.append([resolve_scope_product_ids(w, catalog=mirror) for w in scopes])
+                finally:
+                    mirror.close()
+            else:
+                out.append([resolve_scope_product_ids(w, clients[t.name]) for w in scopes])
+        return out
+
+    def _refresh_plan(self, today: date) -> None:
+        checksum = self.checksum()
+        if self.vendor_plans is not None and today == self._plan_date and checksum == self._checksum:
+            return
+        reason = "start" if self.vendor_plans is None else ("new day" if today != self._plan_date else "SM_Retail_Sales changed")
+        rows = self.read_rows() or []
+        self.vendor_plans = aggregate_by_vendor(rows, Config.Days_Before_Retail_Sale,
+                                                Config.Days_Before_Price_Increase, Config.Days_After_Price_Increase)
+        self._plan_date = today
+        self._checksum = checksum
+        print(f"Plan reloaded ({reason}): {len(rows)} promotions, {len(self.vendor_plans)} scopes")
+
+    def _sync(self, vendor_plans: List[VendorPlan], today: date) -> List[dict]:
+        clients = self._clients(today)
+        if len(self.targets) == 1:
+            t = self.targets[0]
+            return [sync_shop(vendor_plans, today, t, clients.get(t.name))]
+        return sync_all_shops(vendor_plans, today, self.targets, clients)
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        """One pass. Returns the number of scopes synced."""
+        today = (now or datetime.now()).date()
+        self._refresh_plan(today)
+        to_sync, state = affected_plans(self.vendor_plans, self.applied, today,
+                                        None if self.offline else lambda scopes: self._scope_products(scopes, today))
+        self.passes += 1
+
+        if to_sync:
+            print(f"[{datetime.now().isoformat(timespec='seconds')}] Syncing {len(to_sync)} of "
+                  f"{len(self.vendor_plans)} scopes ({today})")
+            METRICS.reset()
+            try:
+                with METRICS.span("daemon_pass"):
+                    results = self._sync(to_sync, today)
+            finally:
+                write_run_metrics("daemon_sync")
+            unfinished = unfinished_scopes(results, to_sync)
+            if unfinished:
+                print(f"{len(unfinished)} scopes not fully applied; retried at the next pass")
+                state = applied_state(state, self.applied, unfinished)
+        if state != self.applied:
+            self.applied = state
+            save_state(self.state_path, state)
+
+        day, scopes = next_transition(self.vendor_plans, today)
+        if day is not None:
+            print(f"Next display-window transition: {day} ({scopes} scopes)")
+        return len(to_sync)
+
+    def seconds_until_next_pass(self, now: Optional[datetime] = None) -> float:
+        """Next poll, or just after midnight when that comes first (window boundaries are days)."""
+        now = now or datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) + timedelta(seconds=5)
+        return max(1.0, min(Config.DAEMON_POLL_SECONDS, (midnight - now).total_seconds()))
+
+    def run(self) -> None:
+        print(f"Sync daemon: {len(self.targets)} shop(s), poll every {Config.DAEMON_POLL_SECONDS:g}s, "
+              f"DRY_RUN={Config.DRY_RUN}, state={self.state_path or '(memory)'} ({len(self.applied)} scopes)")
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                # DB / Shopify outage: keep the last applied state and try again at the next poll
+                self.failures += 1
+                print(f"Daemon pass failed: {type(e).__name__}: {e}")
+            self.stop_event.wait(self.seconds_until_next_pass())
+        print(f"Sync daemon stopped after {self.passes} passes ({self.failures} failed)")
+
+    def stop(self, *_args) -> None:
+        self.stop_event.set()
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Keep promo metafields in sync with SM_Retail_Sales continuously")
+    ap.add_argument("--once", action="store_true", help="one pass, then exit")
+    ap.add_argument("--full", action="store_true", help="ignore DAEMON_STATE and sync the whole plan first")
+    args = ap.parse_args(argv)
+
+    daemon = SyncDaemon(full=args.full)
+    if args.once:
+        daemon.run_once()
+        return 0
+    signal.signal(signal.SIGTERM, daemon.stop)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
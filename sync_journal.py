@@ -0,0 +1,113 @@
+import json
+import os
+from datetime import date
+from typing import Optional, Set, Tuple
+
+
+"""
+sync_journal.py
+
+Append-only journal of Shopify writes/deletes that were CONFIRMED during a
+real (DRY_RUN=0) run of retail_promotions_to_shopify_metafields.main().
+
+- One journal file per (run date, plan fingerprint).
+  If SM_Retail_Sales changes, the fingerprint changes and the old journal is ignored.
+- Each line is one completed (scope, product, operation) entry.
+- A restart on the same day with the same plan skips entries that are already in the journal.
+- When the run completes, the journal (and any stale journals) is discarded.
+"""
+
+
+JOURNAL_PREFIX = "sync_journal_"
+
+# product value used for whole-scope markers (scope fully processed)
+SCOPE_DONE = "*"
+
+
+class SyncJournal:
+    def __init__(self, directory: str, run_date: date, fingerprint: str):
+        self.directory = directory
+        self.run_date = run_date
+        self.fingerprint = fingerprint
+        self.path = os.path.join(directory, f"{JOURNAL_PREFIX}{run_date.isoformat()}_{fingerprint}.jsonl")
+
+        self._done: Set[Tuple[str, str, str]] = set()
+        self._fh = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._fh = open(self.path, "a", encoding="utf-8")
+        if self._ends_mid_line():
+            # terminate a torn last line so the next entry starts on its own line
+            self._fh.write("\n")
+            self._fh.flush()
+
+    def _ends_mid_line(self) -> bool:
+        if os.path.getsize(self.path) == 0:
+            return False
+        with open(self.path, "rb") as fh:
+            fh.seek(-1, os.SEEK_END)
+            return fh.read(1) != b"\n"
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    e = json.loads(line)
+                    self._done.add((e["scope"], e["product"], e["op"]))
+                except Exception:
+                    # A crash can leave a half-written last line. Ignore it: that
+                    # operation was not confirmed, so it will simply be repeated.
+                    continue
+
+    @property
+    def resumed_entries(self) -> int:
+        return len(self._done)
+
+    def is_done(self, scope: str, product: str, op: str) -> bool:
+        return (scope, product, op) in self._done
+
+    def is_scope_done(self, scope: str) -> bool:
+        return self.is_done(scope, SCOPE_DONE, "scope")
+
+    def record(self, scope: str, product: str, op: str) -> None:
+        key = (scope, product, op)
+        if key in self._done:
+            return
+        self._fh.write(json.dumps({"scope": scope, "product": product, "op": op}, ensure_ascii=False) + "\n")
+        # flush + fsync so the entry survives the process being killed right after the API call
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._done.add(key)
+
+    def record_scope_done(self, scope: str) -> None:
+        self.record(scope, SCOPE_DONE, "scope")
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def complete(self) -> None:
+        """
+        Run finished: the journal is no longer needed.
+        Also removes journals left behind by older days / older plans.
+        """
+        self.close()
+        for name in os.listdir(self.directory):
+            if name.startswith(JOURNAL_PREFIX) and name.endswith(".jsonl"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+def open_journal(directory: str, run_date: date, fingerprint: str, enabled: bool = True) -> Optional[SyncJournal]:
+    if not enabled:
+        return None
+    return SyncJournal(directory, run_date, fingerprint)
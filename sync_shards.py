@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+from promo_config import suffixed_path
+from product_ids import ProductIdSet, product_gid
+
+
+"""
+sync_shards.py
+
+Deterministic split of one day's sync across several workers (processes or hosts):
+
+    SYNC_SHARD=1/4 python retail_promotions_to_shopify_metafields.py     (or --shard 1/4)
+    ...
+    SYNC_SHARD=4/4 python retail_promotions_to_shopify_metafields.py
+    python tools/merge_shards.py sync_shards/<date>_<plan>
+
+Every worker reads and aggregates the same plan. Real runs (DRY_RUN=0) then resolve all
+scopes and dedup products globally: each product is owned by exactly one shard, picked by
+a stable hash of SHARD_KEY:
+- product  the product id (default, most even split)
+- scope    the first scope (in plan order) the product belongs to, so a scope's products
+           mostly stay together
+The owning shard applies every scope that covers the product, in plan order, so the end
+state is the same as an unsharded run and no two workers write the same product.
+
+Dry runs (counts only, nothing written) split whole scopes by a hash of the scope key.
+
+Each worker writes <SYNC_SHARD_DIR>/<date>_<plan>/shard<i>of<N>.json with its results and
+run metrics; tools/merge_shards.py combines them.
+"""
+
+
+Shard = Tuple[int, int]   # (i, n), 1 <= i <= n
+
+SHARD_KEYS = ("product", "scope")
+
+
+def parse_shard(spec: str) -> Optional[Shard]:
+    """"2/4" -> (2, 4); "" -> None"""
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    try:
+        i, n = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N (e.g. 2/4), got {spec!r}")
+    if n < 1 or not 1 <= i <= n:
+        raise ValueError(f"Shard {spec!r} out of range: need 1 <= i <= N")
+    return i, n
+
+
+def shard_label(shard: Shard) -> str:
+    return f"shard{shard[0]}of{shard[1]}"
+
+
+def shard_of(key: str, n: int) -> int:
+    """1-based shard of a key. Stable across processes and hosts (unlike hash())."""
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % n + 1
+
+
+def in_shard(key: str, shard: Shard) -> bool:
+    return shard_of(key, shard[1]) == shard[0]
+
+
+def owned_products(scopes: Iterable[Tuple[str, ProductIdSet]], shard: Shard,
+                   key: str = "product") -> Tuple[ProductIdSet, int]:
+    """
+    scopes: (scope key, product ids) in plan order.
+    Returns (product ids this shard owns, number of distinct products in the plan).
+    """
+    if key not in SHARD_KEYS:
+        raise ValueError(f"SHARD_KEY must be one of {', '.join(SHARD_KEYS)}, got {key!r}")
+    owner: Dict[int, str] = {}
+    for scope, product_ids in scopes:
+        for pid in product_ids:
+            owner.setdefault(pid, scope)
+    # hashed on the gid, as before the ids were numeric, so shard assignment is unchanged
+    mine = ProductIdSet(pid for pid, scope in owner.items() if in_shard(product_gid(pid) if key == "product" else scope, shard))
+    return mine, len(owner)
+
+
+def shard_path(path: str, shard: Optional[Shard]) -> str:
+    """Per-shard variant of an output/state path: vendor_product_counts.json -> vendor_product_counts_shard2of4.json"""
+    return suffixed_path(path, shard_label(shard)) if shard else path
+
+
+def shard_result_path(directory: str, run_date: str, plan: str, shard: Shard) -> str:
+    return os.path.join(directory, f"{run_date}_{plan}", f"{shard_label(shard)}.json")
+
+
+def write_shard_result(directory: str, shard: Shard, key: str, run: Optional[dict], metrics: dict) -> Optional[str]:
+    """
+    run: what run_sync() returned (date, plan, shops). A failed worker writes nothing, so
+    tools/merge_shards.py reports its shard as missing until it is re-run.
+    """
+    if not run:
+        return None
+    path = shard_result_path(directory, run["date"], run["plan"], shard)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {
+        "shard": list(shard),
+        "shard_key": key,
+        "date": run["date"],
+        "plan": run["plan"],
+        "dry_run": run.get("dry_run"),
+        "shops": run.get("shops") or [],
+        "metrics": metrics,
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    print(f"Wrote shard result: {path}")
+    return path
@@ -1,4 +1,5 @@
-from retail_promotions_to_shopify_metafields import Config, ShopifyClient, require_env
+from promo_config import Config, require_env
+from shopify_client import ShopifyClient
 
 def test_api():
     try:
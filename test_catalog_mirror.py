@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "tools"))
+
+from catalog_mirror import CatalogMirror  # noqa: E402
+from mock_shopify_server import MockShop, MockShopifyServer, SyntheticCatalog  # noqa: E402
+from promo_config import Config, ShopTarget  # noqa: E402
+from shopify_client import ShopifyClient  # noqa: E402
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    for name, value in {"SLEEP_BETWEEN_CALLS": 0, "RESPONSE_CACHE_PATH": "", "CATALOG_MIRROR": ""}.items():
+        monkeypatch.setattr(Config, name, value)
+    server = MockShopifyServer(MockShop(SyntheticCatalog(30, vendors=4), max_cost=2000.0, restore_rate=2000.0)).start()
+    yield server
+    server.stop()
+
+
+def test_delta_refresh_keeps_products_updated_in_the_watermark_second(mock, tmp_path):
+    client = ShopifyClient(ShopTarget("", "mock.myshopify.com", "x", mock.url))
+    mirror = CatalogMirror(str(tmp_path / "mirror.sqlite"))
+    assert mirror.refresh(client)["products_fetched"] == 30
+
+    # a product updated in the same second as the newest one already mirrored
+    catalog = mock.shop.catalog
+    watermark = catalog.updated_at(29)
+    updated_at = catalog.updated_at
+    catalog.updated_at = lambda i: watermark if i == 30 else updated_at(i)
+    catalog.n = 31
+
+    assert mirror.refresh(client)["products_fetched"] == 2   # the boundary product is re-read
+    assert mirror.product_count() == 31
+    assert mirror.product_updated_at("gid://shopify/Product/31") == watermark
+    mirror.close()
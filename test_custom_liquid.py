@@ -0,0 +1,284 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from collection_promos import vendor_handle
+
+
+"""
+test_custom_liquid.py
+
+Renders the promo banner ("Custom liquid.liquid") for sample products and checks which
+banner and dates come out, for every PROMO_TARGET lookup: scope metaobject referenced by
+the product -> product metafields -> first collection with dates -> vendor record in
+shop.metafields.custom.promo_vendors.
+
+The interpreter below covers only what the template uses: comment, assign, if/else,
+for/break, and/or, == != > >= <= (and == / != blank), the filters date, plus, minus,
+times, handleize. Anything else raises LiquidError, so a template edit that needs more
+fails here instead of rendering wrong. Dates and 'now' are read as UTC.
+"""
+
+
+TEMPLATE = Path(__file__).resolve().parent / "Custom liquid.liquid"
+TODAY = date(2026, 3, 10)
+
+
+class LiquidError(Exception):
+    pass
+
+
+class _Break(Exception):
+    pass
+
+
+_TAG_RE = re.compile(r"({%.*?%}|{{.*?}})", re.S)
+_PATH_RE = re.compile(r"\[([^\]]+)\]|\.?(\w+)")
+_COMPARE_RE = re.compile(r"^(.+?)\s*(==|!=|>=|<=|>)\s*(.+)$")
+
+
+def _is_blank(v: Any) -> bool:
+    if isinstance(v, str):
+        return not v.strip()
+    return v is None or v is False or v in ([], {})
+
+
+def _number(v: Any) -> int:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _date(v: Any, fmt: str, now: datetime) -> Any:
+    text = str(v or "").strip()
+    if text == "now":
+        d = now
+    else:
+        try:
+            d = datetime.fromisoformat(text).replace(tzinfo=timezone.utc)
+        except ValueError:
+            return v
+    # %s and %-d are platform extensions of strftime
+    return d.strftime(fmt.replace("%s", str(int(d.timestamp()))).replace("%-d", str(d.day)))
+
+
+class LiquidTemplate:
+    def __init__(self, source: str, now: datetime):
+        self.now = now
+        self._tokens = [p for p in _TAG_RE.split(source) if p]
+        self._pos = 0
+        self.nodes = self._parse_block(())[0]
+
+    def _parse_block(self, stop):
+        body = []
+        while self._pos < len(self._tokens):
+            part = self._tokens[self._pos]
+            self._pos += 1
+            if part.startswith("{{"):
+                body.append(("output", part[2:-2].strip()))
+                continue
+            if not part.startswith("{%"):
+                body.append(("text", part))
+                continue
+            name, _, rest = part[2:-2].strip().partition(" ")
+            if name in stop:
+                return body, name
+            if name == "comment":
+                while self._tokens[self._pos][2:-2].strip() != "endcomment":
+                    self._pos += 1
+                self._pos += 1
+            elif name == "assign":
+                target, _, expr = rest.partition("=")
+                body.append(("assign", target.strip(), expr.strip()))
+            elif name == "if":
+                then, end = self._parse_block(("else", "endif"))
+                otherwise = self._parse_block(("endif",))[0] if end == "else" else []
+                body.append(("if", rest.strip(), then, otherwise))
+            elif name == "for":
+                var, _, items = rest.partition(" in ")
+                body.append(("for", var.strip(), items.strip(), self._parse_block(("endfor",))[0]))
+            elif name == "break":
+                body.append(("break",))
+            else:
+                raise LiquidError(f"unsupported tag: {{% {name} %}}")
+        if stop:
+            raise LiquidError(f"missing {{% {stop[-1]} %}}")
+        return body, None
+
+    def _value(self, text: str, scope: Dict[str, Any]) -> Any:
+        text = text.strip()
+        if len(text) >= 2 and text[0] in "'\"" and text[-1] == text[0]:
+            return text[1:-1]
+        if re.fullmatch(r"-?\d+", text):
+            return int(text)
+        if text in ("true", "false"):
+            return text == "true"
+        parts = list(_PATH_RE.finditer(text))
+        value = scope.get(parts[0].group(2))
+        for m in parts[1:]:
+            # a[b]: evaluated key; a.b: literal key
+            key = self._value(m.group(1), scope) if m.group(1) is not None else m.group(2)
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+
+    def _expression(self, text: str, scope: Dict[str, Any]) -> Any:
+        head, *filters = text.split("|")
+        value = self._value(head, scope)
+        for f in filters:
+            name, _, arg = (s.strip() for s in f.partition(":"))
+            arg = self._value(arg, scope) if arg else None
+            if name == "date":
+                value = _date(value, arg, self.now)
+            elif name in ("plus", "minus", "times"):
+                a, b = _number(value), _number(arg)
+                value = a + b if name == "plus" else a - b if name == "minus" else a * b
+            elif name == "handleize":
+                value = vendor_handle(str(value or ""))
+            else:
+                raise LiquidError(f"unsupported filter: {name}")
+        return value
+
+    def _compare(self, text: str, scope: Dict[str, Any]) -> bool:
+        m = _COMPARE_RE.match(text.strip())
+        if not m:
+            return self._value(text, scope) not in (None, False)
+        left, op, right = self._value(m.group(1), scope), m.group(2), m.group(3).strip()
+        if right == "blank":
+            return _is_blank(left) == (op == "==")
+        right = self._value(right, scope)
+        if op in ("==", "!="):
+            return (left == right) == (op == "==")
+        if left is None or right is None:
+            return False
+        return {">": left > right, ">=": left >= right, "<=": left <= right}[op]
+
+    def _condition(self, text: str, scope: Dict[str, Any]) -> bool:
+        # Liquid: no precedence, and/or evaluated right to left
+        tokens = re.split(r"\s+(and|or)\s+", text)
+        result = self._compare(tokens[-1], scope)
+        for i in range(len(tokens) - 3, -1, -2):
+            left = self._compare(tokens[i], scope)
+            result = (left and result) if tokens[i + 1] == "and" else (left or result)
+        return result
+
+    def _render(self, nodes: list, scope: Dict[str, Any], out: List[str]) -> None:
+        for node in nodes:
+            if node[0] == "text":
+                out.append(node[1])
+            elif node[0] == "output":
+                out.append(str(self._expression(node[1], scope) or ""))
+            elif node[0] == "assign":
+                scope[node[1]] = self._expression(node[2], scope)
+            elif node[0] == "if":
+                self._render(node[2] if self._condition(node[1], scope) else node[3], scope, out)
+            elif node[0] == "for":
+                try:
+                    for item in self._value(node[2], scope) or []:
+                        scope[node[1]] = item
+                        self._render(node[3], scope, out)
+                except _Break:
+                    pass
+            elif node[0] == "break":
+                raise _Break()
+
+    def render(self, **variables) -> str:
+        out: List[str] = []
+        self._render(self.nodes, dict(variables), out)
+        return "".join(out)
+
+
+def banner_text(html: str) -> Optional[str]:
+    """Visible text of the rendered banner(s), None when there is none."""
+    body = re.sub(r"<style>.*?</style>", "", html, flags=re.S)
+    if 'class="ul-promo-banner"' not in body:
+        return None
+    return " ".join(re.sub(r"<[^>]+>", " ", body).replace("$", " ").split())
+
+
+# =========================
+# Cases
+# =========================
+def d(n: int) -> date:
+    return TODAY + timedelta(days=n)
+
+
+def fmt(n: int) -> str:
+    return f"{d(n):%b} {d(n).day}"
+
+
+def metafields(**dates: date) -> dict:
+    return {"custom": {f"promo_{k}": {"value": v.isoformat()} for k, v in dates.items()}}
+
+
+def product(vendor: str = "Acme Tools", collections: Optional[List[dict]] = None,
+            scope: Optional[dict] = None, **dates) -> dict:
+    """scope: dates of the referenced promo scope metaobject (PROMO_TARGET=metaobject)"""
+    mf = metafields(**dates)
+    if scope is not None:
+        mf["custom"]["promo_scope"] = {"value": metafields(**scope)["custom"]}
+    return {"vendor": vendor, "metafields": mf, "collections": collections or []}
+
+
+def collection(title: str, **dates) -> dict:
+    return {"title": title, "metafields": metafields(**dates)}
+
+
+def shop(vendor: str = "", **dates) -> dict:
+    """shop.metafields.custom.promo_vendors holding one vendor record (PROMO_TARGET=collection)"""
+    if not vendor:
+        return {"metafields": {}}
+    record = {vendor_handle(vendor): {f"promo_{k}": v.isoformat() for k, v in dates.items()}}
+    return {"metafields": {"custom": {"promo_vendors": {"value": record}}}}
+
+
+SALE = {"sale_start_date": d(1), "sale_end_date": d(7)}
+OTHER_SALE = {"sale_start_date": d(-2), "sale_end_date": d(3)}
+PI_OPEN = {"pi_start_date": d(5)}
+PI_RANGE = {"pi_start_date": d(3), "pi_end_date": d(20)}
+
+CASES = {
+    "product metafields": (product(**SALE), shop(), f"On Sale {fmt(1)} - {fmt(7)}!"),
+    "collection": (product(collections=[collection("Frontpage"), collection("Acme Sale", **SALE)]), shop(),
+                   f"On Sale {fmt(1)} - {fmt(7)}!"),
+    "vendor record": (product(), shop("Acme Tools", **PI_OPEN), f"Price Increase Starts on {fmt(5)}!"),
+    "vendor record, PI with end": (product(), shop("Acme Tools", **PI_RANGE),
+                                   f"Price Increase {fmt(3)} - {fmt(20)}!"),
+    "product before collection": (product(collections=[collection("Acme Sale", **OTHER_SALE)], **SALE), shop(),
+                                  f"On Sale {fmt(1)} - {fmt(7)}!"),
+    "collection before vendor record": (product(collections=[collection("Acme Sale", **OTHER_SALE)]),
+                                        shop("Acme Tools", **PI_OPEN), f"On Sale {fmt(-2)} - {fmt(3)}!"),
+    "first collection with dates": (product(collections=[collection("A", **OTHER_SALE), collection("B", **SALE)]),
+                                    shop(), f"On Sale {fmt(-2)} - {fmt(3)}!"),
+    "promo_scope reference": (product(scope=PI_RANGE), shop(), f"Price Increase {fmt(3)} - {fmt(20)}!"),
+    "promo_scope before product dates": (product(scope=OTHER_SALE, **SALE), shop(),
+                                         f"On Sale {fmt(-2)} - {fmt(3)}!"),
+    "promo_scope with cleared dates": (product(scope={}, **SALE), shop(), None),
+    "other vendor in record": (product(), shop("Other Co", **SALE), None),
+    "sale not yet in window": (product(collections=[collection("Acme Sale", sale_start_date=d(5),
+                                                               sale_end_date=d(9))]), shop(), None),
+    "sale over": (product(), shop("Acme Tools", sale_start_date=d(-9), sale_end_date=d(-1)), None),
+    "no dates anywhere": (product(collections=[collection("Frontpage")]), shop(), None),
+}
+
+
+@pytest.fixture(scope="module")
+def template() -> LiquidTemplate:
+    now = datetime(TODAY.year, TODAY.month, TODAY.day, 12, tzinfo=timezone.utc)
+    return LiquidTemplate(TEMPLATE.read_text(encoding="utf-8"), now)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_banner(template, name):
+    p, s, expected = CASES[name]
+    assert banner_text(template.render(product=p, shop=s)) == expected
+
+
+def test_unsupported_liquid_fails_loudly():
+    with pytest.raises(LiquidError):
+        LiquidTemplate("{% unless x %}{% endunless %}", datetime.now(timezone.utc))
+    with pytest.raises(LiquidError):
+        LiquidTemplate("{{ x | upcase }}", datetime.now(timezone.utc)).render(x="a")
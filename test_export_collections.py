@@ -5,7 +5,8 @@ import time
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
 
-from retail_promotions_to_shopify_metafields import Config, ShopifyClient, require_env
+from promo_config import Config, require_env
+from shopify_client import ShopifyClient
 
 
 def parse_numeric_id(gid: str) -> Optional[int]:
@@ -58,8 +59,6 @@ def list_collections(client: ShopifyClient, limit: int = 5) -> List[Dict[str, st
 
 def get_vendors_in_collection(client: ShopifyClient, collection_id: str) -> List[str]:
     vendors = set()
-    cursor = None
-    has_next = True
 
     q = """
     query($id: ID!, $cursor: String) {
@@ -72,15 +71,10 @@ def get_vendors_in_collection(client: ShopifyClient, collection_id: str) -> List
     }
     """
 
-    while has_next:
-        data = client.graphql(q, {"id": collection_id, "cursor": cursor})
-        conn = data["data"]["collection"]["products"]
-        for n in conn.get("nodes", []):
-            v = (n.get("vendor") or "").strip()
-            if v:
-                vendors.add(v)
-        has_next = conn["pageInfo"]["hasNextPage"]
-        cursor = conn["pageInfo"]["endCursor"]
+    for n in client.paginate(q, {"id": collection_id}, ("collection", "products")):
+        v = (n.get("vendor") or "").strip()
+        if v:
+            vendors.add(v)
 
     return sorted(vendors)
 
@@ -0,0 +1,60 @@
+import random
+
+from product_ids import ProductIdSet, product_gid, product_id
+
+
+def test_product_id_accepts_gids_strings_and_ints():
+    assert product_id("gid://shopify/Product/123") == 123
+    assert product_id("123") == 123
+    assert product_id(123) == 123
+    assert product_gid(123) == "gid://shopify/Product/123"
+
+
+def test_built_sorted_and_deduplicated():
+    s = ProductIdSet(["gid://shopify/Product/3", 1, "2", 3])
+    assert list(s) == [1, 2, 3]
+    assert len(s) == 3
+    assert list(s.gids()) == [product_gid(1), product_gid(2), product_gid(3)]
+    assert s.nbytes == 24
+
+
+def test_membership_by_id_or_gid():
+    s = ProductIdSet([5, 9])
+    assert 5 in s and "gid://shopify/Product/9" in s
+    assert 7 not in s and "not a product" not in s and None not in s
+
+
+def test_union():
+    a, b, c = ProductIdSet([1, 3]), ProductIdSet([2, 3]), ProductIdSet([10])
+    assert list(a | b) == [1, 2, 3]
+    assert list(a.union(b, c)) == [1, 2, 3, 10]
+    assert a.union() is a and a.union(ProductIdSet()) is a
+    assert ProductIdSet().union(b) is b
+
+
+def test_intersection():
+    a, b = ProductIdSet([1, 2, 3, 4]), ProductIdSet([3, 4, 5])
+    assert list(a & b) == [3, 4]
+    assert a & b == b & a
+    assert len(a & ProductIdSet()) == 0
+
+
+def test_from_sorted_and_equality():
+    assert ProductIdSet.from_sorted([1, 2, 3]) == ProductIdSet([3, 2, 1])
+    assert ProductIdSet([1]) != ProductIdSet([2])
+    assert ProductIdSet([1]) != [1]
+
+
+def test_operations_match_python_sets():
+    rng = random.Random(7)
+    for _ in range(50):
+        raw = [[rng.randrange(200) for _ in range(rng.randrange(0, 80))] for _ in range(3)]
+        a, b, c = (ProductIdSet(r) for r in raw)
+        assert list(a) == sorted(set(raw[0]))
+        assert list(a.union(b, c)) == sorted(set(raw[0]) | set(raw[1]) | set(raw[2]))
+        assert list(a & b) == sorted(set(raw[0]) & set(raw[1]))
+
+
+def test_intersection_of_a_small_and_a_large_set():
+    large = ProductIdSet(range(0, 100000, 3))
+    assert list(ProductIdSet([2, 3, 99999, 100002]) & large) == [3, 99999]
@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+
+from product_ids import ProductIdSet
+from retail_promotions_to_shopify_metafields import (
+    VendorPlan, compute_scope_actions, overlap_groups, schedule_scopes, scope_key,
+)
+from sync_daemon import affected_plans, scope_signature
+
+
+TODAY = date(2026, 3, 10)
+
+
+def sale(vendor: str, collection_ids=None, starts: int = -5) -> VendorPlan:
+    """A sale scope whose banner appeared `starts` days from TODAY (0 = appears today)."""
+    start = TODAY + timedelta(days=starts)
+    return VendorPlan(vendor=vendor, collection_ids=list(collection_ids or []),
+                      sale_display_start=start - timedelta(days=5), sale_display_end=start + timedelta(days=20),
+                      sale_real_start=start, sale_real_end=start + timedelta(days=20))
+
+
+def appearing(vendor: str, collection_ids=None) -> VendorPlan:
+    w = sale(vendor, collection_ids)
+    w.sale_display_start = TODAY
+    return w
+
+
+def order_of(plans, **kwargs):
+    return [i for i, _ in schedule_scopes(plans, TODAY, **kwargs)]
+
+
+def test_urgent_scope_goes_first_when_nothing_overlaps():
+    plans = [sale("Acme", ["1"]), appearing("Beta", ["2"])]
+    assert schedule_scopes(plans, TODAY) == [(1, 0), (0, 2)]
+
+
+def test_two_vendors_sharing_one_collection_keep_plan_order():
+    # Beta's banner appears today, but Acme's scope comes first in the plan and writes the
+    # same products: Acme moves up with it, so Beta still wins the shared products
+    plans = [sale("Acme", ["100"]), appearing("Beta", ["100"])]
+    assert overlap_groups(plans) == [0, 0]
+    assert schedule_scopes(plans, TODAY) == [(0, 0), (1, 0)]
+
+
+def test_vendor_fallback_overlapping_another_vendors_collection():
+    plans = [sale("Acme"), appearing("Beta", ["200"])]
+    assert order_of(plans) == [1, 0]   # nothing in common by name
+    products = [ProductIdSet([1, 2, 3]), ProductIdSet([3, 4])]   # collection 200 holds an Acme product
+    groups = overlap_groups(plans, [products])
+    assert groups == [0, 0]
+    assert order_of(plans, groups=groups) == [0, 1]
+
+
+def test_groups_link_through_a_shared_scope():
+    plans = [sale("Acme", ["1"]), sale("Beta", ["1", "2"]), sale("Gamma", ["2"]), sale("Delta", ["3"])]
+    assert overlap_groups(plans) == [0, 0, 0, 3]
+
+
+def test_smallest_chain_first_within_a_tier():
+    plans = [appearing("Acme", ["1"]), appearing("Beta", ["2"]), appearing("Gamma", ["3"])]
+    assert order_of(plans, sizes={0: 500, 1: 10, 2: None}) == [1, 0, 2]
+
+
+def test_carried_scope_keeps_its_tier():
+    plans = [sale("Acme", ["1"]), sale("Beta", ["2"])]
+    assert schedule_scopes(plans, TODAY, carried={scope_key(plans[1]): 0}) == [(1, 0), (0, 2)]
+
+
+def applied_state(plans):
+    return {scope_key(w): {"vendor": w.vendor, "collection_ids": list(w.collection_ids),
+                           "signature": scope_signature(compute_scope_actions(w, TODAY))} for w in plans}
+
+
+def test_daemon_resyncs_a_later_overlapping_vendor():
+    plans = [sale("Acme", ["100"]), sale("Beta", ["100"]), sale("Gamma", ["300"])]
+    applied = applied_state(plans)
+    plans[0] = sale("Acme", ["100"], starts=-3)   # Acme's dates changed
+    to_sync, state = affected_plans(plans, applied, TODAY)
+    assert [w.vendor for w in to_sync] == ["Acme", "Beta"]
+    assert set(state) == {scope_key(w) for w in plans}
+
+
+def test_daemon_uses_resolved_products_for_overlaps():
+    plans = [sale("Acme"), sale("Beta", ["200"])]
+    applied = applied_state(plans)
+    plans[0] = sale("Acme", starts=-3)
+    assert [w.vendor for w in affected_plans(plans, applied, TODAY)[0]] == ["Acme"]
+    shared = lambda scopes: [[ProductIdSet([1, 2]) if w.vendor == "Acme" else ProductIdSet([2, 9]) for w in scopes]]
+    assert [w.vendor for w in affected_plans(plans, applied, TODAY, shared)[0]] == ["Acme", "Beta"]
+
+
+def test_daemon_asks_for_products_only_when_something_changed():
+    plans = [sale("Acme", ["1"])]
+
+    def fail(scopes):
+        raise AssertionError("resolved without a change")
+
+    assert affected_plans(plans, applied_state(plans), TODAY, fail)[0] == []
@@ -0,0 +1,40 @@
+import pytest
+
+from time_budget import TimeBudget, format_seconds, parse_duration
+
+
+@pytest.mark.parametrize("text, seconds", [
+    ("5400", 5400.0),
+    ("90m", 5400.0),
+    ("1h30m", 5400.0),
+    ("1h 30m", 5400.0),
+    ("2H", 7200.0),
+    ("1.5h", 5400.0),
+    ("45s", 45.0),
+    ("1h0m30s", 3630.0),
+])
+def test_parse_duration(text, seconds):
+    assert parse_duration(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["", "  ", None, "0", "0m"])
+def test_parse_duration_off(text):
+    assert parse_duration(text) is None
+
+
+@pytest.mark.parametrize("text", ["soon", "1d", "m", "h30", "-5m"])
+def test_parse_duration_rejects(text):
+    with pytest.raises(ValueError):
+        parse_duration(text)
+
+
+def test_format_seconds():
+    assert format_seconds(5400) == "1h30m"
+    assert format_seconds(125) == "2m05s"
+    assert format_seconds(9.6) == "10s"
+    assert format_seconds(-3) == "0s"
+
+
+def test_budget_deadline():
+    budget = TimeBudget(60.0, start=100.0)
+    assert budget.deadline == 160.0
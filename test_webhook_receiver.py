@@ -0,0 +1,132 @@
+import base64
+import hashlib
+import hmac
+
+import pytest
+
+from product_ids import product_gid
+from promo_config import Config, ShopTarget
+from webhook_receiver import WebhookApplier, WebhookEvent, sign, to_utc, verify_hmac
+
+
+SECRET = "shpss_test"
+BODY = b'{"id": 1, "vendor": "Acme"}'
+
+
+def expected(secret: str, body: bytes) -> str:
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def test_sign_matches_shopify_header_format():
+    assert sign(SECRET, BODY) == expected(SECRET, BODY)
+
+
+def test_verify_hmac_accepts_a_valid_signature():
+    assert verify_hmac(SECRET, BODY, expected(SECRET, BODY))
+    assert verify_hmac(SECRET, BODY, " " + expected(SECRET, BODY) + "\n")
+
+
+def test_verify_hmac_rejects_tampering_and_missing_parts():
+    header = expected(SECRET, BODY)
+    assert not verify_hmac(SECRET, BODY + b" ", header)
+    assert not verify_hmac("other", BODY, header)
+    assert not verify_hmac(SECRET, BODY, None)
+    assert not verify_hmac(SECRET, BODY, "")
+    assert not verify_hmac("", BODY, header)
+
+
+def test_to_utc():
+    assert to_utc("2026-01-31T01:02:03-05:00") == "2026-01-31T06:02:03Z"
+    assert to_utc("2026-01-31T06:02:03Z") == "2026-01-31T06:02:03Z"
+    assert to_utc("2026-01-31T06:02:03") == "2026-01-31T06:02:03Z"
+    assert to_utc("") == ""
+    assert to_utc("garbage") == "garbage"
+
+
+@pytest.fixture
+def applier(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CATALOG_MIRROR", str(tmp_path / "mirror.sqlite"))
+    applier = WebhookApplier(fetch_membership=False)
+    yield applier
+    for mirror in applier._mirrors.values():
+        mirror.close()
+
+
+TARGET = ShopTarget("", "test.myshopify.com", "x", "", SECRET)
+
+
+def send(applier: WebhookApplier, topic: str, payload: dict) -> str:
+    return applier.apply(WebhookEvent(topic, TARGET, "", payload))
+
+
+def test_product_webhook_without_admin_graphql_api_id(applier):
+    # the gid is built from the numeric id when the payload has no admin_graphql_api_id
+    assert send(applier, "products/create", {"id": 7, "vendor": "Acme", "updated_at": "2026-01-31T06:02:03Z"}) == "applied"
+    assert applier._mirror(TARGET).conn.execute("SELECT gid FROM products").fetchall() == [("gid://shopify/Product/7",)]
+
+
+def product(pid: int, vendor: str, updated_at: str, **extra) -> dict:
+    return {"id": pid, "admin_graphql_api_id": f"gid://shopify/Product/{pid}", "vendor": vendor,
+            "updated_at": updated_at, **extra}
+
+
+def collection(cid: int, title: str, updated_at: str = "2026-02-01T10:00:00-05:00") -> dict:
+    return {"id": cid, "admin_graphql_api_id": f"gid://shopify/Collection/{cid}", "title": title,
+            "handle": title.lower().replace(" ", "-"), "updated_at": updated_at}
+
+
+def test_products_create_update_delete(applier):
+    mirror = applier._mirror(TARGET)
+    metafields = [
+        {"namespace": Config.MF_NAMESPACE, "key": Config.METAFIELD_SALE_START_DATE, "value": "2026-03-01"},
+        {"namespace": Config.MF_NAMESPACE, "key": "care_instructions", "value": "not a promo key"},
+        {"namespace": "other", "key": Config.METAFIELD_SALE_END_DATE, "value": "other namespace"},
+    ]
+    assert send(applier, "products/create", product(1, " Acme ", "2026-02-01T10:00:00-05:00", metafields=metafields)) == "applied"
+    assert send(applier, "products/create", product(2, "Acme", "2026-02-01T10:00:00-05:00")) == "applied"
+    assert mirror.conn.execute("SELECT id, vendor, updated_at FROM products ORDER BY id").fetchall() == [
+        (1, "Acme", "2026-02-01T15:00:00Z"), (2, "Acme", "2026-02-01T15:00:00Z")]
+    assert mirror.metafields(1) == {Config.METAFIELD_SALE_START_DATE: "2026-03-01"}
+    mirror.replace_collection_members("gid://shopify/Collection/10", [product_gid(1), product_gid(2)])
+
+    # vendor change; no metafields in the payload keeps the stored ones
+    assert send(applier, "products/update", product(1, "Beta", "2026-02-02T00:00:00Z")) == "applied"
+    assert list(mirror.product_ids_by_vendor("beta")) == [1]
+    assert list(mirror.product_ids_by_vendor("acme")) == [2]
+    assert mirror.vendors_in_collection("10") == ["Acme", "Beta"]
+    assert mirror.metafields(1) == {Config.METAFIELD_SALE_START_DATE: "2026-03-01"}
+
+    # an older update delivered late is skipped
+    assert send(applier, "products/update", product(1, "Acme", "2026-02-01T23:59:59Z")) == "stale"
+    assert list(mirror.product_ids_by_vendor("beta")) == [1]
+
+    assert send(applier, "products/delete", {"id": 1}) == "applied"
+    assert mirror.conn.execute("SELECT id FROM products").fetchall() == [(2,)]
+    assert list(mirror.product_ids_in_collection("10")) == [2]
+    assert mirror.metafields(1) == {}
+    assert mirror._get_state("webhook_last_topic") == "products/delete"
+
+
+def test_collections_create_update_delete(applier):
+    mirror = applier._mirror(TARGET)
+    send(applier, "products/create", product(1, "Acme", "2026-02-01T00:00:00Z"))
+    assert send(applier, "collections/create", collection(10, "Spring Sale")) == "applied"
+    assert mirror.list_collections() == [{"id": "gid://shopify/Collection/10", "title": "Spring Sale",
+                                          "handle": "spring-sale", "updatedAt": "2026-02-01T15:00:00Z"}]
+    mirror.replace_collection_members("gid://shopify/Collection/10", [product_gid(1)])
+
+    # without fetch_membership an update only touches the collection row
+    assert send(applier, "collections/update", collection(10, "Summer Sale", "2026-02-03T00:00:00Z")) == "applied"
+    assert mirror.find_collection_by_title_exact("summer sale") == ("gid://shopify/Collection/10", "Summer Sale")
+    assert mirror.find_collection_by_title_exact("Spring Sale") is None
+    assert list(mirror.product_ids_in_collection("10")) == [1]
+
+    assert send(applier, "collections/delete", {"id": 10}) == "applied"
+    assert mirror.list_collections() == []
+    assert len(mirror.product_ids_in_collection("10")) == 0
+    assert mirror.conn.execute("SELECT id FROM products").fetchall() == [(1,)]
+
+
+def test_other_topics_are_ignored(applier):
+    assert send(applier, "orders/create", {"id": 5}) == "ignored"
+    assert applier._mirror(TARGET).product_count() == 0
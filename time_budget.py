@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from promo_config import Config
+
+
+"""
+time_budget.py
+
+Time-budgeted runs: TIME_BUDGET=90m (or --time-budget 90m on the sync, the collections
+export and cli.py) gives the whole run a deadline.
+
+- run_budget() is the process-wide budget, started by the first caller (cli.py starts it
+  before its first command, so the budget covers all commands of one invocation)
+- budget.track(total, unit) follows one work loop (products of the sync, collections of
+  the export): throughput so far -> projected finish. When the projection is clearly past
+  the deadline it says so early, with how much work will be left.
+- progress.should_stop() is checked before each unit: new work stops once the time left
+  is below a few units' worth plus STOP_RESERVE_SECONDS (outputs, metrics, leftover record)
+- write_leftover() records what was not done; the next sync reads it (see schedule_scopes)
+
+Budgets: plain seconds ("5400") or h/m/s ("1h30m", "90m", "45s"). Empty or 0 = no budget.
+"""
+
+
+# kept free at the end of the budget for writing results, metrics and the leftover record
+STOP_RESERVE_SECONDS = 10.0
+
+# the projection is trusted after this share of the work (or this many seconds into the loop)
+PROJECTION_MIN_SHARE = 0.05
+PROJECTION_MIN_SECONDS = 30.0
+
+_DURATION_RE = re.compile(r"^(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m)?(?:(\d+(?:\.\d+)?)s?)?$")
+
+_run_budget = None
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """'1h30m' / '90m' / '5400' -> seconds; '' or '0' -> None"""
+    text = (text or "").strip().lower().replace(" ", "")
+    if not text:
+        return None
+    m = _DURATION_RE.match(text)
+    if not m or not any(m.groups()):
+        raise ValueError(f"TIME_BUDGET must look like 5400, 90m or 1h30m, got {text!r}")
+    h, mins, s = (float(g) if g else 0.0 for g in m.groups())
+    seconds = h * 3600 + mins * 60 + s
+    return seconds or None
+
+
+def format_seconds(seconds: float) -> str:
+    seconds = int(round(max(0.0, seconds)))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    if h:
+        return f"{h}h{m:02d}m"
+    if m:
+        return f"{m}m{s:02d}s"
+    return f"{s}s"
+
+
+class TimeBudget:
+    def __init__(self, seconds: float, start: Optional[float] = None):
+        self.seconds = seconds
+        self.start = time.monotonic() if start is None else start
+        self.deadline = self.start + seconds
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def track(self, total: float, unit: str = "items", label: str = "") -> "BudgetProgress":
+        return BudgetProgress(self, total, unit, label)
+
+
+class BudgetProgress:
+    """One work loop under a TimeBudget: throughput, projected finish, when to stop."""
+
+    def __init__(self, budget: TimeBudget, total: float, unit: str, label: str = ""):
+        self.budget = budget
+        self.total = total
+        self.unit = unit
+        self.label = label
+        self.done = 0.0
+        self.started = time.monotonic()
+        self.stopped = False
+        self.warned = False
+
+    def seconds_per_unit(self) -> Optional[float]:
+        if self.done <= 0:
+            return None
+        return (time.monotonic() - self.started) / self.done
+
+    def projected_finish(self) -> Optional[float]:
+        """seconds into the budget at which the loop is projected to finish"""
+        rate = self.seconds_per_unit()
+        if rate is None:
+            return None
+        return self.budget.elapsed() + max(0.0, self.total - self.done) * rate
+
+    def advance(self, n: float = 1) -> None:
+        self.done += n
+        if not self.warned:
+            self._check_projection()
+
+    def should_stop(self, next_units: float = 1) -> bool:
+        if self.stopped:
+            return True
+        rate = self.seconds_per_unit() or 0.0
+        if self.budget.remaining() < STOP_RESERVE_SECONDS + 2 * rate * next_units:
+            self.stopped = True
+            print(f"Time budget: stopping new work {format_seconds(self.budget.elapsed())} into the "
+                  f"{format_seconds(self.budget.seconds)} budget; {self.done:.0f} of {self.total:.0f} "
+                  f"{self.unit} done", flush=True)
+        return self.stopped
+
+    def _check_projection(self) -> None:
+        in_loop = time.monotonic() - self.started
+        if self.total <= 0 or (self.done < self.total * PROJECTION_MIN_SHARE and in_loop < PROJECTION_MIN_SECONDS):
+            return
+        finish = self.projected_finish()
+        if finish is None or finish <= self.budget.seconds * 1.05:
+            return
+        self.warned = True
+        rate = self.seconds_per_unit()
+        short = max(0.0, self.total - self.done - max(0.0, self.budget.remaining() - STOP_RESERVE_SECONDS) / rate)
+        print(f"Time budget{f' ({self.label})' if self.label else ''}: projected finish "
+              f"{format_seconds(finish)}, {format_seconds(finish - self.budget.seconds)} over the "
+              f"{format_seconds(self.budget.seconds)} budget; about {short:.0f} of {self.total:.0f} "
+              f"{self.unit} will be left for the next run", flush=True)
+
+    def summary(self) -> dict:
+        return {
+            "budget_seconds": self.budget.seconds,
+            "elapsed_seconds": round(self.budget.elapsed(), 1),
+            "unit": self.unit,
+            "done": self.done,
+            "total": self.total,
+            "stopped": self.stopped,
+            "projected_finish_seconds": round(self.projected_finish() or 0.0, 1),
+        }
+
+
+def run_budget() -> Optional[TimeBudget]:
+    """The process-wide budget from TIME_BUDGET (None without one); started on the first call."""
+    global _run_budget
+    seconds = parse_duration(Config.TIME_BUDGET)
+    if seconds is None:
+        return None
+    if _run_budget is None or _run_budget.seconds != seconds:
+        _run_budget = TimeBudget(seconds)
+        print(f"Time budget: {format_seconds(seconds)} (until {datetime.now() + timedelta(seconds=seconds):%H:%M})")
+    return _run_budget
+
+
+def write_leftover(path: str, record: Optional[dict]) -> None:
+    """record: what was left undone; None = the run finished, remove an older record"""
+    if record is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    record = dict(record, saved_at=datetime.now().isoformat(timespec="seconds"))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(record, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    print(f"Left for the next run: {path}")
+
+
+def read_leftover(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable {path}: {e}")
+        return None
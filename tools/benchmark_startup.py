@@ -0,0 +1,144 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+"""
+tools/benchmark_startup.py
+
+Startup (import) time of every entry point, measured in fresh interpreters.
+
+For each script it runs `python -X importtime -c "import <module>"` N times and reports:
+- median / min wall time of the import
+- which heavy optional modules got loaded (pyodbc, pandas, openpyxl, dotenv)
+- the slowest direct imports of the entry point (cumulative, from -X importtime)
+
+Usage:
+python tools/benchmark_startup.py
+python tools/benchmark_startup.py --runs 10 --top 8 --out startup_times.json
+"""
+
+
+ENTRY_POINTS = (
+    "retail_promotions_to_shopify_metafields",
+    "shopify_vendor_counts",
+    "get_all_vendors_with_collections",
+    "all_vendors_to_shopify_counts",
+    "Vendor_Hub_to_Shopify_counts",
+    "export_shopify_collections",
+    "catalog_snapshot",
+    "catalog_mirror",
+    "test_api",
+    "test_export_collections",
+)
+
+HEAVY_MODULES = ("pyodbc", "pandas", "openpyxl", "dotenv")
+
+_PROBE = (
+    "import sys, time, json\n"
+    "t0 = time.perf_counter()\n"
+    "try:\n"
+    "    import {module}\n"
+    "    error = None\n"
+    "except BaseException as e:\n"
+    "    error = type(e).__name__ + ': ' + str(e)\n"
+    "elapsed = time.perf_counter() - t0\n"
+    "print('@@' + json.dumps({{'seconds': elapsed, 'error': error, "
+    "'loaded': [m for m in {heavy!r} if m in sys.modules]}}))\n"
+)
+
+
+def measure(module: str, runs: int, top: int) -> dict:
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    times: List[float] = []
+    result: Dict[str, object] = {}
+    stderr = ""
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=str(ROOT), capture_output=True, text=True,
+        )
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("@@")), None)
+        if line is None:
+            return {"module": module, "error": (proc.stderr.strip().splitlines() or ["no output"])[-1]}
+        result = json.loads(line[2:])
+        times.append(float(result["seconds"]))
+        stderr = proc.stderr
+
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "min_ms": round(min(times) * 1000, 1),
+        "heavy_loaded": result.get("loaded", []),
+        "error": result.get("error"),
+        "slowest_imports": _slowest_imports(stderr, module, top),
+    }
+
+
+def _slowest_imports(importtime_log: str, module: str, top: int) -> List[dict]:
+    """Direct imports of `module`, slowest first (cumulative, so a package includes what it pulls in)."""
+    # lines: "import time:   self [us] | cumulative | <2 spaces per depth>imported package"
+    # children are printed before their parent
+    pending: List[dict] = []
+    rows: List[dict] = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative = int(parts[1].strip())
+        except ValueError:
+            continue
+        raw = parts[2][1:]
+        depth = (len(raw) - len(raw.lstrip(" "))) // 2
+        name = raw.strip()
+        if depth == 1:
+            pending.append({"module": name, "cumulative_ms": round(cumulative / 1000, 1)})
+        elif depth == 0:
+            if name == module:
+                rows = pending
+            pending = []
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Import/startup time of each entry point")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=5, help="slowest imports to list per entry point")
+    ap.add_argument("--only", default="", help="comma separated module names (default: all entry points)")
+    ap.add_argument("--out", default="", help="optional JSON output path")
+    args = ap.parse_args()
+
+    modules = [m.strip() for m in args.only.split(",") if m.strip()] or list(ENTRY_POINTS)
+    results = []
+    for module in modules:
+        r = measure(module, args.runs, args.top)
+        results.append(r)
+        if r.get("median_ms") is None:
+            print(f"{module:<42} ERROR {r['error']}")
+            continue
+        heavy = ",".join(r["heavy_loaded"]) or "-"
+        line = f"{module:<42} {r['median_ms']:>8.1f} ms (min {r['min_ms']:.1f})  heavy: {heavy}"
+        if r["error"]:
+            line += f"  import failed: {r['error']}"
+        print(line)
+        for imp in r["slowest_imports"]:
+            print(f"    {imp['cumulative_ms']:>8.1f} ms  {imp['module']}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump({"python": sys.version.split()[0], "runs": args.runs, "results": results}, fh, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+# Must be set before the scripts are imported: Config reads the environment at import time.
+os.environ.setdefault("SHOPIFY_SHOP", "mock.myshopify.com")
+os.environ.setdefault("SHOPIFY_TOKEN", "mock-token")
+os.environ["CATALOG_MIRROR"] = ""
+# measure the requests, not the response cache
+os.environ["RESPONSE_CACHE_PATH"] = ""
+os.environ["RESPONSE_CACHE_BYPASS"] = "1"
+
+from mock_shopify_server import SCENARIOS, MockShop, MockShopifyServer, SyntheticCatalog  # noqa: E402
+from promo_config import Config  # noqa: E402
+from retail_promotions_to_shopify_metafields import RetailPromoRow  # noqa: E402
+from run_metrics import METRICS  # noqa: E402
+
+
+"""
+tools/benchmark_throughput.py
+
+Repeatable throughput benchmark against tools/mock_shopify_server.py (no live shop, no SQL Server).
+
+For each catalog size it starts a fresh mock shop, then runs the real code paths:
+- sync                 retail_promotions_to_shopify_metafields.main(rows=<synthetic promo rows>)
+- vendor_counts        shopify_vendor_counts.main()
+- vendor_collections   get_all_vendors_with_collections.main()
+- collections_export   export_shopify_collections.main()
+
+and reports wall time, requests per endpoint, GraphQL cost and throttling for each.
+
+Usage:
+python tools/benchmark_throughput.py --scenario 10k
+python tools/benchmark_throughput.py --scenario 10k,100k --targets sync,vendor_counts --latency-ms 40
+python tools/benchmark_throughput.py --scenario 500k --promo-vendors 50 --out benchmark_500k.json
+
+Script output goes to <workdir>/<scenario>_<target>.log; the report is printed and written as JSON.
+"""
+
+
+TARGETS = ("sync", "vendor_counts", "vendor_collections", "collections_export")
+
+
+def synthetic_promo_rows(catalog: SyntheticCatalog, vendors: int, today: date) -> List[RetailPromoRow]:
+    """Mix of sales / price increases, vendor-wide and collection-scoped, all inside today's display window."""
+    rows: List[RetailPromoRow] = []
+    for k in range(min(vendors, catalog.v)):
+        vendor = catalog.vendor_names[k]
+        has_collection = k % 10 < 7
+        sale = k % 3 != 2
+        rows.append(RetailPromoRow(
+            id=k + 1,
+            vendor=vendor,
+            collection_id=str(1000 + k) if has_collection and k % 2 == 0 else None,
+            entry_type="Sale" if sale else "Price Increase",
+            start_date=today + timedelta(days=1),
+            end_date=today + timedelta(days=10) if sale or k % 4 == 0 else None,
+        ))
+    return rows
+
+
+def _run_target(target: str, catalog: SyntheticCatalog, promo_vendors: int, dry_run: bool) -> None:
+    if target == "sync":
+        import retail_promotions_to_shopify_metafields as sync
+        Config.DRY_RUN = dry_run
+        Config.DB_ONLY = False
+        Config.SYNC_JOURNAL = False
+        sync.main(rows=synthetic_promo_rows(catalog, promo_vendors, date.today()))
+    elif target == "vendor_counts":
+        import shopify_vendor_counts
+        shopify_vendor_counts.main()
+    elif target == "vendor_collections":
+        import get_all_vendors_with_collections
+        get_all_vendors_with_collections.main()
+    elif target == "collections_export":
+        import export_shopify_collections
+        export_shopify_collections.main()
+    else:
+        raise ValueError(f"Unknown target {target}")
+
+
+def run_scenario(name: str, products: int, targets: List[str], args, workdir: Path) -> List[dict]:
+    catalog = SyntheticCatalog(products, vendors=args.vendors)
+    shop = MockShop(catalog, max_cost=args.max_cost, restore_rate=args.restore_rate)
+    server = MockShopifyServer(shop, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms).start()
+    Config.SHOPIFY_ADMIN_URL = server.url
+    Config.SLEEP_BETWEEN_CALLS = args.sleep
+
+    results = []
+    try:
+        for target in targets:
+            with shop.lock:
+                shop.reset_stats()
+                shop.reset_throttle()
+            METRICS.reset()
+
+            log_path = workdir / f"{name}_{target}.log"
+            error = None
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            t0 = time.perf_counter()
+            try:
+                with open(log_path, "w", encoding="utf-8") as log, \
+                        contextlib.redirect_stdout(log), contextlib.redirect_stderr(io.StringIO()):
+                    _run_target(target, catalog, args.promo_vendors, not args.write)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                wall = time.perf_counter() - t0
+                os.chdir(cwd)
+
+            stats = shop.stats_snapshot()
+            client = METRICS.summary(target)
+            result = {
+                "scenario": name,
+                "products": products,
+                "target": target,
+                "wall_seconds": round(wall, 3),
+                "requests_total": stats["requests_total"],
+                "requests": stats["requests"],
+                "graphql_fields": stats["graphql_fields"],
+                "graphql_cost_actual": stats["graphql_cost_actual"],
+                "graphql_cost_requested": stats["graphql_cost_requested"],
+                "throttled": stats["throttled"],
+                "rest_429": stats["rest_429"],
+                "client_throttle_wait_seconds": client["throttle_wait_seconds"],
+                "items": client["items"],
+                "log": str(log_path),
+            }
+            if error:
+                result["error"] = error
+            results.append(result)
+            print(_format_row(result))
+    finally:
+        server.stop()
+    return results
+
+
+def _format_row(r: dict) -> str:
+    line = (f"{r['scenario']:>6} {r['target']:<20} {r['wall_seconds']:>9.2f}s "
+            f"{r['requests_total']:>8} req  cost {r['graphql_cost_actual']:>10.0f}  "
+            f"throttled {r['throttled']:>4}  429 {r['rest_429']:>4}")
+    if r.get("error"):
+        line += f"  ERROR {r['error']}"
+    return line
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Throughput benchmark against the local mock Shopify Admin API")
+    ap.add_argument("--scenario", default="10k", help="comma separated: 10k,100k,500k or product counts")
+    ap.add_argument("--targets", default=",".join(TARGETS), help=f"comma separated subset of {','.join(TARGETS)}")
+    ap.add_argument("--vendors", type=int, default=560)
+    ap.add_argument("--promo-vendors", type=int, default=20, help="vendors with an active promo in the sync run")
+    ap.add_argument("--write", action="store_true", help="sync with DRY_RUN=0 (writes go to the mock shop)")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--max-cost", type=float, default=1000.0)
+    ap.add_argument("--restore-rate", type=float, default=50.0)
+    ap.add_argument("--sleep", type=float, default=Config.SLEEP_BETWEEN_CALLS, help="SLEEP_BETWEEN_CALLS for the scripts")
+    ap.add_argument("--workdir", default="", help="where script outputs/logs go (default: temp dir)")
+    ap.add_argument("--out", default="benchmark_throughput.json")
+    args = ap.parse_args()
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    for t in targets:
+        if t not in TARGETS:
+            ap.error(f"unknown target {t!r}")
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="shopify_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f"Work dir: {workdir}")
+
+    results: List[dict] = []
+    for name in [s.strip() for s in args.scenario.split(",") if s.strip()]:
+        products = SCENARIOS.get(name) or int(name)
+        results.extend(run_scenario(name, products, targets, args, workdir))
+
+    report: Dict[str, object] = {
+        "settings": {k: v for k, v in vars(args).items() if k not in ("out", "workdir")},
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
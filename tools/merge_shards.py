@@ -0,0 +1,139 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from promo_config import ShopTarget, shop_path  # noqa: E402
+from run_metrics import merge_summaries, print_span_totals  # noqa: E402
+
+
+"""
+tools/merge_shards.py
+
+Combine the per-shard results of a sharded sync (sync_shards.py) into one report.
+
+python tools/merge_shards.py sync_shards/2026-10-18_1a2b3c4d5e6f7a8b
+python tools/merge_shards.py <dir> --out merged.json --allow-missing
+
+Reads every shard<i>of<N>.json in the directory (copy them there from the other hosts), checks
+that they belong to the same plan and that all N shards are present, then writes:
+- <dir>/merged.json                 per-shop totals + merged run metrics (requests, cost, spans)
+- vendor_product_counts.json        dry runs: the full per-scope list in plan order
+                                    (vendor_product_counts_<shop>.json with SHOPIFY_SHOPS)
+Exit code 1 if shards are missing or disagree (a failed worker writes no file: re-run that shard).
+"""
+
+
+# per-shop result fields that are added up across shards
+_SUMMED = ("products_updated", "metafields_deleted", "skipped_from_journal", "products_in_shard",
+           "products_to_write", "products_to_delete")
+
+
+def load_shards(directory: str) -> List[dict]:
+    shards = []
+    for path in sorted(glob.glob(os.path.join(directory, "shard*of*.json"))):
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        data["_path"] = path
+        shards.append(data)
+    return shards
+
+
+def check_shards(shards: List[dict]) -> List[str]:
+    problems = []
+    if not shards:
+        return ["no shard*of*.json files found"]
+    n = shards[0]["shard"][1]
+    for field in ("plan", "date", "shard_key", "dry_run"):
+        values = {str(s.get(field)) for s in shards}
+        if len(values) > 1:
+            problems.append(f"shards disagree on {field}: {', '.join(sorted(values))}")
+    if len({s["shard"][1] for s in shards}) > 1:
+        problems.append("shards were run with different N")
+    present = {s["shard"][0] for s in shards}
+    missing = [i for i in range(1, n + 1) if i not in present]
+    if missing:
+        problems.append(f"missing shards: {', '.join(f'{i}/{n}' for i in missing)}")
+    return problems
+
+
+def merge_shop_results(shards: List[dict]) -> List[dict]:
+    merged: Dict[str, dict] = {}
+    indexed: Dict[str, List[tuple]] = {}
+    for s in shards:
+        for r in s.get("shops") or []:
+            m = merged.setdefault(r["shop"], {"shop": r["shop"], "name": r.get("name", ""), "shards": 0, "seconds_max": 0.0})
+            m["shards"] += 1
+            m["seconds_max"] = max(m["seconds_max"], r.get("seconds") or 0.0)
+            for k in _SUMMED:
+                if k in r:
+                    m[k] = m.get(k, 0) + r[k]
+            # dry-run shards each report their own scopes; real-run shards all walk the whole plan
+            if "scope_indexes" in r:
+                m["scopes"] = m.get("scopes", 0) + r["scopes"]
+            else:
+                m["scopes"] = max(m.get("scopes", 0), r.get("scopes", 0))
+            for i, entry in zip(r.get("scope_indexes") or [], r.get("vendor_results") or []):
+                indexed.setdefault(r["shop"], []).append((i, entry))
+    for shop, entries in indexed.items():
+        merged[shop]["vendor_results"] = [e for _, e in sorted(entries, key=lambda x: x[0])]
+    return list(merged.values())
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Merge per-shard sync results and metrics")
+    ap.add_argument("directory", help="sync_shards/<date>_<plan>")
+    ap.add_argument("--out", default="", help="merged report (default: <directory>/merged.json)")
+    ap.add_argument("--allow-missing", action="store_true", help="merge what is there even if shards are missing")
+    args = ap.parse_args(argv)
+
+    shards = load_shards(args.directory)
+    problems = check_shards(shards)
+    for p in problems:
+        print(f"WARNING: {p}")
+    if problems and not (args.allow_missing and shards):
+        return 1
+
+    shards.sort(key=lambda s: s["shard"][0])
+    n = shards[0]["shard"][1]
+    print(f"Plan {shards[0]['plan']} ({shards[0]['date']}): {len(shards)}/{n} shards, key={shards[0]['shard_key']}")
+
+    shops = merge_shop_results(shards)
+    metrics = merge_summaries(f"{'dry_run' if shards[0].get('dry_run') else 'sync'}_merged",
+                              [s["metrics"] for s in shards if s.get("metrics")])
+
+    for r in shops:
+        detail = ", ".join(f"{k}={r[k]}" for k in ("scopes",) + _SUMMED if k in r)
+        print(f"  {r['shop']:<24} {detail}  (slowest shard {r['seconds_max']:.1f}s)")
+        if "vendor_results" in r:
+            out_file = shop_path("vendor_product_counts.json", ShopTarget(r["name"], "", ""))
+            with open(out_file, "w", encoding="utf-8") as fh:
+                json.dump(r.pop("vendor_results"), fh, ensure_ascii=False, indent=2)
+            print(f"  Wrote {out_file}")
+    print_span_totals(metrics)
+
+    out = args.out or os.path.join(args.directory, "merged.json")
+    report = {
+        "plan": shards[0]["plan"],
+        "date": shards[0]["date"],
+        "shard_key": shards[0]["shard_key"],
+        "shards": [s["shard"][0] for s in shards],
+        "of": n,
+        "problems": problems,
+        "shops": shops,
+        "metrics": metrics,
+    }
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    print(f"Wrote {out}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from promo_config import Config, PROMO_METAFIELD_KEYS, require_env, shop_targets  # noqa: E402
+from product_ids import product_gid  # noqa: E402
+from shopify_client import ShopifyClient  # noqa: E402
+
+
+"""
+tools/migrate_promo_metaobjects.py
+
+Moving a shop from per-product promo dates (custom.promo_* on every product) to
+PROMO_TARGET=metaobject:
+
+1. PROMO_TARGET=metaobject DRY_RUN=0 python retail_promotions_to_shopify_metafields.py
+   creates the definitions, one metaobject per scope and links every product of a scope.
+   The theme reads the reference first, so banners switch over product by product.
+2. python tools/migrate_promo_metaobjects.py
+   checks every linked product: do its old custom.promo_* dates match its metaobject?
+3. python tools/migrate_promo_metaobjects.py --apply
+   deletes the old custom.promo_* date metafields of linked products.
+
+Products in no scope are not linked and keep their old dates; those run out with their
+display windows (or go with stale_sweep.py, which deletes every product date in this mode).
+
+--shop NAME picks one of SHOPIFY_SHOPS (default: the first / SHOPIFY_SHOP).
+"""
+
+
+def migrate(shop: ShopifyClient, apply: bool, show: int = 20) -> dict:
+    ns = Config.MF_NAMESPACE
+    metaobjects = shop.list_metaobjects(Config.PROMO_METAOBJECT_TYPE)
+    print(f"{len(metaobjects)} {Config.PROMO_METAOBJECT_TYPE} metaobjects")
+
+    linked = with_dates = matching = deleted = failed = 0
+    differing: List[str] = []
+    for mo in metaobjects:
+        gids = [product_gid(pid) for pid in shop.products_referencing(mo["id"])]
+        linked += len(gids)
+        if not gids:
+            continue
+        expected = {k: mo["fields"].get(k) or None for k in PROMO_METAFIELD_KEYS}
+        for gid, fields in shop.product_metafields(gids, ns).items():
+            old: Dict[str, dict] = {k: mf for k, mf in (fields or {}).items() if k in PROMO_METAFIELD_KEYS}
+            if not old:
+                continue
+            with_dates += 1
+            if all((old.get(k) or {}).get("value") == v for k, v in expected.items()):
+                matching += 1
+            else:
+                differing.append(f"{gid} ({mo['handle']}): product "
+                                 f"{ {k: mf['value'] for k, mf in sorted(old.items())} } vs scope "
+                                 f"{ {k: v for k, v in expected.items() if v} }")
+            if not apply:
+                continue
+            for k, mf in sorted(old.items()):
+                try:
+                    shop.metafield_delete(mf["id"])
+                    deleted += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"  Failed to delete {k} ({mf['id']}) on {gid}: {e}")
+
+    print(f"Linked products: {linked}")
+    print(f"  with old product dates: {with_dates} ({matching} same as their scope, {len(differing)} different)")
+    for line in differing[:show]:
+        print(f"    {line}")
+    if len(differing) > show:
+        print(f"    ... {len(differing) - show} more")
+    if apply:
+        print(f"Old date metafields deleted: {deleted}" + (f", {failed} failed" if failed else ""))
+    elif with_dates:
+        print("Run with --apply to delete the old product dates (the theme already reads the metaobject).")
+    return {"metaobjects": len(metaobjects), "linked": linked, "with_dates": with_dates, "matching": matching,
+            "differing": len(differing), "deleted": deleted, "failed": failed}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Check / remove per-product promo dates of products linked to promo metaobjects")
+    ap.add_argument("--apply", action="store_true", help="delete the old custom.promo_* metafields of linked products")
+    ap.add_argument("--shop", default="", help="target name from SHOPIFY_SHOPS")
+    ap.add_argument("--show", type=int, default=20, help="differences to list")
+    args = ap.parse_args(argv)
+
+    require_env()
+    targets = [t for t in shop_targets() if not args.shop or t.name == args.shop]
+    if not targets:
+        raise SystemExit(f"Unknown shop {args.shop!r}")
+    result = migrate(ShopifyClient(targets[0]), args.apply, args.show)
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,898 @@
+import argparse
+import bisect
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+"""
+tools/mock_shopify_server.py
+
+Local stand-in for the Shopify Admin API, for throughput benchmarks without a live shop.
+
+Serves:
+- POST /admin/api/<version>/graphql.json
+    query:    collections, collection(id), products, product(id), productsCount, shop (+ metafield),
+              metaobjects(type), metaobject(id) (+ referencedBy), metaobjectDefinitionByType,
+              metafieldDefinitions, currentBulkOperation
+    mutation: metafieldsSet, metafieldDelete, metaobjectUpsert, metaobjectDefinitionCreate,
+              metafieldDefinitionCreate, bulkOperationRunQuery (products; completes at once)
+    (aliases, variables, nodes/edges connections, first/after pagination, query filters
+     vendor:"x", title:"x", updated_at:>'ts', updated_at:>='ts')
+- GET  /admin/api/<version>/products/count.json?vendor=...|collection_id=...
+- GET  /__bulk/<n>.jsonl   bulk operation results
+- GET  /__stats   HTTP request counts (GraphQL by first root field), aliased fields served, cost / throttling
+- POST /__reset   clear stats
+
+Behaviour:
+- synthetic catalog of N products (membership is computed, so 500k products costs almost no memory)
+- fixed latency per request (+ optional jitter)
+- cost-based GraphQL throttling (leaky bucket, THROTTLED errors like Shopify)
+- REST leaky bucket (HTTP 429 + Retry-After)
+
+Run standalone:
+python tools/mock_shopify_server.py --products 100000 --port 8765 --latency-ms 40
+then point the scripts at it:
+SHOPIFY_ADMIN_URL=http://127.0.0.1:8765 SHOPIFY_SHOP=mock.myshopify.com SHOPIFY_TOKEN=x
+"""
+
+
+SCENARIOS = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "500k": 500_000,
+}
+
+BASE_UPDATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+SHOP_GID = "gid://shopify/Shop/1"
+
+# first API version whose productsCount takes a limit argument (older versions reject it)
+COUNT_LIMIT_API_VERSION = "2025-01"
+
+
+def _normalize(s: str) -> str:
+    return " ".join((s or "").strip().lower().split())
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# =========================
+# Synthetic catalog
+# =========================
+class SyntheticCatalog:
+    """
+    Product i (0-based): gid Product/<i+1>, vendor i % V, updatedAt BASE + i minutes.
+    Vendor collections: one per vendor for 7 of every 10 vendors, titled like the vendor,
+    containing every product of that vendor (gid Collection/<1000+v>).
+    Theme collections: E extra collections, product i is in theme (i % 3E) when that is < E
+    (gid Collection/<900+k>).
+    """
+
+    def __init__(self, products: int, vendors: int = 560, theme_collections: int = 8):
+        self.n = products
+        self.v = max(1, min(vendors, products))
+        self.e = theme_collections
+        self.vendor_names = [f"Vendor {k:04d}" for k in range(self.v)]
+        self.vendor_index = {_normalize(name): k for k, name in enumerate(self.vendor_names)}
+
+        self.collection_ids: List[int] = sorted(
+            [900 + k for k in range(self.e)] + [1000 + v for v in range(self.v) if v % 10 < 7]
+        )
+        self._collection_set = set(self.collection_ids)
+
+        # owner gid -> "namespace.key" -> metafield dict
+        self.metafields: Dict[str, Dict[str, dict]] = {}
+        self.metafield_owner: Dict[str, Tuple[str, str]] = {}
+        self._next_metafield_id = 1
+
+        # metaobject gid -> {id, type, handle, fields: {key: value}}; definitions by type / (owner, ns.key)
+        self.metaobjects: Dict[str, dict] = {}
+        self.metaobject_definitions: Dict[str, dict] = {}
+        self.metafield_definitions: Dict[Tuple[str, str], dict] = {}
+
+    # products
+    def product_exists(self, i: int) -> bool:
+        return 0 <= i < self.n
+
+    def vendor_of(self, i: int) -> str:
+        return self.vendor_names[i % self.v]
+
+    def updated_at(self, i: int) -> str:
+        return _iso(BASE_UPDATED_AT + timedelta(minutes=i))
+
+    def collections_of(self, i: int) -> List[int]:
+        out = []
+        v = i % self.v
+        if v % 10 < 7:
+            out.append(1000 + v)
+        k = i % (3 * self.e) if self.e else 0
+        if self.e and k < self.e:
+            out.append(900 + k)
+        return out
+
+    def product_range(self, search: Optional[str]) -> range:
+        """Products matching a Shopify search string (subset supported)."""
+        if not search:
+            return range(self.n)
+        m = re.match(r'^\s*vendor:(?:"(.*)"|(\S.*))\s*$', search)
+        if m:
+            v = self.vendor_index.get(_normalize(m.group(1) if m.group(1) is not None else m.group(2)))
+            return range(v, self.n, self.v) if v is not None else range(0)
+        m = re.match(r"^\s*updated_at:(>=?)'?([^']+)'?\s*$", search)
+        if m:
+            ts = _iso(datetime.fromisoformat(m.group(2).replace("Z", "+00:00")).astimezone(timezone.utc))
+            # updatedAt never decreases with i
+            find = bisect.bisect_left if m.group(1) == ">=" else bisect.bisect_right
+            return range(find(range(self.n), ts, key=self.updated_at), self.n)
+        return range(self.n)
+
+    # collections
+    def collection_exists(self, cid: int) -> bool:
+        return cid in self._collection_set
+
+    def collection_title(self, cid: int) -> str:
+        if cid >= 1000:
+            return self.vendor_names[cid - 1000]
+        return f"Theme Collection {cid - 900}"
+
+    def collection_members(self, cid: int) -> range:
+        if cid >= 1000:
+            return range(cid - 1000, self.n, self.v)
+        return range(cid - 900, self.n, 3 * self.e)
+
+    def collection_range(self, search: Optional[str]) -> List[int]:
+        if not search:
+            return self.collection_ids
+        m = re.match(r'^\s*title:(?:"(.*)"|(\S.*))\s*$', search)
+        if not m:
+            return self.collection_ids
+        if m.group(1) is not None:
+            target = _normalize(m.group(1))
+            return [c for c in self.collection_ids if _normalize(self.collection_title(c)) == target]
+        needle = _normalize(m.group(2))
+        return [c for c in self.collection_ids if needle in _normalize(self.collection_title(c))]
+
+    # metafields
+    def owner_exists(self, gid: str) -> bool:
+        kind, _, num = gid.rpartition("/")
+        try:
+            n = int(num)
+        except ValueError:
+            return False
+        if kind.endswith("/Product"):
+            return self.product_exists(n - 1)
+        if kind.endswith("/Collection"):
+            return self.collection_exists(n)
+        return gid == SHOP_GID
+
+    def set_metafield(self, owner: str, namespace: str, key: str, mf_type: str, value: str) -> dict:
+        fields = self.metafields.setdefault(owner, {})
+        full_key = f"{namespace}.{key}"
+        mf = fields.get(full_key)
+        if mf is None:
+            mf = {"id": f"gid://shopify/Metafield/{self._next_metafield_id}", "namespace": namespace, "key": key}
+            self._next_metafield_id += 1
+            fields[full_key] = mf
+            self.metafield_owner[mf["id"]] = (owner, full_key)
+        mf["type"] = mf_type
+        mf["value"] = value
+        return mf
+
+    def delete_metafield(self, metafield_id: str) -> bool:
+        owner = self.metafield_owner.pop(metafield_id, None)
+        if owner is None:
+            return False
+        self.metafields.get(owner[0], {}).pop(owner[1], None)
+        return True
+
+    def metafields_of(self, owner: str, namespace: Optional[str]) -> List[dict]:
+        return [m for m in self.metafields.get(owner, {}).values() if namespace is None or m["namespace"] == namespace]
+
+    # metaobjects
+    def upsert_metaobject(self, mo_type: str, handle: str, fields: Dict[str, str]) -> dict:
+        mo = next((m for m in self.metaobjects.values() if m["type"] == mo_type and m["handle"] == handle), None)
+        if mo is None:
+            mo = {"id": f"gid://shopify/Metaobject/{len(self.metaobjects) + 1}", "type": mo_type, "handle": handle, "fields": {}}
+            self.metaobjects[mo["id"]] = mo
+        for k, v in fields.items():
+            if v in ("", None):
+                mo["fields"].pop(k, None)
+            else:
+                mo["fields"][k] = v
+        return mo
+
+    def referencing_owners(self, gid: str) -> List[str]:
+        """owners with a metafield whose value is this gid (metaobject_reference)"""
+        def product_order(owner: str):
+            return int(owner.rsplit("/", 1)[-1]) if owner.startswith("gid://shopify/Product/") else 0
+        return sorted((o for o, fields in self.metafields.items() if any(m.get("value") == gid for m in fields.values())),
+                      key=product_order)
+
+
+# =========================
+# Minimal GraphQL parser
+# =========================
+_TOKEN_RE = re.compile(
+    r'(?P<skip>[\s,]+|#[^\n]*)|(?P<str>"(?:\\.|[^"\\])*")|(?P<num>-?\d+(?:\.\d+)?)'
+    r'|(?P<name>[_A-Za-z][_0-9A-Za-z]*)|(?P<punct>\.\.\.|[{}()\[\]:!$=@])'
+)
+
+
+class Field:
+    def __init__(self, alias: str, name: str, args: Dict[str, Any], selections: Optional[List["Field"]]):
+        self.alias = alias
+        self.name = name
+        self.args = args
+        self.selections = selections
+
+
+class Var:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens: List[Tuple[str, str]] = []
+        pos = 0
+        while pos < len(text):
+            m = _TOKEN_RE.match(text, pos)
+            if not m:
+                raise ValueError(f"Unexpected character {text[pos]!r} at {pos}")
+            pos = m.end()
+            if m.lastgroup != "skip":
+                self.tokens.append((m.lastgroup, m.group(m.lastgroup)))
+        self.i = 0
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.i] if self.i < len(self.tokens) else ("eof", "")
+
+    def take(self, value: Optional[str] = None) -> str:
+        kind, v = self.peek()
+        if value is not None and v != value:
+            raise ValueError(f"Expected {value!r}, got {v!r}")
+        self.i += 1
+        return v
+
+    def document(self) -> Tuple[str, List[Field]]:
+        op = "query"
+        if self.peek()[1] in ("query", "mutation"):
+            op = self.take()
+            if self.peek()[0] == "name":
+                self.take()
+            if self.peek()[1] == "(":
+                depth = 0
+                while True:
+                    v = self.take()
+                    depth += v == "("
+                    depth -= v == ")"
+                    if depth == 0:
+                        break
+        return op, self.selection_set()
+
+    def selection_set(self) -> List[Field]:
+        self.take("{")
+        fields = []
+        while self.peek()[1] != "}":
+            if self.peek()[1] == "...":
+                # inline fragment "... on Type { ... }": the mock's unions have one member, merge it
+                self.take("...")
+                self.take("on")
+                self.take()
+                fields.extend(self.selection_set())
+                continue
+            fields.append(self.field())
+        self.take("}")
+        return fields
+
+    def field(self) -> Field:
+        name = self.take()
+        alias = name
+        if self.peek()[1] == ":":
+            self.take(":")
+            name = self.take()
+        args = {}
+        if self.peek()[1] == "(":
+            self.take("(")
+            while self.peek()[1] != ")":
+                arg = self.take()
+                self.take(":")
+                args[arg] = self.value()
+            self.take(")")
+        selections = self.selection_set() if self.peek()[1] == "{" else None
+        return Field(alias, name, args, selections)
+
+    def value(self) -> Any:
+        kind, v = self.peek()
+        if v == "$":
+            self.take()
+            return Var(self.take())
+        if kind == "str":
+            self.take()
+            return json.loads(v)
+        if kind == "num":
+            self.take()
+            return float(v) if "." in v else int(v)
+        if v == "[":
+            self.take()
+            out = []
+            while self.peek()[1] != "]":
+                out.append(self.value())
+            self.take("]")
+            return out
+        if v == "{":
+            self.take()
+            obj = {}
+            while self.peek()[1] != "}":
+                k = self.take()
+                self.take(":")
+                obj[k] = self.value()
+            self.take("}")
+            return obj
+        self.take()
+        return {"true": True, "false": False, "null": None}.get(v, v)
+
+
+def _bind_fields(fields: List[Field], variables: dict) -> List[Field]:
+    return [Field(f.alias, f.name, _bind(f.args, variables),
+                  _bind_fields(f.selections, variables) if f.selections is not None else None)
+            for f in fields]
+
+
+def _bind(value: Any, variables: dict) -> Any:
+    if isinstance(value, Var):
+        return variables.get(value.name)
+    if isinstance(value, list):
+        return [_bind(v, variables) for v in value]
+    if isinstance(value, dict):
+        return {k: _bind(v, variables) for k, v in value.items()}
+    return value
+
+
+# =========================
+# Resolvers
+# =========================
+class GraphQLError(Exception):
+    pass
+
+
+class MockShop:
+    def __init__(self, catalog: SyntheticCatalog, max_cost: float = 1000.0, restore_rate: float = 50.0,
+                 rest_bucket: int = 40, rest_leak_per_sec: float = 2.0):
+        self.catalog = catalog
+        self.max_cost = max_cost
+        self.restore_rate = restore_rate
+        self.rest_bucket = rest_bucket
+        self.rest_leak = rest_leak_per_sec
+        self.lock = threading.Lock()
+        self.public_url = ""             # set by MockShopifyServer: base of bulk operation result urls
+        self.bulk_results: List[str] = []
+        self.current_bulk: Optional[dict] = None
+        self._api_version = "unstable"    # of the GraphQL request being served
+        self.reset_throttle()
+        self.reset_stats()
+
+    def reset_throttle(self) -> None:
+        self._available = self.max_cost
+        self._available_at = time.monotonic()
+        self._rest_used = 0.0
+        self._rest_at = time.monotonic()
+
+    def reset_stats(self) -> None:
+        self.stats = {"requests": {}, "graphql_fields": {}, "graphql_cost_requested": 0.0, "graphql_cost_actual": 0.0,
+                      "throttled": 0, "rest_429": 0}
+
+    def _count(self, endpoint: str) -> None:
+        self.stats["requests"][endpoint] = self.stats["requests"].get(endpoint, 0) + 1
+
+    # -------------------------
+    # Throttling
+    # -------------------------
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._available = min(self.max_cost, self._available + (now - self._available_at) * self.restore_rate)
+        self._available_at = now
+
+    def _throttle_status(self) -> dict:
+        return {"maximumAvailable": self.max_cost, "currentlyAvailable": round(self._available, 1),
+                "restoreRate": self.restore_rate}
+
+    # -------------------------
+    # GraphQL
+    # -------------------------
+    def graphql(self, body: dict, api_version: str = "unstable") -> dict:
+        try:
+            op, fields = _Parser(body.get("query") or "").document()
+        except Exception as e:
+            return {"errors": [{"message": f"Parse error: {e}"}]}
+        fields = _bind_fields(fields, body.get("variables") or {})
+
+        with self.lock:
+            self._api_version = api_version
+            # one per HTTP request, whatever the number of aliases; fields served counted apart
+            if fields:
+                self._count(f"graphql:{fields[0].name}")
+            for f in fields:
+                self.stats["graphql_fields"][f.name] = self.stats["graphql_fields"].get(f.name, 0) + 1
+
+            requested = self._requested_cost(fields, op == "mutation")
+            self._refill()
+            if requested > self.max_cost:
+                return {"errors": [{"message": f"Query cost is {requested}, which exceeds the single query max cost limit ({self.max_cost}).",
+                                    "extensions": {"code": "MAX_COST_EXCEEDED"}}]}
+            if requested > self._available:
+                self.stats["throttled"] += 1
+                return {"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+                        "extensions": {"cost": {"requestedQueryCost": requested, "actualQueryCost": None,
+                                                "throttleStatus": self._throttle_status()}}}
+
+            self._actual = 0.0
+            try:
+                data = {}
+                for f in fields:
+                    resolver = getattr(self, f"_mutation_{f.name}" if op == "mutation" else f"_query_{f.name}", None)
+                    if resolver is None:
+                        raise GraphQLError(f"Field '{f.name}' doesn't exist on type '{'Mutation' if op == 'mutation' else 'QueryRoot'}'")
+                    data[f.alias] = resolver(f, f.args)
+            except GraphQLError as e:
+                return {"errors": [{"message": str(e)}]}
+
+            actual = min(requested, max(1.0, self._actual))
+            self._available -= actual
+            self.stats["graphql_cost_requested"] += requested
+            self.stats["graphql_cost_actual"] += actual
+            return {"data": data, "extensions": {"cost": {"requestedQueryCost": requested, "actualQueryCost": actual,
+                                                          "throttleStatus": self._throttle_status()}}}
+
+    def _requested_cost(self, fields: List[Field], mutation: bool) -> float:
+        if mutation:
+            return 10.0 * len(fields)
+
+        def cost(f: Field) -> float:
+            if f.selections is None:
+                return 0.0
+            first = f.args.get("first")
+            if first is not None:
+                node_fields: List[Field] = []
+                for s in f.selections:
+                    if s.name == "nodes":
+                        node_fields.extend(s.selections or [])
+                    elif s.name == "edges":
+                        for e in s.selections or []:
+                            if e.name == "node":
+                                node_fields.extend(e.selections or [])
+                return 2.0 + int(first) * (1.0 + sum(cost(c) for c in node_fields))
+            return 1.0 + sum(cost(c) for c in f.selections)
+
+        return max(1.0, sum(cost(f) for f in fields))
+
+    def _connection(self, seq, f: Field, args: dict, node_resolver) -> dict:
+        first = min(int(args.get("first") or 50), 250)
+        offset = int(args["after"].split(":", 1)[1]) if args.get("after") else 0
+        page = seq[offset:offset + first]
+        end = offset + len(page)
+        self._actual += 2 + len(page)
+
+        out = {}
+        for s in f.selections or []:
+            if s.name == "pageInfo":
+                info = {"hasNextPage": end < len(seq), "endCursor": f"o:{end}" if page else None,
+                        "hasPreviousPage": offset > 0, "startCursor": f"o:{offset}" if page else None}
+                out[s.alias] = {x.alias: info.get(x.name) for x in s.selections or []}
+            elif s.name == "nodes":
+                out[s.alias] = [node_resolver(item, s.selections or []) for item in page]
+            elif s.name == "edges":
+                edges = []
+                for idx, item in enumerate(page):
+                    edge = {}
+                    for e in s.selections or []:
+                        if e.name == "node":
+                            edge[e.alias] = node_resolver(item, e.selections or [])
+                        elif e.name == "cursor":
+                            edge[e.alias] = f"o:{offset + idx + 1}"
+                    edges.append(edge)
+                out[s.alias] = edges
+        return out
+
+    @staticmethod
+    def _gid_int(gid: str, kind: str) -> Optional[int]:
+        m = re.match(rf"^gid://shopify/{kind}/(\d+)$", str(gid or ""))
+        return int(m.group(1)) if m else None
+
+    # --- query root
+    def _query_shop(self, f: Field, args: dict) -> dict:
+        out = {}
+        for s in f.selections or []:
+            if s.name == "metafield":
+                mf = self.catalog.metafields.get(SHOP_GID, {}).get(f"{s.args.get('namespace')}.{s.args.get('key')}")
+                out[s.alias] = self._metafield(mf, s.selections or []) if mf else None
+            else:
+                out[s.alias] = {"id": SHOP_GID, "name": "Mock Shop", "myshopifyDomain": "mock.myshopify.com"}.get(s.name)
+        return out
+
+    def _query_products(self, f: Field, args: dict) -> dict:
+        return self._connection(self.catalog.product_range(args.get("query")), f, args, self._product)
+
+    def _query_product(self, f: Field, args: dict) -> Optional[dict]:
+        n = self._gid_int(args.get("id"), "Product")
+        if n is None or not self.catalog.product_exists(n - 1):
+            return None
+        return self._product(n - 1, f.selections or [])
+
+    def _query_productsCount(self, f: Field, args: dict) -> dict:
+        if "limit" in args and self._api_version < COUNT_LIMIT_API_VERSION:
+            raise GraphQLError(f"Field 'productsCount' doesn't accept argument 'limit' (API {self._api_version})")
+        count = len(self.catalog.product_range(args.get("query")))
+        limit = args.get("limit", 10000)
+        precision = "EXACT"
+        if limit is not None and count > limit:
+            count, precision = int(limit), "AT_LEAST"
+        return {s.alias: {"count": count, "precision": precision}.get(s.name) for s in f.selections or []}
+
+    def _query_collections(self, f: Field, args: dict) -> dict:
+        return self._connection(self.catalog.collection_range(args.get("query")), f, args, self._collection)
+
+    def _query_collection(self, f: Field, args: dict) -> Optional[dict]:
+        cid = self._gid_int(args.get("id"), "Collection")
+        if cid is None or not self.catalog.collection_exists(cid):
+            return None
+        return self._collection(cid, f.selections or [])
+
+    def _query_metaobjects(self, f: Field, args: dict) -> dict:
+        items = [m for m in self.catalog.metaobjects.values() if m["type"] == args.get("type")]
+        return self._connection(items, f, args, self._metaobject)
+
+    def _query_metaobject(self, f: Field, args: dict) -> Optional[dict]:
+        mo = self.catalog.metaobjects.get(args.get("id"))
+        return self._metaobject(mo, f.selections or []) if mo else None
+
+    def _query_metaobjectDefinitionByType(self, f: Field, args: dict) -> Optional[dict]:
+        d = self.catalog.metaobject_definitions.get(args.get("type"))
+        return {s.alias: d.get(s.name) for s in f.selections or []} if d else None
+
+    def _query_metafieldDefinitions(self, f: Field, args: dict) -> dict:
+        items = [d for (owner, full_key), d in self.catalog.metafield_definitions.items()
+                 if owner == args.get("ownerType") and full_key == f"{args.get('namespace')}.{args.get('key')}"]
+        return self._connection(items, f, args, lambda d, sel: {s.alias: d.get(s.name) for s in sel})
+
+    def _query_currentBulkOperation(self, f: Field, args: dict) -> Optional[dict]:
+        op = self.current_bulk
+        return {s.alias: op.get(s.name) for s in f.selections or []} if op else None
+
+    # --- objects
+    def _product(self, i: int, selections: List[Field]) -> dict:
+        gid = f"gid://shopify/Product/{i + 1}"
+        out = {}
+        for s in selections:
+            args = s.args
+            if s.name == "id":
+                out[s.alias] = gid
+            elif s.name == "vendor":
+                out[s.alias] = self.catalog.vendor_of(i)
+            elif s.name == "title":
+                out[s.alias] = f"Product {i + 1}"
+            elif s.name == "updatedAt":
+                out[s.alias] = self.catalog.updated_at(i)
+            elif s.name == "collections":
+                out[s.alias] = self._connection(self.catalog.collections_of(i), s, args, self._collection)
+            elif s.name == "metafields":
+                mfs = self.catalog.metafields_of(gid, args.get("namespace"))
+                out[s.alias] = self._connection(mfs, s, args, self._metafield)
+            elif s.name == "metafield":
+                mf = self.catalog.metafields.get(gid, {}).get(f"{args.get('namespace')}.{args.get('key')}")
+                out[s.alias] = self._metafield(mf, s.selections or []) if mf else None
+            else:
+                out[s.alias] = None
+        return out
+
+    def _collection(self, cid: int, selections: List[Field]) -> dict:
+        gid = f"gid://shopify/Collection/{cid}"
+        out = {}
+        for s in selections:
+            args = s.args
+            if s.name == "id":
+                out[s.alias] = gid
+            elif s.name == "title":
+                out[s.alias] = self.catalog.collection_title(cid)
+            elif s.name == "handle":
+                out[s.alias] = _normalize(self.catalog.collection_title(cid)).replace(" ", "-")
+            elif s.name == "updatedAt":
+                out[s.alias] = _iso(BASE_UPDATED_AT)
+            elif s.name == "products":
+                out[s.alias] = self._connection(self.catalog.collection_members(cid), s, args, self._product)
+            elif s.name == "productsCount":
+                count = len(self.catalog.collection_members(cid))
+                out[s.alias] = {x.alias: {"count": count, "precision": "EXACT"}.get(x.name) for x in s.selections or []}
+            elif s.name == "metafields":
+                mfs = self.catalog.metafields_of(gid, args.get("namespace"))
+                out[s.alias] = self._connection(mfs, s, args, self._metafield)
+            else:
+                out[s.alias] = None
+        return out
+
+    @staticmethod
+    def _metafield(mf: dict, selections: List[Field]) -> dict:
+        return {s.alias: mf.get(s.name) for s in selections}
+
+    def _metaobject(self, mo: dict, selections: List[Field]) -> dict:
+        out = {}
+        for s in selections:
+            if s.name == "fields":
+                out[s.alias] = [{x.alias: {"key": k, "value": v}.get(x.name) for x in s.selections or []}
+                                for k, v in sorted(mo["fields"].items())]
+            elif s.name == "referencedBy":
+                owners = self.catalog.referencing_owners(mo["id"])
+                out[s.alias] = self._connection(owners, s, s.args, lambda o, sel: {
+                    x.alias: {y.alias: o if y.name == "id" else None for y in x.selections or []}
+                    if x.name == "referencer" else None for x in sel})
+            else:
+                out[s.alias] = mo.get(s.name)
+        return out
+
+    # --- mutations
+    def _mutation_metafieldsSet(self, f: Field, args: dict) -> dict:
+        inputs = args.get("metafields") or []
+        errors, written = [], []
+        if len(inputs) > 25:
+            errors.append({"field": ["metafields"], "message": "Exceeded the maximum metafields input limit of 25."})
+        for idx, m in enumerate(inputs if not errors else []):
+            if not self.catalog.owner_exists(m.get("ownerId", "")):
+                errors.append({"field": ["metafields", str(idx), "ownerId"], "message": "Owner does not exist."})
+                continue
+            written.append(self.catalog.set_metafield(m["ownerId"], m.get("namespace", ""), m.get("key", ""),
+                                                      m.get("type", "single_line_text_field"), m.get("value", "")))
+        if errors:
+            written = []
+        self._actual += 10
+        return self._payload(f, {"metafields": written, "userErrors": errors})
+
+    def _mutation_metafieldDelete(self, f: Field, args: dict) -> dict:
+        mid = (args.get("input") or {}).get("id")
+        ok = self.catalog.delete_metafield(mid)
+        errors = [] if ok else [{"field": ["id"], "message": "Metafield not found."}]
+        self._actual += 10
+        return self._payload(f, {"deletedId": mid if ok else None, "userErrors": errors})
+
+    def _mutation_metaobjectUpsert(self, f: Field, args: dict) -> dict:
+        handle = args.get("handle") or {}
+        fields = {x.get("key"): x.get("value") for x in (args.get("metaobject") or {}).get("fields") or []}
+        errors = []
+        definition = self.catalog.metaobject_definitions.get(handle.get("type"))
+        if definition is None:
+            errors.append({"field": ["handle", "type"], "message": "No metaobject definition exists for type."})
+        else:
+            unknown = sorted(set(fields) - set(definition["fieldKeys"]))
+            if unknown:
+                errors.append({"field": ["metaobject", "fields"], "message": f"Field definitions do not exist: {unknown}"})
+        mo = None if errors else self.catalog.upsert_metaobject(handle["type"], handle.get("handle"), fields)
+        self._actual += 10
+        return {s.alias: (self._metaobject(mo, s.selections or []) if mo else None) if s.name == "metaobject"
+                else errors if s.name == "userErrors" else None for s in f.selections or []}
+
+    def _mutation_metaobjectDefinitionCreate(self, f: Field, args: dict) -> dict:
+        d = args.get("definition") or {}
+        definition = {"id": f"gid://shopify/MetaobjectDefinition/{len(self.catalog.metaobject_definitions) + 1}",
+                      "type": d.get("type"), "name": d.get("name"),
+                      "fieldKeys": [x.get("key") for x in d.get("fieldDefinitions") or []]}
+        self.catalog.metaobject_definitions[d.get("type")] = definition
+        self._actual += 10
+        return {s.alias: {x.alias: definition.get(x.name) for x in s.selections or []} if s.name == "metaobjectDefinition"
+                else [] if s.name == "userErrors" else None for s in f.selections or []}
+
+    def _mutation_metafieldDefinitionCreate(self, f: Field, args: dict) -> dict:
+        d = args.get("definition") or {}
+        definition = {"id": f"gid://shopify/MetafieldDefinition/{len(self.catalog.metafield_definitions) + 1}",
+                      "namespace": d.get("namespace"), "key": d.get("key"), "type": d.get("type")}
+        self.catalog.metafield_definitions[(d.get("ownerType"), f"{d.get('namespace')}.{d.get('key')}")] = definition
+        self._actual += 10
+        return {s.alias: {x.alias: definition.get(x.name) for x in s.selections or []} if s.name == "createdDefinition"
+                else [] if s.name == "userErrors" else None for s in f.selections or []}
+
+    def _mutation_bulkOperationRunQuery(self, f: Field, args: dict) -> dict:
+        """Runs the bulk query at once: products (any search) with scalar fields and nested connections."""
+        self._actual += 10
+        try:
+            _, roots = _Parser(args.get("query") or "").document()
+        except Exception as e:
+            return self._payload(f, {"bulkOperation": None, "userErrors": [{"field": ["query"], "message": f"Invalid query: {e}"}]})
+        if len(roots) != 1 or roots[0].name != "products":
+            return self._payload(f, {"bulkOperation": None,
+                                     "userErrors": [{"field": ["query"], "message": "The mock runs bulk queries on products only."}]})
+        node_sel: List[Field] = []
+        for s in roots[0].selections or []:
+            if s.name == "nodes":
+                node_sel.extend(s.selections or [])
+            elif s.name == "edges":
+                node_sel.extend(x for e in s.selections or [] if e.name == "node" for x in e.selections or [])
+        scalars = [s for s in node_sel if s.selections is None]
+        nested = [s for s in node_sel if s.selections is not None]
+        lines: List[str] = []
+        for i in self.catalog.product_range(roots[0].args.get("query")):
+            row = self._product(i, scalars)
+            lines.append(json.dumps(row))
+            for s in nested:
+                conn = self._product(i, [s])[s.alias]
+                children = conn.get("nodes") or [e.get("node") for e in conn.get("edges") or []]
+                lines.extend(json.dumps(dict(c, __parentId=f"gid://shopify/Product/{i + 1}")) for c in children if c)
+        self.bulk_results.append("".join(line + "\n" for line in lines))
+        n = len(self.bulk_results)
+        self.current_bulk = {"id": f"gid://shopify/BulkOperation/{n}", "status": "COMPLETED", "errorCode": None,
+                             "objectCount": str(len(lines)), "url": f"{self.public_url}/__bulk/{n}.jsonl" if lines else None}
+        return {s.alias: {x.alias: self.current_bulk.get(x.name) for x in s.selections or []} if s.name == "bulkOperation"
+                else [] if s.name == "userErrors" else None for s in f.selections or []}
+
+    @staticmethod
+    def _payload(f: Field, values: dict) -> dict:
+        out = {}
+        for s in f.selections or []:
+            v = values.get(s.name)
+            if isinstance(v, list) and s.selections:
+                v = [{x.alias: item.get(x.name) for x in s.selections} if isinstance(item, dict) else item for item in v]
+            out[s.alias] = v
+        return out
+
+    # -------------------------
+    # REST
+    # -------------------------
+    def rest_products_count(self, params: Dict[str, List[str]]) -> Tuple[int, dict, dict]:
+        with self.lock:
+            self._count("rest:products/count")
+            now = time.monotonic()
+            self._rest_used = max(0.0, self._rest_used - (now - self._rest_at) * self.rest_leak)
+            self._rest_at = now
+            if self._rest_used + 1 > self.rest_bucket:
+                self.stats["rest_429"] += 1
+                return 429, {"Retry-After": "1.0"}, {"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."}
+            self._rest_used += 1
+            headers = {"X-Shopify-Shop-Api-Call-Limit": f"{int(self._rest_used)}/{self.rest_bucket}"}
+
+            if "collection_id" in params:
+                try:
+                    cid = int(params["collection_id"][0])
+                except ValueError:
+                    return 400, headers, {"errors": "collection_id: invalid"}
+                count = len(self.catalog.collection_members(cid)) if self.catalog.collection_exists(cid) else 0
+            elif "vendor" in params:
+                count = len(self.catalog.product_range(f'vendor:"{params["vendor"][0]}"'))
+            else:
+                count = self.catalog.n
+            return 200, headers, {"count": count}
+
+    def stats_snapshot(self) -> dict:
+        with self.lock:
+            s = json.loads(json.dumps(self.stats))
+        s["requests_total"] = sum(s["requests"].values())
+        return s
+
+
+# =========================
+# HTTP
+# =========================
+def _make_handler(shop: MockShop, latency_ms: float, jitter_ms: float):
+    import random
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _delay(self) -> None:
+            if latency_ms or jitter_ms:
+                time.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000.0)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/__stats":
+                return self._send(200, shop.stats_snapshot())
+            m = re.match(r"^/__bulk/(\d+)\.jsonl$", url.path)
+            if m and 0 < int(m.group(1)) <= len(shop.bulk_results):
+                raw = shop.bulk_results[int(m.group(1)) - 1].encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/jsonl")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+                return
+            if re.match(r"^/admin/api/[^/]+/products/count\.json$", url.path):
+                self._delay()
+                status, headers, body = shop.rest_products_count(parse_qs(url.query))
+                return self._send(status, body, headers)
+            self._send(404, {"errors": "Not Found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if url.path == "/__reset":
+                with shop.lock:
+                    shop.reset_stats()
+                    shop.reset_throttle()
+                return self._send(200, {"ok": True})
+            m = re.match(r"^/admin/api/([^/]+)/graphql\.json$", url.path)
+            if m:
+                self._delay()
+                try:
+                    body = json.loads(raw.decode("utf-8") or "{}")
+                except ValueError:
+                    return self._send(400, {"errors": "Invalid JSON"})
+                try:
+                    result = shop.graphql(body, m.group(1))
+                except Exception as e:
+                    return self._send(500, {"errors": f"Mock server error: {type(e).__name__}: {e}"})
+                return self._send(200, result)
+            self._send(404, {"errors": "Not Found"})
+
+    return Handler
+
+
+class MockShopifyServer:
+    """Runs the mock in a background thread. url -> e.g. http://127.0.0.1:54321"""
+
+    def __init__(self, shop: MockShop, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.shop = shop
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(shop, latency_ms, jitter_ms))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+        shop.public_url = self.url
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockShopifyServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local mock of the Shopify Admin API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--products", default="10k", help="10k / 100k / 500k or a number")
+    ap.add_argument("--vendors", type=int, default=560)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--max-cost", type=float, default=1000.0, help="GraphQL bucket size")
+    ap.add_argument("--restore-rate", type=float, default=50.0, help="GraphQL cost points restored per second")
+    args = ap.parse_args()
+
+    n = SCENARIOS.get(args.products) or int(args.products)
+    shop = MockShop(SyntheticCatalog(n, vendors=args.vendors), max_cost=args.max_cost, restore_rate=args.restore_rate)
+    server = MockShopifyServer(shop, args.host, args.port, args.latency_ms, args.jitter_ms)
+    print(f"Mock Shopify Admin API on {server.url} ({n} products, {len(shop.catalog.collection_ids)} collections)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import json
 import os
 import time
-from retail_promotions_to_shopify_metafields import ShopifyClient, Config
+from promo_config import Config
+from shopify_client import ShopifyClient
 
 PROGRESS_FILE = "vendor_progress.json"
 
@@ -40,35 +41,34 @@ def main():
     vendor_counts = progress.get("vendor_counts", {})
     total_products = progress.get("total_products", 0)
 
-    has_next = True
     if cursor is None and progress.get("done"):
         print("Already completed. Unique vendors:", len(vendor_counts))
         return
 
     print("Resilient vendor count starting. Resuming cursor:", cursor)
 
-    while has_next:
+    done = False
+    while not done:
         try:
-            data = shop.graphql(QUERY, {"cursor": cursor})
-            conn = data["data"]["products"]
+            # the next page is fetched while this one is counted; a failure resumes from the saved cursor
+            for conn in shop.pages(QUERY, cursor=cursor):
+                for n in conn["nodes"]:
+                    total_products += 1
+                    v = (n.get("vendor") or "").strip()
+                    if v:
+                        vendor_counts[v] = vendor_counts.get(v, 0) + 1
 
-            for n in conn["nodes"]:
-                total_products += 1
-                v = (n.get("vendor") or "").strip()
-                if v:
-                    vendor_counts[v] = vendor_counts.get(v, 0) + 1
+                cursor = conn["pageInfo"]["endCursor"]
 
-            has_next = conn["pageInfo"]["hasNextPage"]
-            cursor = conn["pageInfo"]["endCursor"]
+                # Save progress after each page
+                save_progress({"cursor": cursor, "vendor_counts": vendor_counts, "total_products": total_products, "done": False})
 
-            # Save progress after each page
-            save_progress({"cursor": cursor, "vendor_counts": vendor_counts, "total_products": total_products, "done": False})
+                if total_products % 500 == 0:
+                    print(f"  Processed {total_products} products...")
 
-            if total_products % 500 == 0:
-                print(f"  Processed {total_products} products...")
-
-            # short pause to be polite
-            time.sleep(max(0.0, getattr(Config, "SLEEP_BETWEEN_CALLS", 0.12)))
+                # short pause to be polite
+                time.sleep(max(0.0, getattr(Config, "SLEEP_BETWEEN_CALLS", 0.12)))
+            done = True
 
         except Exception as e:
             print("Encountered error, sleeping and retrying:", str(e))
@@ -0,0 +1,81 @@
+import argparse
+import json
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from promo_config import Config  # noqa: E402
+from webhook_receiver import TOPICS, sign  # noqa: E402
+
+
+"""
+tools/send_webhook.py
+
+Send a signed, Shopify-shaped webhook to webhook_receiver.py (local testing).
+
+python tools/send_webhook.py products/update --id 7001 --vendor "Acme"
+python tools/send_webhook.py products/delete --id 7001
+python tools/send_webhook.py collections/update --id 4001 --title "Acme Sale"
+python tools/send_webhook.py products/update --payload product.json
+python tools/send_webhook.py products/update --id 7001 --bad-signature     (expects 401)
+"""
+
+
+def build_payload(topic: str, args) -> dict:
+    if args.payload:
+        with open(args.payload, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    if args.id is None:
+        raise SystemExit("--id or --payload is required")
+    kind = "Product" if topic.startswith("products/") else "Collection"
+    payload = {"id": args.id, "admin_graphql_api_id": f"gid://shopify/{kind}/{args.id}"}
+    if topic.endswith("/delete"):
+        return payload
+    payload["updated_at"] = args.updated_at or datetime.now(timezone.utc).isoformat(timespec="seconds")
+    if kind == "Product":
+        payload["vendor"] = args.vendor or ""
+        payload["title"] = args.title or ""
+    else:
+        payload["title"] = args.title or ""
+        payload["handle"] = args.handle or ""
+    return payload
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Send a signed test webhook")
+    ap.add_argument("topic", choices=TOPICS)
+    ap.add_argument("--id", type=int)
+    ap.add_argument("--vendor", default="")
+    ap.add_argument("--title", default="")
+    ap.add_argument("--handle", default="")
+    ap.add_argument("--updated-at", default="", help="ISO timestamp (default: now)")
+    ap.add_argument("--payload", default="", help="JSON file sent as is")
+    ap.add_argument("--url", default=f"http://127.0.0.1:{Config.WEBHOOK_PORT}/webhooks")
+    ap.add_argument("--secret", default=Config.SHOPIFY_WEBHOOK_SECRET)
+    ap.add_argument("--shop", default=Config.SHOPIFY_SHOP, help="X-Shopify-Shop-Domain")
+    ap.add_argument("--bad-signature", action="store_true", help="sign with a wrong secret")
+    args = ap.parse_args(argv)
+
+    body = json.dumps(build_payload(args.topic, args)).encode("utf-8")
+    secret = args.secret + "-wrong" if args.bad_signature else args.secret
+    headers = {
+        "Content-Type": "application/json",
+        "X-Shopify-Topic": args.topic,
+        "X-Shopify-Hmac-Sha256": sign(secret, body),
+        "X-Shopify-Shop-Domain": args.shop,
+        "X-Shopify-Webhook-Id": str(uuid.uuid4()),
+        "X-Shopify-API-Version": Config.SHOPIFY_API_VERSION,
+    }
+    resp = requests.post(args.url, data=body, headers=headers, timeout=10)
+    print(f"{resp.status_code} {resp.text}")
+    return 0 if resp.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
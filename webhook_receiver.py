@@ -0,0 +1,342 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from promo_config import Config, PROMO_METAFIELD_KEYS, ShopTarget, shop_path, shop_targets
+from product_ids import product_gid
+
+
+"""
+webhook_receiver.py
+
+Small HTTP service that keeps the catalog mirror (CATALOG_MIRROR) current from Shopify
+webhooks, so the sync and the reports can read membership / vendors from the mirror
+(CATALOG_MIRROR_REFRESH=0) without paging the catalog first.
+
+Topics (subscribe them to http(s)://<host>:<WEBHOOK_PORT>/webhooks, JSON format):
+- products/create, products/update   upsert vendor / updatedAt / promo metafields / collections
+- products/delete                    drop the product and its membership
+- collections/create, collections/update   title / handle, and the collection's member list
+- collections/delete                 drop the collection and its membership
+
+Every request must carry a valid X-Shopify-Hmac-Sha256 (base64 HMAC-SHA256 of the raw body
+with the app's client secret, SHOPIFY_WEBHOOK_SECRET); anything else gets 401.
+
+The handler only verifies and queues, and answers 200 right away (Shopify expects a reply
+within a few seconds); one worker thread applies events in arrival order to one
+CatalogMirror per shop (SHOPIFY_SHOPS: X-Shopify-Shop-Domain picks the shop). Redelivered
+webhooks (same X-Shopify-Webhook-Id) and product events older than what the mirror has
+(updated_at) are skipped.
+
+Product webhooks carry no collection membership, so with WEBHOOK_FETCH_MEMBERSHIP=1
+(default) the worker looks the product (or, for collection events, the collection's
+product list) up in the Admin API. WEBHOOK_FETCH_MEMBERSHIP=0 applies the payload only:
+vendor, updated_at and metafields (if the subscription includes the custom namespace);
+membership then stays as last refreshed.
+
+GET /health returns counters as JSON.
+
+python webhook_receiver.py [--host 0.0.0.0] [--port 8787]
+Test locally with tools/send_webhook.py.
+"""
+
+
+TOPICS = (
+    "products/create", "products/update", "products/delete",
+    "collections/create", "collections/update", "collections/delete",
+)
+
+# X-Shopify-Webhook-Id values remembered for redelivery detection
+RECENT_WEBHOOK_IDS = 10000
+
+
+def sign(secret: str, body: bytes) -> str:
+    """X-Shopify-Hmac-Sha256 value for a body."""
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+
+
+def verify_hmac(secret: str, body: bytes, header: Optional[str]) -> bool:
+    if not secret or not header:
+        return False
+    return hmac.compare_digest(sign(secret, body), header.strip())
+
+
+def to_utc(ts: Optional[str]) -> str:
+    """REST webhook timestamps ("2026-01-31T01:02:03-05:00") -> GraphQL style UTC ("2026-01-31T06:02:03Z")."""
+    if not ts:
+        return ""
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return ts
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@dataclass
+class WebhookEvent:
+    topic: str
+    target: ShopTarget
+    webhook_id: str
+    payload: dict
+
+
+class WebhookApplier:
+    """Applies queued events to the catalog mirrors, on one worker thread."""
+
+    def __init__(self, fetch_membership: bool = True):
+        self.fetch_membership = fetch_membership
+        self.events: "queue.Queue[Optional[WebhookEvent]]" = queue.Queue()
+        self.stats: Dict[str, int] = {"received": 0, "applied": 0, "stale": 0, "duplicates": 0,
+                                      "failed": 0, "rejected_hmac": 0, "ignored": 0}
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        # owned by the worker thread (sqlite connections are per thread)
+        self._mirrors = {}
+        self._clients = {}
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def stats_snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["queued"] = self.events.qsize()
+        return stats
+
+    def submit(self, event: WebhookEvent) -> bool:
+        """False if the webhook id was seen before (Shopify redelivery)."""
+        with self._lock:
+            self.stats["received"] += 1
+            if event.webhook_id:
+                if event.webhook_id in self._recent:
+                    self.stats["duplicates"] += 1
+                    return False
+                self._recent[event.webhook_id] = None
+                while len(self._recent) > RECENT_WEBHOOK_IDS:
+                    self._recent.popitem(last=False)
+        self.events.put(event)
+        return True
+
+    def start(self) -> "WebhookApplier":
+        self._thread = threading.Thread(target=self._run, name="webhook-applier", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.events.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def wait_idle(self, timeout: float = 10.0) -> None:
+        """Block until every queued event is applied (tests / tools)."""
+        deadline = time.monotonic() + timeout
+        while self.events.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self) -> None:
+        while True:
+            event = self.events.get()
+            try:
+                if event is None:
+                    break
+                try:
+                    result = self.apply(event)
+                    self.count(result)
+                    print(f"{event.topic} {event.payload.get('id')} ({event.target.name or event.target.shop}): {result}")
+                except Exception as e:
+                    self.count("failed")
+                    print(f"{event.topic} {event.payload.get('id')}: FAILED {type(e).__name__}: {e}")
+            finally:
+                self.events.task_done()
+        for mirror in self._mirrors.values():
+            mirror.close()
+
+    def _mirror(self, target: ShopTarget):
+        from catalog_mirror import CatalogMirror
+        if target.name not in self._mirrors:
+            mirror = CatalogMirror(shop_path(Config.CATALOG_MIRROR, target))
+            # readers (sync, reports) keep reading while webhooks are written
+            mirror.conn.execute("PRAGMA journal_mode=WAL")
+            self._mirrors[target.name] = mirror
+        return self._mirrors[target.name]
+
+    def _client(self, target: ShopTarget):
+        from shopify_client import ShopifyClient
+        if target.name not in self._clients:
+            self._clients[target.name] = ShopifyClient(target)
+        client = self._clients[target.name]
+        # every lookup must see the current state, not this client's read cache
+        client.clear_cache()
+        return client
+
+    def apply(self, event: WebhookEvent) -> str:
+        """Returns the stats bucket: applied / stale / ignored."""
+        from catalog_mirror import collection_gid
+        from catalog_snapshot import fetch_snapshot_product
+
+        mirror = self._mirror(event.target)
+        p = event.payload
+        topic = event.topic
+
+        if topic.startswith("products/"):
+            gid = p.get("admin_graphql_api_id") or product_gid(int(p["id"]))
+            if topic == "products/delete":
+                mirror.delete_products([int(p["id"])])
+            else:
+                updated_at = to_utc(p.get("updated_at"))
+                known = mirror.product_updated_at(gid)
+                if known and updated_at and updated_at < known:
+                    return "stale"
+                if self.fetch_membership:
+                    product = fetch_snapshot_product(self._client(event.target), gid, Config.MF_NAMESPACE,
+                                                     set(PROMO_METAFIELD_KEYS))
+                    if product is None:
+                        # deleted since the webhook was sent
+                        mirror.delete_products([int(p["id"])])
+                else:
+                    product = {"id": gid, "vendor": (p.get("vendor") or "").strip(), "updated_at": updated_at}
+                    if "metafields" in p:
+                        product["metafields"] = {
+                            m["key"]: m.get("value") for m in p.get("metafields") or []
+                            if m.get("namespace") == Config.MF_NAMESPACE and m.get("key") in PROMO_METAFIELD_KEYS
+                        }
+                if product is not None:
+                    mirror.upsert_products([product])
+
+        elif topic.startswith("collections/"):
+            gid = p.get("admin_graphql_api_id") or collection_gid(int(p["id"]))
+            if topic == "collections/delete":
+                mirror.delete_collection(gid)
+            else:
+                with mirror.conn:
+                    mirror.upsert_collections([{"id": gid, "title": p.get("title") or "", "handle": p.get("handle") or "",
+                                                "updatedAt": to_utc(p.get("updated_at"))}])
+                if self.fetch_membership:
+                    mirror.replace_collection_members(gid, self._client(event.target).list_product_ids_in_collection(gid))
+        else:
+            return "ignored"
+
+        mirror.mark_webhook_applied(topic, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        return "applied"
+
+
+def _make_handler(applier: WebhookApplier, targets: Dict[str, ShopTarget]):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, body: dict) -> None:
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/health":
+                return self._send(200, applier.stats_snapshot())
+            self._send(404, {"error": "Not Found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if self.path.split("?")[0] != "/webhooks":
+                return self._send(404, {"error": "Not Found"})
+
+            domain = (self.headers.get("X-Shopify-Shop-Domain") or "").strip().lower()
+            # single-shop setup: whatever domain the (mock / test) sender uses
+            target = targets.get(domain) or (next(iter(targets.values())) if len(targets) == 1 else None)
+            if target is None:
+                applier.count("ignored")
+                return self._send(200, {"ignored": f"unknown shop {domain}"})
+            if not verify_hmac(target.webhook_secret, raw, self.headers.get("X-Shopify-Hmac-Sha256")):
+                applier.count("rejected_hmac")
+                return self._send(401, {"error": "invalid HMAC"})
+
+            topic = (self.headers.get("X-Shopify-Topic") or "").strip()
+            if topic not in TOPICS:
+                applier.count("ignored")
+                return self._send(200, {"ignored": topic})
+            try:
+                payload = json.loads(raw.decode("utf-8"))
+                if "id" not in payload:
+                    raise ValueError("payload has no id")
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+
+            queued = applier.submit(WebhookEvent(topic, target, self.headers.get("X-Shopify-Webhook-Id") or "", payload))
+            self._send(200, {"queued": queued})
+
+    return Handler
+
+
+class WebhookServer:
+    """Receiver + applier. url -> e.g. http://127.0.0.1:8787"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8787, fetch_membership: Optional[bool] = None):
+        if not Config.CATALOG_MIRROR:
+            raise ValueError("webhook_receiver.py needs CATALOG_MIRROR (the SQLite mirror it keeps current).")
+        targets = {t.shop.lower(): t for t in shop_targets()}
+        for t in targets.values():
+            if not t.webhook_secret:
+                raise ValueError(f"Missing webhook secret for {t.name or t.shop} (SHOPIFY_WEBHOOK_SECRET).")
+        self.applier = WebhookApplier(Config.WEBHOOK_FETCH_MEMBERSHIP if fetch_membership is None else fetch_membership)
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.applier, targets))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "WebhookServer":
+        self.applier.start()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.applier.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Shopify webhook receiver that keeps the catalog mirror current")
+    ap.add_argument("--host", default=Config.WEBHOOK_HOST)
+    ap.add_argument("--port", type=int, default=Config.WEBHOOK_PORT)
+    args = ap.parse_args()
+
+    server = WebhookServer(args.host, args.port)
+    server.applier.start()
+    print(f"Webhook receiver on {server.url}/webhooks -> {Config.CATALOG_MIRROR} "
+          f"(fetch membership: {server.applier.fetch_membership})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        server.applier.stop()
+
+
+if __name__ == "__main__":
+    main()